@@ -1,5 +1,8 @@
 """
 This is a test script for svarog_ctl. It's useful for developers only.
+
+It needs rotctld listening on port 4533. If you don't have one, use the simulator:
+python -m svarog_ctl.simulator
 """
 
 
@@ -2,149 +2,137 @@
 This is the main runner script for svarog_ctl.
 """
 
-import time
+from __future__ import annotations
 
 import argparse
+import signal
 import sys
 import logging
-from datetime import datetime, timedelta, timezone
-from dateutil import parser as dateparser
-from dateutil import tz
-from orbit_predictor.predictors.base import CartesianPredictor
-from orbit_predictor.locations import Location
-from orbit_predictor.sources import get_predictor_from_tle_lines
-from svarog_ctl import orbitdb, utils, passes, rotctld
+import time
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING
+from svarog_ctl import scheduler, utils
+from svarog_ctl.configuration import open_config, setup_logging
 from svarog_ctl.globalvars import APP_NAME, VERSION
 
-def get_pass(pred: CartesianPredictor, loc: Location, aos: datetime, los: datetime):
-    """Returns position list for specified satellite (identified by predictor) for
-       specified location, between AOS (start time) and LOS (end time).
-       For the time being we're using time ticks algorithm with 30 seconds interval
-       and no smoothing."""
-
-    return passes.get_pass(pred, loc, aos, los, passes.PassAlgo.TIME_TICKS, 5)
-
-def get_fake_pass(steps: int, start_az: int, end_az: int):
-    """Returns fake positions list. Useful for testing. The timing is always now..now+2 minutes.
-
-       Parameters
-       ==========
-       steps - how many steps
-       start_az - starting azimuth
-       end_az - ending azimuth"""
-    pos = []
-    delta = (end_az - start_az) / (steps-1)
-    for x in range(steps):
-        pos.append([datetime.now() + timedelta(seconds=x), start_az + delta*x, 5.0])
-
-    pos.append([datetime.now() + timedelta(seconds=120), 0, 0])
-
-    return pos
+# orbit_predictor, numpy, requests and dateutil take a few hundred milliseconds to import, so
+# they're imported by the functions that need them. --version, --help and mistyped options
+# don't wait for them.
+if TYPE_CHECKING:
+    from dateutil import tz
+    from orbit_predictor.locations import Location
+    from svarog_ctl import passes
 
 def get_timestamp_str(timestamp: datetime, tz_info: tz.tz) -> str:
     """Returns a string representation of a timestamp in the specified timezone."""
     return f"{timestamp.astimezone(tz_info)} {timestamp.astimezone(tz_info).tzname()}"
 
-def log_details(loc: Location, args: argparse.Namespace, when: datetime, pass_,
-               zone: tz.tz):
+def log_details(loc: Location, args: argparse.Namespace, when: datetime,
+                pass_: passes.PlannedPass, zone: tz.tz):
     """Print the details of parameters used. Mostly for developer's convenience."""
     logging.info("Observer loc.: %s", utils.coords(loc.latitude_deg, loc.longitude_deg))
     logging.info("After time   : %s", get_timestamp_str(when, zone))
     logging.info("Next AOS     : %s", get_timestamp_str(pass_.aos, zone))
     logging.info("Next LOS     : %s", get_timestamp_str(pass_.los, zone))
-    logging.info("Max elevation: %.1f deg at %s", pass_.max_elevation_deg,
-        str(pass_.max_elevation_date.astimezone(zone)))
-    logging.info("Duration     : %s", timedelta(seconds=pass_.duration_s))
+    logging.info("Max elevation: %.1f deg at %s", pass_.max_elevation,
+        str(pass_.max_elevation_time.astimezone(zone)))
+    logging.info("Duration     : %s", pass_.los - pass_.aos)
 
     logging.debug(args)
 
-def print_pos(positions: list):
-    """Prints the positions list. Useful for debugging."""
-    print(f"---positions has {len(positions)} entries")
-    for x in positions:
-        print(f"utc={x[0]}, local={x[0].astimezone()}: az={x[1]:3.1f}, el={x[2]:03.1f}")
-
-def rewind_positions(positions: list) -> list:
-    """This function rewinds (shifts positions) in time in a way that the pass will start now.
-       This is useful for testing, because usually the sat pass is in the future and we want to run
-       the experiments or tests now. Looking at it from a different perspective, this is a good
-       way to test future pass in advance (or replay old pass).
-
-       Parameters
-       ==========
-       positions - list of positions (tuples of 3 elements: timestamp, azimuth, elevation)
-       returns - modified list of positions (tuples of 3 elements: timestamp, azimuth, elevation)
-    """
-
-    delta = positions[0][0] - datetime.now(timezone.utc)
-    return list(map(lambda x: [x[0]-delta,x[1],x[2]], positions))
-
-def track_positions(positions: list, rotator: rotctld.Rotctld, delta: int):
-    """This function sends commands to the rotator and tracks its position.
-
-       Parameters
-       ==========
-       positions - list of positions (tuples of 3 elements: timestamp, azimuth, elevation)
-       rotator - an instance of open connection to the rotator
-       delta - step time in seconds (the loop will get the rotator position every delta seconds)
-
-       returns a list of actual rotator positions over time (list of 3 elements tuples:
-       timestamp, azimuth, elevation)
-    """
-
-    actual = [] # actual rotator positions
-
-    timeout = positions[-1][0] # The last entry specifies the last position and also
-                               # when to stop movement
-
-    # get the first command
-    index = 0
-    pos = positions[index]
-
-    while datetime.now(timezone.utc) < timeout:
-        actual_az, actual_el = rotator.get_pos()
-        actual.append([datetime.now(timezone.utc), actual_az, actual_el])
-        logging.debug("%s: az=%s, el=%s, the next command @ %s (in %s)",
-                      datetime.now(), actual_az, actual_el, pos[0], pos[0] - datetime.now())
-
-        if pos[0] <= datetime.now(timezone.utc):
-
-            # normalize azimuth to -180;180, as this is what most rotctl rotators require.
-            if pos[1]>180.0:
-                pos[1] = pos[1] - 360.0
-
-            # Ok, it's time to execute the next command
-            logging.info("%s: sending command to move to az=%.1f, el=%.1f",
-                         datetime.now(), pos[1], pos[2])
-
-            status, resp = rotator.set_pos(pos[1], pos[2])
-            if not status:
-                logging.warning("set_pos command failed. response=%s", resp)
-            index = index + 1
-            # If we gotten to the end of the list of commands, we're done here.
-            if index>len(positions):
-                return actual
-            pos = positions[index]
-
-        time.sleep(delta)
-
-    return actual
-
-def plot_charts(_intended: list, _actual: list):
-    """To be implemented: generate charts based on two series of data:
-       1. the intended antenna position over time (commands we're sending),
-       2. the actual antenna position (as checked using get_pos command).
-    """
-    # Charting not implemented yet.
+def print_visible(visible, zone: tz.tz):
+    """Prints the satellites returned by OrbitDatabase.get_visible()."""
+    print(f"---{len(visible)} satellites visible")
+    for x in visible:
+        when = x['time'].item().replace(tzinfo=timezone.utc)
+        print(f"{x['norad']:6d} {x['name'].decode('utf-8'):24s} az={x['az']:5.1f}, "
+              f"el={x['el']:4.1f}, range={x['range']:6.0f}km @ {get_timestamp_str(when, zone)}")
+
+def get_schedule_sats(args: argparse.Namespace, cfg: dict) -> list:
+    """Returns list of NORAD IDs to schedule, from --sats or from the config file."""
+    if args.sats:
+        return [int(x) for x in args.sats.split(",") if x.strip()]
+    sats = [int(x) for x in cfg.get('norad') or [] if str(x).strip().isdigit()]
+    if not sats:
+        print("ERROR: No sats to schedule. Use --sats or list NORAD IDs in the config file.")
+        sys.exit(1)
+    return sats
+
+def print_schedule(args: argparse.Namespace):
+    """Plans passes of multiple sats for the next few days and prints the timeline."""
+    # pylint: disable=import-outside-toplevel,too-many-locals
+    from dateutil import parser as dateparser
+    from dateutil import tz
+    from orbit_predictor.locations import Location
+    from svarog_ctl import orbitdb
+
+    cfg = open_config()
+    sats = get_schedule_sats(args, cfg)
+    min_el = args.min_el if args.min_el is not None else cfg.get('max_elevation_greater_than', 0)
+
+    db = orbitdb.OrbitDatabase()
+    db.refresh_urls()
+    missing = [norad for norad in sats if norad not in db.tle_norad]
+    for norad in missing:
+        logging.warning("No orbital data for sat %d, skipped", norad)
+        print(f"WARNING: No orbital data for sat {norad}, skipped.", file=sys.stderr)
+    sats = [norad for norad in sats if norad not in missing]
+    if not sats:
+        print("ERROR: No orbital data for any of the sats.")
+        sys.exit(1)
+    tles = [db.get_norad(norad) for norad in sats]
+
+    loc = Location('Observer', args.lat, args.lon, args.alt)
+    all_passes = scheduler.compute_passes(tles, loc, dateparser.parse(args.time), args.schedule,
+                                          min_elevation=min_el)
+
+    # The sats listed first are the most important ones.
+    priorities = {norad: len(sats) - i for i, norad in enumerate(sats)}
+    selected, skipped = scheduler.resolve_conflicts(all_passes, args.policy, priorities,
+                                                    rate=args.slew_rate)
+    print(f"---{len(selected)} passes scheduled, {len(skipped)} skipped")
+    print(scheduler.format_timeline(selected, skipped,
+                                    timezone.utc if not args.local_tz else tz.tzlocal()))
+
+def run_daemon(args: argparse.Namespace):
+    """Tracks the passes of multiple sats until terminated."""
+    # pylint: disable=import-outside-toplevel
+    from orbit_predictor.locations import Location
+    from svarog_ctl import daemon, orbitdb, rotctld, trajectory
+
+    cfg = open_config()
+    sats = get_schedule_sats(args, cfg)
+    min_el = args.min_el if args.min_el is not None else cfg.get('max_elevation_greater_than', 0)
+
+    db = orbitdb.OrbitDatabase()
+    db.refresh_urls()
+
+    limits = trajectory.RotatorLimits(args.az_range[0], args.az_range[1],
+                                      el_max=180.0 if args.flip else 90.0,
+                                      az_rate=args.slew_rate, el_rate=args.slew_rate)
+    ctl = rotctld.Rotctld(args.host, args.port, 1, az_min=limits.az_min, az_max=limits.az_max,
+                          el_max=limits.el_max)
+    loc = Location('Observer', args.lat, args.lon, args.alt)
+    svc = daemon.Daemon(db, loc, ctl, sats, limits, min_el, args.policy, args.slew_rate,
+                        socket_path=args.socket or daemon.default_socket_path(),
+                        closed_loop=args.closed_loop)
+
+    signal.signal(signal.SIGTERM, lambda *_: svc.stop())
+    try:
+        svc.run()
+    except KeyboardInterrupt:
+        svc.stop()
+    ctl.close()
 
 def get_norad(tle: list) -> int:
     """Gets norad id from the TLE data."""
+    from svarog_ctl.tle import satnum_from_str # pylint: disable=import-outside-toplevel
     _, line2 = tle
-    return int(line2.split(" ")[1])
+    return satnum_from_str(line2[2:7])
 
 def main():
     """Parses command-line options and executes the satellite tracking routine."""
-    # pylint: disable=too-many-locals,too-many-statements
+    # pylint: disable=too-many-locals,too-many-statements,too-many-branches
     parser = argparse.ArgumentParser(
         description="svarog-ctl: tracks satellite pass with rotator"
     )
@@ -171,6 +159,16 @@ def main():
         help="Specify how to connect (which hostname to use) to a running rotctld.")
     parser.add_argument("--port", default=4533, type=int,
         help="Specify which port to connect to")
+    parser.add_argument("--az-range", dest='az_range', nargs=2, type=float,
+        default=[-180.0, 180.0], metavar=("MIN", "MAX"),
+        help="Azimuth range of the rotator, e.g. 0 450 for rotators with overlap "
+             "(default: -180 180)")
+    parser.add_argument("--flip", dest='flip', action='store_const', const=True, default=False,
+        help="The rotator can move elevation up to 180 degrees (flip)")
+
+    parser.add_argument("--closed-loop", dest='closed_loop', action='store_true',
+        help="Correct the commands using the antenna position reported by the rotator (aim "
+             "ahead by the learned lag of the rotator, compensate its offset)")
 
     parser.add_argument("--now", dest='now', action='store_const', const=True, default=False,
         help="Don't wait for the actual pass, start now (useful for testing only)")
@@ -178,10 +176,68 @@ def main():
     parser.add_argument("--local", dest='local_tz', action='store_const', const=True, default=False,
         help="Use the local time zone, instead of the default UTC")
 
+    parser.add_argument("--visible", dest='visible', action='store_const', const=True,
+        default=False, help="List all satellites above the horizon at the specified time and exit")
+    parser.add_argument("--min-el", dest='min_el', default=None, type=float,
+        help="Elevation mask for --visible, in degrees (default: 0). For --schedule, passes "
+             "lower than that are ignored (default: max_elevation_greater_than from config)")
+
+    parser.add_argument("--schedule", type=float, metavar="DAYS",
+        help="Plan passes of multiple sats (see --sats) for the next DAYS days and exit")
+    parser.add_argument("--sats", type=str,
+        help="Comma separated list of NORAD IDs for --schedule, the most important first "
+             "(default: norad list from config)")
+    parser.add_argument("--policy", default=scheduler.POLICY_MAX_ELEVATION,
+        choices=scheduler.POLICIES,
+        help="How to pick between overlapping passes: the higher pass, or the sat listed first")
+    parser.add_argument("--slew-rate", dest='slew_rate', default=scheduler.SLEW_RATE, type=float,
+        help="Rotator speed in degrees per second")
+
+    parser.add_argument("--daemon", action="store_true",
+        help="Keep running and track the passes of multiple sats (see --sats) one after another. "
+             "The sats can be changed at runtime with: python -m svarog_ctl.daemon")
+    parser.add_argument("--socket", type=str,
+        help="Control socket for --daemon (default: svarog-ctl.sock in the datadir)")
+
+    parser.add_argument("--dry-run", dest='dry_run', action="store_true",
+        help="Plan the pass and write the rotator commands (see --output) instead of "
+             "connecting to rotctld")
+    parser.add_argument("--output", "-o", default="-", type=str,
+        help="File for --dry-run (default: stdout)")
+    parser.add_argument("--format", choices=("csv", "jsonl", "npy"),
+        help="Format of the --dry-run output (default: guessed from the --output extension, "
+             "csv otherwise)")
+
     parser.add_argument("--version", action="version", version=f"{APP_NAME} {VERSION}")
 
     args = parser.parse_args()
 
+    # pylint: disable=import-outside-toplevel
+    from dateutil import parser as dateparser
+    from dateutil import tz
+    from orbit_predictor.locations import Location
+    from orbit_predictor.sources import get_predictor_from_tle_lines
+    from svarog_ctl import orbitdb, passdb, passes, rotctld, stream, telemetry, tracking, trajectory
+    from svarog_ctl.tle import Tle
+
+    setup_logging()
+
+    if args.visible:
+        db = orbitdb.OrbitDatabase()
+        db.refresh_urls()
+        loc = Location('Observer', args.lat, args.lon, args.alt)
+        visible = db.get_visible(loc, dateparser.parse(args.time), min_elevation=args.min_el or 0)
+        print_visible(visible, timezone.utc if not args.local_tz else tz.tzlocal())
+        return
+
+    if args.schedule:
+        print_schedule(args)
+        return
+
+    if args.daemon:
+        run_daemon(args)
+        return
+
     # Sanity checks
     if (args.tle1 and not args.tle2) or (not args.tle1 and args.tle2):
         print("ERROR: You must either specify both TLE lines or none.")
@@ -195,14 +251,16 @@ def main():
         sys.exit(1)
 
 
+    when = dateparser.parse(args.time)
+
     # First step is to get the orbit predictor. There are two options here.
     name = None
     if args.tle1:
         # If TLE is specified explicitly, we don't need to load any databases, just use
         # the TLE as is.
         name = "CUSTOM"
-        tle_lines = (args.tle1, args.tle2)
-        pred = get_predictor_from_tle_lines(tle_lines)
+        sat_tle = Tle(args.tle1, args.tle2, name)
+        pred = get_predictor_from_tle_lines((args.tle1, args.tle2))
     else:
         # If sat was referenced by name or Norad ID, we need to load the database and
         # see if we can find the sat.
@@ -215,14 +273,15 @@ def main():
         elif args.sat is not None:
             name = args.sat
         logging.debug("Looking for satellite %s", name)
-        pred = db.get_predictor(name)
+        # Use the TLE from around the time of the pass, in case it's an old one being replayed.
+        sat_tle = db.get_tle(name, when=when)
+        pred = db.get_predictor(name, when=when)
 
     # Need to extract norad id
     satid = get_norad(pred.tle.lines)
 
     # Get the timezone
     target_tz = timezone.utc if not args.local_tz else tz.tzlocal()
-    when = dateparser.parse(args.time)
 
     logging.info("Calculating pass after time: utc=%s localtz=%s",
                  when.astimezone(timezone.utc), when.astimezone(tz.tzlocal()))
@@ -231,35 +290,93 @@ def main():
 
     loc = Location('Observer', args.lat, args.lon, args.alt)
 
-    pass_ = pred.get_next_pass(loc, when_utc=when)
+    # Passes are calculated a couple days ahead and stored, so when svarog-ctl is run
+    # repeatedly (e.g. from cron), this is usually just a database lookup.
+    pass_db = passdb.PassDatabase(passdb.default_path())
+    pass_ = pass_db.get_next_pass(sat_tle, loc, when)
+    pass_db.close()
+    if pass_ is None:
+        # Beyond the cached days (--time far ahead, or a sat that rarely flies over).
+        logging.info("No pass of %s in the next %d days, searching further", name,
+                     passdb.CACHE_DAYS)
+        pass_ = passes.find_next_pass(pred, loc, when, norad=satid, name=name)
+    if pass_ is None:
+        print(f"ERROR: No pass of {name} in the next {passes.SEARCH_DAYS} days.")
+        sys.exit(1)
 
     log_details(loc, args, when, pass_, target_tz)
 
-    positions = get_pass(pred, loc, pass_.aos, pass_.los)
-
-    # Uncomment this for azimuth debugging
-    # positions = get_fake_pass(10, 30, -30) # generate from 3 to 200 degrees, in 10 steps
-    # print_pos(positions)
+    # Map the positions into the rotator's range, so it doesn't need to swing around in the middle
+    # of the pass, and start moving to the starting point before AOS. The pass is planned on
+    # its preview, the commands are propagated as the pass unfolds (see svarog_ctl.stream).
+    limits = trajectory.RotatorLimits(args.az_range[0], args.az_range[1],
+                                      el_max=180.0 if args.flip else 90.0,
+                                      az_rate=args.slew_rate, el_rate=args.slew_rate)
+    planning_start = time.perf_counter()
+    traj = stream.plan_pass(pred, loc, pass_.aos, pass_.los, limits)
+    planning_time = time.perf_counter() - planning_start
+    logging.info("Trajectory   : flip %s, %d wraps, %d points not reachable in time",
+                 "used" if traj.flipped else "not used", traj.wraps, len(traj.unreachable))
+    if traj.wraps:
+        logging.warning("The pass doesn't fit into the rotator's azimuth range (%.0f..%.0f), "
+                        "the rotator will have to turn around mid-pass", limits.az_min,
+                        limits.az_max)
+    preview = traj.positions
+    positions = stream.stream_pass(pred, loc, pass_.aos, pass_.los, limits, traj)
 
     # If specified, rewind in time so the positions start immediately.
+    pass_aos = pass_.aos
     if args.now:
-        positions = rewind_positions(positions)
-
-    print_pos(positions)
+        delta = preview[0][0] - datetime.now(timezone.utc)
+        pass_aos -= delta
+        preview = list(stream.shift(preview, delta))
+        positions = stream.shift(positions, delta)
+
+    if args.dry_run:
+        from svarog_ctl import export
+        try:
+            count = export.export_plan(positions, args.output, args.format, satid, pass_aos)
+        except ValueError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(1)
+        logging.info("Dry run      : %d commands written to %s, planned in %.1fms, "
+                     "%.1fms in total", count, "stdout" if args.output == "-" else args.output,
+                     planning_time * 1000, (time.perf_counter() - planning_start) * 1000)
+        return
 
     logging.info("Connecting to %s, port %d", args.host, args.port)
 
-    ctl = rotctld.Rotctld(args.host, args.port, 1)
+    ctl = rotctld.Rotctld(args.host, args.port, 1, az_min=limits.az_min, az_max=limits.az_max,
+                          el_max=limits.el_max)
     try:
         ctl.connect()
-    except ConnectionRefusedError as e:
+    except OSError as e:
         logging.critical("Failed to connect to rotctld: %s", str(e))
         sys.exit(-1)
 
-    antenna_pos = track_positions(positions, ctl, 3)
-
-    plot_charts(positions, antenna_pos)
-
+    telemetry_dir = telemetry.pass_directory(pass_.norad, pass_.aos)
+    loop = tracking.ClosedLoop(limits=limits) if args.closed_loop else None
+    with telemetry.TelemetryRecorder(telemetry_dir) as recorder:
+        result = tracking.track(stream.prefetch(positions), ctl, tracking.POLL_INTERVAL,
+                                recorder=recorder, loop=loop)
+    timing = result.timing()
+    logging.info("Timing       : %d commands sent, %.1fms late on average, %.1fms at most",
+                 timing.count, timing.mean * 1000, timing.max * 1000)
+    if loop is not None:
+        logging.info("Closed loop  : rotator lag %.1fs, offset az %.2f, el %.2f deg",
+                     loop.lag, loop.offset[0], loop.offset[1])
+
+    # Pre-positioning (the first command, see trajectory.plan) is not a part of the tracking
+    # accuracy.
+    aos = preview[1][0].timestamp() if len(preview) > 1 else None
+    summary = telemetry.summarize(telemetry.load(telemetry_dir), aos)
+    logging.info("Accuracy     : %s", telemetry.format_summary(summary))
+    chart = telemetry.plot_charts(telemetry_dir, aos)
+    logging.info("Telemetry    : %s%s", telemetry_dir, f", charts in {chart}" if chart else "")
+
+    stats = ctl.stats()
+    logging.info("Connection   : %d reconnects, %d failed commands, %.1fs down", stats.connects - 1,
+                 stats.failed_commands, stats.downtime)
     ctl.close()
 
     logging.debug("Exiting main after completing tracking")
@@ -0,0 +1,121 @@
+"""
+TleArchive keeps the history of orbital data: every distinct TLE (i.e. distinct epoch) ever
+seen for every satellite.
+
+Each refresh of the TLE sources overwrites the downloaded files, so without the archive only
+the latest TLE of every sat is known. That's fine for upcoming passes, but replaying old passes
+requires orbital data from around that time. The archive is stored in the datadir/tle/history
+directory, one append-only file per satellite (<norad>.tle, plain TLE format), plus a small
+index with the latest archived epoch of every satellite, so duplicates can be dropped quickly
+when new data is ingested.
+"""
+
+import bisect
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from svarog_ctl.tle import Tle, iter_tles
+
+INDEX_FILE = "index.npy"
+
+class TleArchive:
+    """Append-only archive of TLEs, indexed by NORAD ID and epoch."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+
+        # NORAD ID => latest archived epoch. Loaded on first use.
+        self._latest: Optional[Dict[int, datetime]] = None
+
+        # NORAD ID => (sorted epochs, TLEs in the same order). Loaded on first use.
+        self._history: Dict[int, Tuple[List[datetime], List[Tle]]] = {}
+
+    def _sat_path(self, norad: int) -> str:
+        return os.path.join(self.path, f"{norad}.tle")
+
+    def _load_index(self) -> Dict[int, datetime]:
+        if self._latest is None:
+            self._latest = {}
+            try:
+                index = np.load(os.path.join(self.path, INDEX_FILE))
+                for norad, epoch in zip(index['norad'].tolist(), index['epoch'].tolist()):
+                    self._latest[norad] = epoch.replace(tzinfo=timezone.utc)
+            except (OSError, ValueError) as e:
+                logging.debug("No TLE archive index loaded from %s: %s", self.path, e)
+        return self._latest
+
+    def _save_index(self):
+        latest = self._load_index()
+        index = np.empty(len(latest), dtype=[('norad', np.int32), ('epoch', 'datetime64[us]')])
+        index['norad'] = list(latest.keys())
+        index['epoch'] = [epoch.replace(tzinfo=None) for epoch in latest.values()]
+
+        path = os.path.join(self.path, INDEX_FILE)
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, index)
+        os.replace(path + ".tmp", path)
+
+    def add(self, tles: Iterable[Tle]) -> int:
+        """Adds TLEs to the archive. TLEs with epochs that are already archived are skipped.
+           Returns the number of TLEs actually added."""
+        latest = self._load_index()
+        added = 0
+        for t in tles:
+            last = latest.get(t.norad)
+            if last is not None and t.epoch <= last:
+                # Almost always this is the very same TLE as the last time. Only if it's an
+                # older one, the whole history of this sat needs to be checked.
+                if t.epoch == last or t.epoch in self._load_history(t.norad)[0]:
+                    continue
+
+            with open(self._sat_path(t.norad), "a", encoding="utf-8") as f:
+                f.write(str(t) + "\n")
+            added += 1
+            if last is None or t.epoch > last:
+                latest[t.norad] = t.epoch
+            self._history.pop(t.norad, None)
+
+        if added:
+            self._save_index()
+            logging.info("Archived %d new TLEs in %s", added, self.path)
+        return added
+
+    def _load_history(self, norad: int) -> Tuple[List[datetime], List[Tle]]:
+        if norad not in self._history:
+            tles = {}
+            try:
+                with open(self._sat_path(norad), encoding="utf-8") as f:
+                    for t in iter_tles(f):
+                        tles[t.epoch] = t
+            except FileNotFoundError:
+                pass
+            epochs = sorted(tles)
+            self._history[norad] = (epochs, [tles[epoch] for epoch in epochs])
+        return self._history[norad]
+
+    def get(self, norad: int) -> List[Tle]:
+        """Returns all archived TLEs of specified satellite, sorted by epoch."""
+        return list(self._load_history(norad)[1])
+
+    def closest(self, norad: int, when: datetime) -> Optional[Tle]:
+        """Returns the archived TLE of specified satellite with epoch closest to specified
+           time, or None if there's nothing archived for this sat. Naive timestamps are
+           assumed to be UTC."""
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+
+        epochs, tles = self._load_history(norad)
+        if not epochs:
+            return None
+
+        i = bisect.bisect_left(epochs, when)
+        if i == 0:
+            return tles[0]
+        if i == len(epochs):
+            return tles[-1]
+        return tles[i] if epochs[i] - when < when - epochs[i - 1] else tles[i - 1]
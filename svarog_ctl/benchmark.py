@@ -0,0 +1,335 @@
+"""
+benchmark - performance measurements of TLE parsing, pass propagation, planning and rotator I/O.
+
+It runs offline: the TLE catalog is synthetic (CATALOG_SIZE entries derived from a real TLE,
+with different NORAD IDs and orbit orientations), the passes are calculated for a fixed
+date and the rotctld round-trips go to the local simulator (svarog_ctl.simulator) with
+no latency. So the numbers depend on the code and the machine only.
+
+Every benchmark is run several times and the best time is reported (the others are mostly
+noise from the rest of the system), along with the median. Results are stored as JSON,
+together with the version, git commit and the environment, so they can be compared between
+commits:
+
+    python -m svarog_ctl.benchmark --output before.json
+    (change something)
+    python -m svarog_ctl.benchmark --output after.json --compare before.json
+
+--quick runs smaller workloads (a couple of seconds in total), --only picks the groups
+(see GROUPS) to run.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+from orbit_predictor.locations import Location
+from orbit_predictor.sources import get_predictor_from_tle_lines
+
+from svarog_ctl import catalog, passes, trajectory
+from svarog_ctl.globalvars import VERSION
+from svarog_ctl.orbitdb import OrbitDatabase
+from svarog_ctl.rotctld import Rotctld
+from svarog_ctl.simulator import Simulator
+from svarog_ctl.tle import Tle, checksum
+
+# Entries in the synthetic TLE catalog.
+CATALOG_SIZE = 30000
+
+# Calls of passes.distance() in one run.
+DISTANCE_CALLS = 100000
+
+# Predictor lookups in one run.
+LOOKUPS = 10000
+
+# Rotctld commands in one run.
+ROUND_TRIPS = 1000
+
+# How many times every benchmark is run.
+REPEAT = 5
+
+# Slowdowns smaller than that (relative) are considered noise by --compare.
+THRESHOLD = 0.1
+
+# All the workloads are divided by that with --quick.
+QUICK_FACTOR = 10
+
+# The TLE the synthetic catalog is derived from, the sat the passes are calculated for and
+# the observer.
+LINE1 = '1 44427U 98067QM  21192.54020985  .00022355  00000-0  19763-3 0  9995'
+LINE2 = '2 44427  51.6376 177.8799 0003618 359.5888  93.1405 15.68562202115256'
+LOCATION = Location('Gdansk', 53.35, 18.53, 120)
+DATE = datetime(2021, 7, 14, 18, 44, 0, tzinfo=timezone.utc)
+
+# Algorithms and their parameters (see passes.get_pass) the passes are calculated with.
+PASS_PARAMS = [(passes.PassAlgo.TIME_TICKS, 1), (passes.PassAlgo.TIME_TICKS, 5),
+               (passes.PassAlgo.TIME_TICKS, 30), (passes.PassAlgo.DISTANCE, 1),
+               (passes.PassAlgo.DISTANCE, 5), (passes.PassAlgo.MAX_STEPS, 10),
+               (passes.PassAlgo.MAX_STEPS, 100)]
+
+class Result(NamedTuple):
+    """Timing of a single benchmark, in seconds per run of ops operations."""
+    name: str
+    ops: int
+    best: float
+    median: float
+
+    @property
+    def per_op(self) -> float:
+        """Best time of a single operation."""
+        return self.best / self.ops
+
+def measure(name: str, func: Callable[[], None], ops: int = 1, repeat: int = REPEAT,
+            setup: Optional[Callable[[], None]] = None) -> Result:
+    """Runs func repeat times (after setup, which is not timed) and returns its timing.
+       ops is the number of operations func does, for the time per operation."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return Result(name, ops, min(times), statistics.median(times))
+
+def synthetic_catalog(count: int, seed: int = 0) -> List[str]:
+    """Returns lines of a 3-line TLE catalog with count entries. The sats are copies of
+       LINE1/LINE2 with consecutive NORAD IDs and random RAAN and mean anomaly, with valid
+       checksums."""
+    rnd = random.Random(seed)
+    lines = []
+    for i in range(count):
+        norad = f"{10000 + i:05d}"
+        line1 = "1 " + norad + LINE1[7:68]
+        line2 = ("2 " + norad + LINE2[7:17] + f"{rnd.uniform(0, 360):8.4f}" + LINE2[25:43] +
+                 f"{rnd.uniform(0, 360):8.4f}" + LINE2[51:68])
+        lines += [f"SAT {i}", line1 + str(checksum(line1 + "0")),
+                  line2 + str(checksum(line2 + "0"))]
+    return lines
+
+def bench_tle(scale: int = 1) -> List[Result]:
+    """Tle objects and OrbitDatabase.parse_tlebulk on the synthetic catalog, both parsing
+       the text and loading the compiled catalog."""
+    count = CATALOG_SIZE // scale
+    lines = synthetic_catalog(count)
+    entries = [(lines[i + 1], lines[i + 2], lines[i]) for i in range(0, len(lines), 3)]
+
+    def construct():
+        for line1, line2, name in entries:
+            Tle(line1, line2, name)
+
+    results = [measure("tle.Tle", construct, count)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "catalog.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+        def parse():
+            OrbitDatabase(urls=[], datadir=tmp, archive=False).parse_tlebulk(path)
+
+        def remove_compiled():
+            if os.path.exists(catalog.catalog_path(path)):
+                os.remove(catalog.catalog_path(path))
+
+        results.append(measure("orbitdb.parse_tlebulk (text)", parse, count,
+                               setup=remove_compiled))
+        results.append(measure("orbitdb.parse_tlebulk (compiled)", parse, count))
+    return results
+
+def bench_get_pass(scale: int = 1) -> List[Result]:
+    """passes.get_pass for every algorithm with several parameters, and trajectory.plan
+       for the positions at 1 second steps. scale doesn't apply, a pass is what it is."""
+    # pylint: disable=unused-argument
+    pred = get_predictor_from_tle_lines((LINE1, LINE2))
+    next_pass = pred.get_next_pass(LOCATION, when_utc=DATE)
+    aos = next_pass.aos.replace(tzinfo=timezone.utc)
+    los = next_pass.los.replace(tzinfo=timezone.utc)
+
+    results = []
+    for algo, delta in PASS_PARAMS:
+        results.append(measure(f"passes.get_pass {algo.name} {delta}",
+                               lambda algo=algo, delta=delta:
+                               passes.get_pass(pred, LOCATION, aos, los, algo, delta)))
+
+    positions = passes.get_pass(pred, LOCATION, aos, los, passes.PassAlgo.TIME_TICKS, 1)
+    limits = trajectory.RotatorLimits(0.0, 450.0, el_max=180.0)
+    results.append(measure("trajectory.plan TIME_TICKS 1",
+                           lambda: trajectory.plan(positions, limits, (0.0, 0.0)),
+                           len(positions)))
+    return results
+
+def bench_distance(scale: int = 1) -> List[Result]:
+    """passes.distance called for many random pairs of positions."""
+    count = DISTANCE_CALLS // scale
+    rnd = np.random.default_rng(0)
+    pairs = np.column_stack([rnd.uniform(0, 360, count), rnd.uniform(0, 90, count),
+                             rnd.uniform(0, 360, count), rnd.uniform(0, 90, count)]).tolist()
+
+    def call():
+        for az1, el1, az2, el2 in pairs:
+            passes.distance(az1, el1, az2, el2)
+
+    return [measure("passes.distance", call, count)]
+
+def bench_predictor(scale: int = 1) -> List[Result]:
+    """OrbitDatabase.get_predictor lookups by NORAD ID and by name, of the predictors
+       already cached and the ones that have to be created."""
+    count = LOOKUPS // scale
+    lines = synthetic_catalog(CATALOG_SIZE // scale)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = OrbitDatabase(urls=[], datadir=tmp, archive=False)
+        for i in range(0, len(lines), 3):
+            db.add_tle(lines[i + 1], lines[i + 2], lines[i])
+
+    rnd = random.Random(0)
+    norads = list(db.tle_norad)
+    # Few enough to stay in the cache.
+    cached = [rnd.choice(norads[:64]) for _ in range(count)]
+    names = [db.tle_norad[n].name for n in cached]
+    # Different sats, so every lookup creates a predictor.
+    created = rnd.sample(norads, min(count, len(norads)) // 10)
+
+    def lookup(keys):
+        for key in keys:
+            db.get_predictor(key)
+
+    lookup(cached)
+    return [measure("orbitdb.get_predictor (norad, cached)", lambda: lookup(cached), count),
+            measure("orbitdb.get_predictor (name, cached)", lambda: lookup(names), count),
+            measure("orbitdb.get_predictor (norad, new)", lambda: lookup(created), len(created),
+                    setup=db._predictors.clear)] # pylint: disable=protected-access
+
+def bench_rotctld(scale: int = 1) -> List[Result]:
+    """Rotctld command round-trips (get_pos, set_pos) over TCP to the local simulator."""
+    count = ROUND_TRIPS // scale
+    with Simulator(port=0, az_rate=None, el_rate=None) as sim:
+        ctl = Rotctld("127.0.0.1", sim.port)
+        ctl.connect()
+        try:
+            def get_pos():
+                for _ in range(count):
+                    ctl.get_pos()
+
+            def set_pos():
+                for i in range(count):
+                    ctl.set_pos(i % 360 - 180.0, 45.0)
+
+            results = [measure("rotctld.get_pos", get_pos, count),
+                       measure("rotctld.set_pos", set_pos, count)]
+        finally:
+            ctl.close()
+    return results
+
+GROUPS: Dict[str, Callable[[int], List[Result]]] = {
+    "tle": bench_tle,
+    "get_pass": bench_get_pass,
+    "distance": bench_distance,
+    "predictor": bench_predictor,
+    "rotctld": bench_rotctld,
+}
+
+def _git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+def run(groups: Optional[List[str]] = None, quick: bool = False,
+        progress: Optional[Callable[[Result], None]] = None) -> dict:
+    """Runs the benchmarks of the groups (all by default) and returns the results, ready to
+       be stored as JSON. progress is called with every result, as they come."""
+    scale = QUICK_FACTOR if quick else 1
+    results = []
+    for group in groups or list(GROUPS):
+        for result in GROUPS[group](scale):
+            if progress is not None:
+                progress(result)
+            results.append({"group": group, "name": result.name, "ops": result.ops,
+                            "best": result.best, "median": result.median,
+                            "per_op": result.per_op})
+    return {
+        "version": VERSION,
+        "commit": _git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "quick": quick,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+class Comparison(NamedTuple):
+    """Time per operation of a benchmark, before (baseline) and after."""
+    name: str
+    before: float
+    after: float
+
+    @property
+    def ratio(self) -> float:
+        """How many times slower it got (below 1 if it's faster)."""
+        return self.after / self.before
+
+def compare(results: dict, baseline: dict) -> List[Comparison]:
+    """Compares the benchmarks present in both results (as returned by run())."""
+    before = {r["name"]: r["per_op"] for r in baseline["results"]}
+    return [Comparison(r["name"], before[r["name"]], r["per_op"]) for r in results["results"]
+            if r["name"] in before]
+
+def _format_time(seconds: float) -> str:
+    for unit, factor in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= factor:
+            return f"{seconds / factor:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+def main():
+    """Runs the benchmarks, saves and optionally compares the results."""
+    parser = argparse.ArgumentParser(description="Runs svarog-ctl performance benchmarks.")
+    parser.add_argument("--output", "-o", default="benchmark.json",
+                        help="Where to store the results (default: benchmark.json)")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="Results of an earlier run to compare with; exits with 1 if "
+                             "anything got slower")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="Slowdown (relative) tolerated by --compare (default: 0.1)")
+    parser.add_argument("--only", nargs="+", choices=list(GROUPS), help="Groups to run")
+    parser.add_argument("--quick", action="store_true", help="Run smaller workloads")
+    args = parser.parse_args()
+
+    def progress(result: Result):
+        print(f"{result.name:<40} {_format_time(result.best):>10} "
+              f"({result.ops} ops, {_format_time(result.per_op)} per op)", flush=True)
+
+    results = run(args.only, args.quick, progress)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare} (commit {baseline.get('commit')}):")
+        slower = 0
+        for c in compare(results, baseline):
+            mark = ""
+            if c.ratio > 1 + args.threshold:
+                mark = " SLOWER"
+                slower += 1
+            print(f"{c.name:<40} {_format_time(c.before):>10} -> {_format_time(c.after):>10} "
+                  f"{c.ratio:6.2f}x{mark}")
+        if slower:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Compiled on-disk catalog of parsed TLE files.
+
+Parsing the whole celestrak "active" file (roughly 10k satellites) on every start is
+wasteful, as the file changes at most a couple times a week. Once a TLE text file is
+parsed, its content is stored next to it (in the same datadir/tle directory) as a compact
+binary file holding a NumPy structured array, one row per satellite, with all orbital
+elements already parsed. The catalog remembers
+the modification time and size of the text file it was built from, so it is rebuilt
+automatically whenever the text file changes.
+"""
+
+import logging
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from svarog_ctl.tle import Tle, array_to_tles, tles_to_array
+
+# Bump this every time the layout of the catalog changes. Catalogs with a different version
+# are simply ignored and rebuilt from the text file.
+CATALOG_VERSION = 2
+
+CATALOG_SUFFIX = ".catalog"
+
+def catalog_path(tle_path: str) -> str:
+    """Returns the path of the compiled catalog for specified TLE text file."""
+    return tle_path + CATALOG_SUFFIX
+
+def _source_header(tle_path: str) -> np.ndarray:
+    """Returns the header that identifies the exact version of the TLE text file."""
+    stat = os.stat(tle_path)
+    return np.array([CATALOG_VERSION, stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+
+def save_catalog(tle_path: str, tles: List[Tle]):
+    """Compiles the list of parsed TLEs into a catalog stored next to the TLE text file."""
+    rows = tles_to_array(tles, lines=True)
+
+    path = catalog_path(tle_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, _source_header(tle_path))
+        np.save(f, rows)
+    # Replacing the file is atomic, so a concurrent reader never sees a half-written catalog.
+    os.replace(tmp_path, path)
+    logging.debug("Compiled %d TLEs into catalog %s", len(tles), path)
+
+def load_catalog(tle_path: str) -> Optional[List[Tle]]:
+    """Loads the compiled catalog for specified TLE text file. Returns None if the catalog
+       is missing, damaged or was built from a different version of the text file."""
+    path = catalog_path(tle_path)
+    try:
+        with open(path, "rb") as f:
+            header = np.load(f)
+            if not np.array_equal(header, _source_header(tle_path)):
+                logging.debug("Catalog %s is stale, needs to be rebuilt.", path)
+                return None
+            rows = np.load(f)
+    except (OSError, ValueError, EOFError) as e:
+        logging.debug("Unable to load catalog %s: %s", path, e)
+        return None
+
+    return array_to_tles(rows)
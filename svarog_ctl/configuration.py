@@ -2,16 +2,32 @@
 Several functions to manage a configuration
 """
 
+import logging
 import os
 import shutil
-import yaml
+import sys
+from typing import Optional
 
-from .globalvars import CONFIG_PATH
+from .globalvars import CONFIG_PATH, DEV_ENVIRONMENT, LOG_FILE, SHORT_LOG
+
+# The configuration, loaded on first use.
+_config: Optional[dict] = None
+
+def _load(path: str) -> dict:
+    # yaml is needed only when the config is actually read.
+    import yaml # pylint: disable=import-outside-toplevel
+    with open(path, encoding="utf-8") as f:
+        return yaml.safe_load(f) or {} # type: ignore
 
 def open_config():
     """
     Opens configuration file (typically ~/.appname/config.yaml, but please see
-    the glovalvars for details) and returns the yaml dictionary"""
+    the glovalvars for details) and returns the yaml dictionary. The file is read only
+    once, subsequent calls return the same dictionary."""
+    global _config # pylint: disable=global-statement
+    if _config is not None:
+        return _config
+
     config_path = CONFIG_PATH
     config_exists = os.path.exists(config_path)
     if not config_exists:
@@ -20,13 +36,57 @@ def open_config():
 
         template_dir = os.getcwd()
         shutil.copyfile(os.path.join(template_dir, 'config.yml.template'), config_path)
-        print(f"WARNING: config file ({config_path}) was missing, generated using template.")
+        print(f"WARNING: config file ({config_path}) was missing, generated using template.",
+              file=sys.stderr)
 
-    with open(config_path, encoding="utf-8") as f:
-        return yaml.safe_load(f) # type: ignore
+    _config = _load(config_path)
+    return _config
 
 
 def save_config(config):
     """Saves the configuration back to config file on disk."""
+    import yaml # pylint: disable=import-outside-toplevel
+    global _config # pylint: disable=global-statement
+    _config = config
     with open(CONFIG_PATH, "w", encoding="utf-8") as f:
         return yaml.safe_dump(config, f)
+
+def setup_logging():
+    """Configures logging as specified in the config file (logging/level and logging/file),
+       if it exists. The defaults are INFO level (DEBUG in the dev environment) and
+       svarog-ctl.log in the config directory. Called by the entry points, importing svarog_ctl
+       modules doesn't touch the logging configuration."""
+    level = logging.INFO
+    log_file = LOG_FILE
+
+    # Loglevel is a bit complicated. By default, it's INFO, unless it's set in the config
+    # file, unless it's a dev environment, then it's DEBUG. A missing config file, or one
+    # without the logging entries, is fine.
+    cfg = {}
+    if os.path.exists(CONFIG_PATH):
+        cfg = open_config().get("logging") or {}
+    if "level" in cfg:
+        level = logging._nameToLevel[cfg["level"]] # pylint: disable=protected-access
+    if "file" in cfg:
+        log_file = os.path.expanduser(cfg["file"])
+
+    if log_file == "stdout":
+        log_file = None
+    else:
+        # stderr, so it doesn't mix with the data written to stdout (e.g. --dry-run).
+        print(f"Logging on level {logging.getLevelName(level)} to file {log_file}",
+              file=sys.stderr)
+    if log_file:
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+
+    if DEV_ENVIRONMENT:
+        level = logging.DEBUG
+
+    if SHORT_LOG:
+        fmt='%(asctime)s %(levelname)7s: %(message)s'
+        datefmt='%H:%M:%S'
+    else:
+        fmt = '%(asctime)s %(levelname)s %(filename)s:%(lineno)d: %(message)s'
+        datefmt = None # This will use the default ‘%Y-%m-%d %H:%M:%S,uuu’
+
+    logging.basicConfig(level=level, format=fmt, datefmt=datefmt, filename=log_file)
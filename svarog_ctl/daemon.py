@@ -0,0 +1,411 @@
+"""
+Daemon mode: a long-running process that tracks the passes of a set of sats, one after
+another.
+
+A single run of svarog-ctl tracks one pass and exits, so every pass pays for loading the
+catalog, finding the pass and connecting to rotctld. The daemon does all that once. The
+orbital data stays in memory and is refreshed in the background (the TLE files are
+downloaded again once they're older than max_period). The rotctld connection is kept open
+and checked between the passes. The next pass of the watched sats is looked up whenever
+something changes, and it's tracked once it's due.
+
+The watched sats can be changed at runtime over a local control socket (a Unix socket, by
+default svarog-ctl.sock in the datadir). It takes one command per line and answers with
+zero or more lines followed by "OK" or "ERROR <reason>":
+
+    add NORAD       starts watching the sat (the first ones added are the most important)
+    remove NORAD    stops watching the sat, aborts its pass if it's being tracked
+    list            lists the watched sats
+    next            shows the next pass
+    status          shows what the daemon is doing and the rotctld connection health
+
+The commands can be sent with:
+
+    python -m svarog_ctl.daemon add 25338
+"""
+
+import argparse
+import logging
+import os
+import socket
+import socketserver
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from orbit_predictor.locations import Location
+
+from svarog_ctl import passdb, scheduler, stream, telemetry, tracking, trajectory
+from svarog_ctl.configuration import open_config
+from svarog_ctl.globalvars import CONFIG_DIRECTORY
+from svarog_ctl.orbitdb import OrbitDatabase
+from svarog_ctl.passes import PlannedPass
+
+SOCKET_FILE = "svarog-ctl.sock"
+
+# How often (seconds) the TLE files are checked, they're downloaded once they're older than
+# the database's max_period.
+REFRESH_CHECK = 3600.0
+
+# How often (seconds) the rotctld connection is checked while waiting for a pass.
+KEEPALIVE = 60.0
+
+# How long (seconds) before the pre-positioning command the pass is planned again, from the
+# rotator's current position.
+PREPARE_TIME = 10.0
+
+STATE_IDLE = "idle"             # no pass ahead
+STATE_WAITING = "waiting"       # for the next pass
+STATE_TRACKING = "tracking"
+
+def default_socket_path() -> str:
+    """Returns the default location of the control socket: in the datadir (see the config
+       file)."""
+    cfg = open_config()
+    datadir = cfg['datadir'] if 'datadir' in cfg else CONFIG_DIRECTORY
+    return os.path.join(datadir, SOCKET_FILE)
+
+def send_command(path: str, command: str, timeout: float = 5.0) -> str:
+    """Sends a command to the daemon listening on the control socket at path and returns
+       its answer, including the final OK or ERROR line."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(command.strip().encode() + b"\n")
+        with sock.makefile("r", encoding="utf-8") as f:
+            lines = []
+            for line in f:
+                lines.append(line.rstrip("\n"))
+                if line.startswith("OK") or line.startswith("ERROR"):
+                    break
+    return "\n".join(lines)
+
+class _Interrupted(Exception):
+    """The pass being tracked was aborted."""
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    """Serves a control connection, see the module description."""
+
+    def handle(self):
+        for line in self.rfile:
+            line = line.decode("utf-8", "replace").strip()
+            if not line:
+                continue
+            try:
+                answer = self.server.daemon.control(line)
+                reply = "".join(f"{x}\n" for x in answer) + "OK\n"
+            except ValueError as e:
+                reply = f"ERROR {e}\n"
+            self.wfile.write(reply.encode())
+
+class _ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, daemon: "Daemon"):
+        self.daemon = daemon
+        super().__init__(path, _ControlHandler)
+
+class Daemon: # pylint: disable=too-many-instance-attributes
+    """Tracks the passes of the watched sats, until stopped.
+
+       db - OrbitDatabase with the orbital data loaded
+       loc - observer's location
+       rotator - Rotctld instance, connected or not (the daemon keeps trying)
+       sats - NORAD IDs of the sats to watch, the most important first
+       limits - the rotator's limits, see trajectory.plan
+       policy, rate - how the overlapping passes are resolved, see
+                      scheduler.resolve_conflicts
+       socket_path - where the control socket is created, None to not create it
+       telemetry_dir - base directory of the pass telemetry (default in the datadir)
+       closed_loop - correct the commands using the polled positions, see
+                     tracking.ClosedLoop"""
+
+    def __init__(self, db: OrbitDatabase, loc: Location, rotator, sats: List[int],
+                 limits: trajectory.RotatorLimits = trajectory.RotatorLimits(),
+                 min_elevation: float = 0.0, policy: str = scheduler.POLICY_MAX_ELEVATION,
+                 rate: float = scheduler.SLEW_RATE, socket_path: Optional[str] = None,
+                 pass_db_path: Optional[str] = None, telemetry_dir: Optional[str] = None,
+                 poll_interval: Optional[float] = tracking.POLL_INTERVAL,
+                 closed_loop: bool = False):
+        # pylint: disable=too-many-arguments,too-many-locals
+        self.db = db
+        self.loc = loc
+        self.rotator = rotator
+        self.limits = limits
+        self.min_elevation = min_elevation
+        self.policy = policy
+        self.rate = rate
+        self.socket_path = socket_path
+        self.telemetry_dir = telemetry_dir
+        self.poll_interval = poll_interval
+        self.closed_loop = closed_loop
+        self.state = STATE_IDLE
+        self.upcoming: Optional[PlannedPass] = None     # the pass to track next
+        self.current: Optional[PlannedPass] = None      # the pass being tracked
+        self.passes_tracked = 0
+
+        self._pass_db_path = pass_db_path
+        # SQLite connections can't be shared between threads, so it's opened by the thread
+        # that looks the passes up (the one running the daemon).
+        self._pass_db: Optional[passdb.PassDatabase] = None
+
+        # Set when the sats or the orbital data changed, the next pass is looked up again.
+        self._changed = threading.Event()
+        self._stopped = threading.Event()
+
+        # Guards the sats and the orbital data, which are changed by the control and the
+        # refresh threads.
+        self._lock = threading.Lock()
+        self._sats: List[int] = []
+        # Copy of the sats, replaced (not changed) whenever they change, so it can be checked
+        # without the lock between the commands.
+        self._watched: Tuple[int, ...] = ()
+        for norad in sats:
+            try:
+                self.add(norad)
+            except ValueError as e:
+                logging.warning("%s, not watching it", e)
+
+        # Nothing before this time is tracked (the LOS of the last tracked pass).
+        self._after = datetime.min.replace(tzinfo=timezone.utc)
+
+    def add(self, norad: int):
+        """Starts watching the sat, raises ValueError if there's no orbital data for it."""
+        with self._lock:
+            if norad not in self.db.tle_norad:
+                raise ValueError(f"No orbital data for sat {norad}")
+            if norad not in self._sats:
+                self._sats.append(norad)
+                self._watched = tuple(self._sats)
+        logging.info("Watching sat %d", norad)
+        self._changed.set()
+
+    def remove(self, norad: int):
+        """Stops watching the sat, raises ValueError if it's not watched."""
+        with self._lock:
+            if norad not in self._sats:
+                raise ValueError(f"Sat {norad} is not watched")
+            self._sats.remove(norad)
+            self._watched = tuple(self._sats)
+        logging.info("Not watching sat %d anymore", norad)
+        self._changed.set()
+
+    def sats(self) -> List[int]:
+        """Returns the watched sats, the most important first."""
+        with self._lock:
+            return list(self._sats)
+
+    def next_pass(self, when: Optional[datetime] = None) -> Optional[PlannedPass]:
+        """Returns the pass to track next after when (default now): the earliest one of
+           the next passes of the watched sats that's not in conflict with a more important
+           one. Returns None if there's none."""
+        when = when or datetime.now(timezone.utc)
+        if self._pass_db is None:
+            self._pass_db = passdb.PassDatabase(self._pass_db_path or passdb.default_path())
+
+        with self._lock:
+            sats = list(self._sats)
+            tles = [self.db.get_norad(norad) for norad in sats]
+        candidates = [self._pass_db.get_next_pass(t, self.loc, when, self.min_elevation)
+                      for t in tles]
+        priorities = {norad: len(sats) - i for i, norad in enumerate(sats)}
+        selected, _ = scheduler.resolve_conflicts([p for p in candidates if p is not None],
+                                                  self.policy, priorities, rate=self.rate)
+        return selected[0] if selected else None
+
+    def control(self, command: str) -> List[str]:
+        """Executes a control command (see the module description), returns the answer
+           lines. Raises ValueError if the command is not valid."""
+        words = command.split()
+        cmd, params = words[0].lower(), words[1:]
+        if cmd in ("add", "remove"):
+            if len(params) != 1 or not params[0].isdigit():
+                raise ValueError(f"Usage: {cmd} NORAD")
+            if cmd == "add":
+                self.add(int(params[0]))
+            else:
+                self.remove(int(params[0]))
+            return []
+        if cmd == "list":
+            with self._lock:
+                return [f"{norad} {self.db.get_name_by_norad(norad)}" for norad in self._sats]
+        if cmd == "next":
+            pass_ = self.upcoming
+            return [_format_pass(pass_)] if pass_ else []
+        if cmd == "status":
+            stats = self.rotator.stats()
+            lines = [f"state: {self.state}", f"passes tracked: {self.passes_tracked}",
+                     f"rotctld: {stats.state}, {stats.connects} connects, "
+                     f"{stats.failed_commands} failed commands, {stats.downtime:.1f}s down"]
+            if self.current is not None:
+                lines.insert(1, f"tracking: {_format_pass(self.current)}")
+            return lines
+        raise ValueError(f"Unknown command: {cmd}")
+
+
+    def stop(self):
+        """Stops the daemon (aborts the pass being tracked). Can be called from any thread
+           or a signal handler."""
+        self._stopped.set()
+        self._changed.set()
+
+    def run(self):
+        """Runs the daemon, returns once it's stopped."""
+        self._stopped.clear()
+        server = None
+        if self.socket_path:
+            if os.path.exists(self.socket_path):
+                # Left behind by a daemon that was killed.
+                os.unlink(self.socket_path)
+            server = _ControlServer(self.socket_path, self)
+            threading.Thread(target=server.serve_forever, name="control", daemon=True).start()
+            logging.info("Listening for control commands on %s", self.socket_path)
+        threading.Thread(target=self._refresh_loop, name="refresh", daemon=True).start()
+
+        try:
+            self._ensure_connected()
+            while not self._stopped.is_set():
+                self._changed.clear()
+                self._run_once()
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+                os.unlink(self.socket_path)
+            if self._pass_db is not None:
+                self._pass_db.close()
+                self._pass_db = None
+            self.state = STATE_IDLE
+            logging.info("Daemon stopped after %d passes", self.passes_tracked)
+
+    def _run_once(self):
+        """Waits for the next pass and tracks it. Returns early if anything changed."""
+        self.upcoming = self.next_pass(max(datetime.now(timezone.utc), self._after))
+        if self.upcoming is None:
+            self.state = STATE_IDLE
+            logging.info("No passes of the watched sats in the next %d days", passdb.CACHE_DAYS)
+            # Check again later, the TLEs may have changed by then.
+            self._wait(datetime.now(timezone.utc) + timedelta(seconds=REFRESH_CHECK))
+            return
+
+        pass_ = self.upcoming
+        self.state = STATE_WAITING
+        logging.info("Next pass: %s", _format_pass(pass_))
+        if not self._wait(self._plan(pass_).positions[0][0] - timedelta(seconds=PREPARE_TIME)):
+            return
+        # Planned again, now that the rotator's position right before the pass is known.
+        traj = self._plan(pass_)
+        with self._lock:
+            pred = self.db.get_predictor(pass_.norad)
+        self._track(pass_, stream.stream_pass(pred, self.loc, pass_.aos, pass_.los, self.limits,
+                                              traj))
+
+    def _plan(self, pass_: PlannedPass) -> trajectory.Trajectory:
+        """Plans the trajectory for the pass (see stream.plan_pass)."""
+        with self._lock:
+            pred = self.db.get_predictor(pass_.norad)
+        current = None
+        try:
+            az, el = self.rotator.get_pos()
+            if az is not None:
+                current = (az, el)
+        except ConnectionError as e:
+            logging.warning("Can't get rotator position: %s", e)
+        return stream.plan_pass(pred, self.loc, pass_.aos, pass_.los, self.limits,
+                                current=current)
+
+    def _track(self, pass_: PlannedPass, positions: Iterable):
+        """Tracks the pass with the commands (positions, generated as the pass unfolds)."""
+        self.state = STATE_TRACKING
+        self.current = pass_
+        self._after = pass_.los
+        logging.info("Tracking pass: %s", _format_pass(pass_))
+
+        def sleep(seconds: float):
+            # Sleeps, unless the daemon is stopped or the sat is not watched anymore.
+            self._stopped.wait(seconds)
+            if self._stopped.is_set() or pass_.norad not in self._watched:
+                raise _Interrupted()
+
+        directory = telemetry.pass_directory(pass_.norad, pass_.aos, self.telemetry_dir)
+        commands = stream.prefetch(positions)
+        try:
+            loop = tracking.ClosedLoop(limits=self.limits) if self.closed_loop else None
+            with telemetry.TelemetryRecorder(directory) as recorder:
+                result = tracking.track(commands, self.rotator, self.poll_interval,
+                                        sleep=sleep, recorder=recorder, loop=loop)
+        except _Interrupted:
+            logging.warning("Tracking of %s aborted", pass_.name)
+            return
+        finally:
+            commands.close()
+            self.current = None
+
+        self.passes_tracked += 1
+        timing = result.timing()
+        summary = telemetry.summarize(telemetry.load(directory), pass_.aos.timestamp())
+        logging.info("Pass of %s tracked: %d commands, %.1fms late at most, %s", pass_.name,
+                     timing.count, timing.max * 1000, telemetry.format_summary(summary))
+
+    def _wait(self, until: datetime) -> bool:
+        """Waits until the specified time, checking the rotctld connection every now and
+           then. Returns False if anything changed in the meantime."""
+        while True:
+            remaining = (until - datetime.now(timezone.utc)).total_seconds()
+            if remaining <= 0:
+                return True
+            if self._changed.wait(min(remaining, KEEPALIVE)):
+                return False
+            if remaining > KEEPALIVE:
+                self._ensure_connected()
+
+    def _ensure_connected(self):
+        """Checks the rotctld connection, connects again if it's not there."""
+        try:
+            if self.rotator.connected():
+                self.rotator.get_pos()
+            else:
+                self.rotator.connect()
+        except (ConnectionError, OSError) as e:
+            logging.error("rotctld is not available: %s", e)
+
+    def _refresh_loop(self):
+        """Keeps the orbital data up to date, until the daemon is stopped."""
+        while not self._stopped.wait(REFRESH_CHECK):
+            # Downloaded and parsed without the lock, it may take a while and the tracking
+            # must go on meanwhile. Only this thread changes the orbital data.
+            try:
+                tle_names, tle_norad, changed = self.db.merge(self.db.fetch_urls())
+            except Exception as e: # pylint: disable=broad-except
+                # Network problems, the current data is still usable.
+                logging.error("Failed to refresh orbital data: %s", e)
+                continue
+            if not changed:
+                logging.debug("Orbital data refreshed, no new TLEs")
+                continue
+            with self._lock:
+                self.db.replace(tle_names, tle_norad)
+            # The TLEs changed, so may have the passes.
+            self._changed.set()
+
+def _format_pass(pass_: PlannedPass) -> str:
+    return (f"{pass_.norad} {pass_.name} {pass_.aos:%Y-%m-%d %H:%M:%S} - "
+            f"{pass_.los:%H:%M:%S} UTC, max el {pass_.max_elevation:.1f}")
+
+def main():
+    """Sends a control command to the running daemon and prints the answer."""
+    parser = argparse.ArgumentParser(description="Controls the running svarog-ctl daemon.")
+    parser.add_argument("command", nargs="+", help="add NORAD, remove NORAD, list, next or "
+                        "status")
+    parser.add_argument("--socket", help="Control socket of the daemon (default: "
+                        f"{SOCKET_FILE} in the datadir)")
+    args = parser.parse_args()
+
+    answer = send_command(args.socket or default_socket_path(), " ".join(args.command))
+    print(answer)
+    if answer.startswith("ERROR") or "\nERROR" in answer:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
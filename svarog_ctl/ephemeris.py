@@ -0,0 +1,127 @@
+"""
+Vectorized ephemeris: satellite positions (azimuth, elevation, range) for many timestamps
+at once.
+
+orbit_predictor propagates one timestamp per call, which is fine for a couple positions,
+but gets slow once positions are needed every second (or more often) over the whole pass,
+or for many satellites. Here, the whole array of timestamps is propagated in a single SGP4
+call and converted to the observer's topocentric frame using NumPy. The math is the same as
+in orbit_predictor (TEME => ECEF using GMST, then TS Kelso's topocentric conversion), so the
+results match the scalar path.
+"""
+
+import math
+from datetime import datetime, timezone
+from typing import Callable, Sequence, Tuple, Union
+
+import numpy as np
+from sgp4.api import Satrec, SatrecArray, WGS84
+from orbit_predictor.locations import Location
+
+# Julian date of the Unix epoch (1970-01-01 00:00 UTC)
+_JD_UNIX_EPOCH = 2440587.5
+
+Times = Union[np.ndarray, Sequence[datetime]]
+
+def to_datetime64(times: Times) -> np.ndarray:
+    """Converts timestamps into array of datetime64[us]. Naive datetimes are assumed to be UTC,
+       aware ones are converted to UTC."""
+    if isinstance(times, np.ndarray) and np.issubdtype(times.dtype, np.datetime64):
+        return times.astype('datetime64[us]')
+    return np.array([t.astimezone(timezone.utc).replace(tzinfo=None) if t.tzinfo else t
+                     for t in times], dtype='datetime64[us]')
+
+def time_grid(start: datetime, offsets: np.ndarray) -> np.ndarray:
+    """Returns array of datetime64[us] timestamps: start + offsets (in seconds)."""
+    start64 = to_datetime64([start])[0]
+    return start64 + np.round(np.asarray(offsets) * 1e6).astype('timedelta64[us]')
+
+def to_datetimes(start: datetime, offsets: np.ndarray) -> list:
+    """Returns list of datetime timestamps start + offsets (in seconds), with the same
+       timezone as start."""
+    # NumPy converts timedelta64 into timedelta objects in C, which is much faster than
+    # creating them one by one.
+    deltas = np.round(np.asarray(offsets) * 1e6).astype('timedelta64[us]').tolist()
+    return [start + delta for delta in deltas]
+
+def julian_dates(times: Times) -> Tuple[np.ndarray, np.ndarray]:
+    """Converts timestamps into Julian dates, split into whole part and fraction, as
+       expected by SGP4."""
+    us = to_datetime64(times).astype(np.int64)
+    days = us / 86400e6
+    whole = np.floor(days)
+    return _JD_UNIX_EPOCH + whole, days - whole
+
+def gmst(jd: np.ndarray, fr: np.ndarray) -> np.ndarray:
+    """Greenwich Mean Sidereal Time (radians), vectorized version of sgp4's gstime()."""
+    tut1 = (jd - 2451545.0 + fr) / 36525.0
+    # Horner's form with plain operators: this is called for single timestamps too (see
+    # get_az_el_func), where every NumPy call counts.
+    temp = ((-6.2e-6 * tut1 + 0.093104) * tut1 + (876600.0 * 3600 + 8640184.812866)) * tut1
+    return (temp + 67310.54841) * (math.pi / 180.0 / 240.0) % (2 * math.pi)
+
+def get_satrec(pred) -> Satrec:
+    """Returns SGP4 propagator for the orbit_predictor's TLE based predictor."""
+    line1, line2 = pred.tle.lines
+    return Satrec.twoline2rv(line1, line2, WGS84)
+
+def teme_to_ecef(position: np.ndarray, theta: np.ndarray) -> np.ndarray:
+    """Rotates positions (..., 3) from TEME (as returned by SGP4) into ECEF, theta is GMST."""
+    sin_t = np.sin(theta)
+    cos_t = np.cos(theta)
+    ecef = np.empty(np.shape(position))
+    ecef[..., 0] = position[..., 0] * cos_t + position[..., 1] * sin_t
+    ecef[..., 1] = position[..., 1] * cos_t - position[..., 0] * sin_t
+    ecef[..., 2] = position[..., 2]
+    return ecef
+
+def observe(loc: Location, position_ecef: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Converts ECEF positions (..., 3) into azimuth (degrees, 0..360), elevation (degrees)
+       and range (km) as seen by the observer."""
+    sin_lat, cos_lat = math.sin(loc.latitude_rad), math.cos(loc.latitude_rad)
+    sin_lon, cos_lon = math.sin(loc.longitude_rad), math.cos(loc.longitude_rad)
+    # Rows: south, east and zenith components of the observer's topocentric frame.
+    rotation = np.array([[sin_lat * cos_lon, sin_lat * sin_lon, -cos_lat],
+                         [-sin_lon, cos_lon, 0.0],
+                         [cos_lat * cos_lon, cos_lat * sin_lon, sin_lat]])
+    top = (position_ecef - loc.position_ecef) @ rotation.T
+    top_s, top_e, top_z = top[..., 0], top[..., 1], top[..., 2]
+
+    rng = np.sqrt(top_s * top_s + top_e * top_e + top_z * top_z)
+    el = np.degrees(np.arcsin(top_z / rng))
+    az = np.degrees(np.arctan2(-top_e, top_s) + np.pi)
+    return az, el, rng
+
+def propagate_ecef(satrec: Union[Satrec, SatrecArray], times: Times) -> np.ndarray:
+    """Propagates the satellite(s) to all specified timestamps at once. Returns ECEF positions
+       in km, shaped (times, 3) for a single Satrec or (sats, times, 3) for SatrecArray.
+       Positions that couldn't be propagated (e.g. decayed orbits) are NaN."""
+    return _propagate_jd(satrec, *julian_dates(times))
+
+def _propagate_jd(satrec: Union[Satrec, SatrecArray], jd: np.ndarray,
+                  fr: np.ndarray) -> np.ndarray:
+    if isinstance(satrec, SatrecArray):
+        err, position, _ = satrec.sgp4(jd, fr)
+    else:
+        err, position, _ = satrec.sgp4_array(jd, fr)
+    if err.any():
+        position[err != 0] = np.nan
+    return teme_to_ecef(position, gmst(jd, fr))
+
+def get_az_el(pred, loc: Location, times: Times) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns azimuth (degrees), elevation (degrees) and range (km) arrays of the satellite
+       (identified by TLE based predictor) for every timestamp, as seen from location."""
+    return observe(loc, propagate_ecef(get_satrec(pred), times))
+
+def get_az_el_func(pred, loc: Location, start: datetime) -> Callable[[float], Tuple[float, float]]:
+    """Returns a function that calculates azimuth and elevation (degrees) of the satellite
+       at a single timestamp, specified as an offset in seconds from start. Useful for
+       algorithms that can't tell all their timestamps in advance, e.g. searches. Every call
+       goes through the same vectorized code as get_az_el(), with a single timestamp."""
+    satrec = get_satrec(pred)
+    jd, fr = julian_dates([start])
+
+    def az_el(offset: float) -> Tuple[float, float]:
+        az, el, _ = observe(loc, _propagate_jd(satrec, jd, fr + offset / 86400.0))
+        return float(az[0]), float(el[0])
+    return az_el
@@ -0,0 +1,118 @@
+"""
+Machine-readable export of the planned rotator commands (see --dry-run), for scripts and
+other tools.
+
+Every command is a row with the fields listed in SCHEMA:
+
+    norad   - NORAD ID of the sat
+    time    - when the command is due: ISO 8601 UTC in CSV and JSON Lines, unix timestamp
+              (seconds, UTC) in .npy
+    offset  - seconds since AOS, negative for the pre-positioning command
+    az, el  - the commanded position in rotator coordinates (see --az-range and --flip),
+              degrees
+
+CSV files have a header row with the field names, JSON Lines have one object per row with
+the fields as keys and .npy files are structured arrays (PLAN_DTYPE), so they can be loaded
+with np.load() with each field being a column. The rows are written as they're generated,
+without keeping the whole plan in memory.
+"""
+
+import csv
+import itertools
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, NamedTuple, Optional, TextIO
+
+import numpy as np
+
+from svarog_ctl.telemetry import ColumnFile
+
+FORMAT_CSV = "csv"
+FORMAT_JSONL = "jsonl"
+FORMAT_NPY = "npy"
+FORMATS = (FORMAT_CSV, FORMAT_JSONL, FORMAT_NPY)
+
+class Field(NamedTuple):
+    """Field of the exported rows."""
+    name: str
+    dtype: str                  # NumPy type in .npy files
+    unit: str
+    description: str
+
+SCHEMA = [
+    Field("norad", "i4", "", "NORAD ID of the sat"),
+    Field("time", "f8", "s", "when the command is due, UTC"),
+    Field("offset", "f8", "s", "time since AOS, negative before AOS"),
+    Field("az", "f8", "deg", "commanded azimuth, rotator coordinates"),
+    Field("el", "f8", "deg", "commanded elevation, rotator coordinates"),
+]
+
+PLAN_DTYPE = np.dtype([(f.name, f.dtype) for f in SCHEMA])
+
+def guess_format(path: str) -> str:
+    """Returns the format matching the file extension, CSV if it's not known."""
+    ext = os.path.splitext(path)[1].lstrip(".").lower()
+    return ext if ext in FORMATS else FORMAT_CSV
+
+def _rows(positions: Iterable, norad: int, aos: datetime) -> Iterator[tuple]:
+    for t, az, el in positions:
+        yield norad, t, (t - aos).total_seconds(), float(az), float(el)
+
+def _write_npy(rows: Iterator[tuple], path: str) -> int:
+    out = ColumnFile(path, PLAN_DTYPE)
+    try:
+        for norad, t, offset, az, el in rows:
+            out.append((norad, t.timestamp(), offset, az, el))
+    finally:
+        out.close()
+    return out.rows
+
+def _write_csv(rows: Iterator[tuple], stream: TextIO) -> int:
+    writer = csv.writer(stream)
+    writer.writerow([f.name for f in SCHEMA])
+    count = 0
+    for norad, t, offset, az, el in rows:
+        writer.writerow([norad, t.astimezone(timezone.utc).isoformat(), f"{offset:.3f}",
+                         f"{az:.4f}", f"{el:.4f}"])
+        count += 1
+    return count
+
+def _write_jsonl(rows: Iterator[tuple], stream: TextIO) -> int:
+    count = 0
+    for norad, t, offset, az, el in rows:
+        stream.write(json.dumps({"norad": norad, "time": t.astimezone(timezone.utc).isoformat(),
+                                 "offset": round(offset, 3), "az": round(az, 4),
+                                 "el": round(el, 4)}) + "\n")
+        count += 1
+    return count
+
+def export_plan(positions: Iterable, path: str, fmt: Optional[str] = None, norad: int = 0,
+                aos: Optional[datetime] = None) -> int:
+    """Writes the planned commands (positions, [timestamp, az, el], a list or any iterable)
+       into path ("-" for stdout) in format fmt (one of FORMATS, by default guessed from the
+       extension). aos is the beginning of the pass, the first timestamp by default. Returns
+       the number of rows written."""
+    # pylint: disable=too-many-arguments
+    fmt = fmt or guess_format(path)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt}, supported formats: {', '.join(FORMATS)}")
+    if fmt == FORMAT_NPY and path == "-":
+        raise ValueError("The npy format can't be written to stdout, specify the file")
+
+    positions = iter(positions)
+    first = next(positions, None)
+    rows: Iterator[tuple] = iter(())
+    if first is not None:
+        rows = _rows(itertools.chain([first], positions), norad, aos or first[0])
+
+    if fmt == FORMAT_NPY:
+        return _write_npy(rows, path)
+    write = _write_csv if fmt == FORMAT_CSV else _write_jsonl
+    if path == "-":
+        count = write(rows, sys.stdout)
+        sys.stdout.flush()
+        return count
+    with open(path, "w", encoding="utf-8", newline="") as stream:
+        return write(rows, stream)
@@ -0,0 +1,162 @@
+"""
+Interpolated ephemeris: satellite position at any moment of a pass, without running SGP4.
+
+Pointing accuracy of the rotator is limited by how often its position is updated, and
+propagating the orbit for every update gets expensive at 10 Hz or more. Here, the pass is
+propagated once, at a coarse step, and the satellite's ECEF position between the samples is
+calculated from cubic Hermite polynomials, using the position and velocity at both ends of
+the segment. Position in ECEF is a smooth function of time, unlike azimuth (which wraps
+around and swings quickly near zenith), so it's the ECEF position that is interpolated and
+azimuth, elevation and range are calculated from it.
+
+With the default step of 60 seconds, the error against direct propagation is way below
+0.001 degrees for LEO sats (see PassInterpolator.error()).
+
+This is a standalone engine, for callers that need the position many times a second. The
+tracking in svarog-ctl itself doesn't use it: with a command every few seconds, propagating
+them directly (see svarog_ctl.stream) takes well under a millisecond per pass.
+"""
+
+import math
+from datetime import datetime
+from typing import NamedTuple, Tuple, Union
+
+import numpy as np
+from orbit_predictor.locations import Location
+
+from svarog_ctl import ephemeris
+
+# Default distance (seconds) between propagated samples.
+DEFAULT_STEP = 60.0
+
+# Earth rotation rate (radians per second), as used by GMST.
+EARTH_ROTATION = 7.292115146706979e-5
+
+class InterpolationError(NamedTuple):
+    """Difference between the interpolated and directly propagated positions."""
+    max_angle: float            # degrees, as seen by the observer
+    rms_angle: float            # degrees
+    max_range: float            # km
+    samples: int                # number of compared positions
+
+def propagate_ecef_velocity(satrec, times) -> Tuple[np.ndarray, np.ndarray]:
+    """Propagates the satellite to all timestamps. Returns ECEF positions (km) and
+       velocities (km/s), both shaped (times, 3)."""
+    jd, fr = ephemeris.julian_dates(times)
+    err, position, velocity = satrec.sgp4_array(jd, fr)
+    if err.any():
+        position[err != 0] = np.nan
+        velocity[err != 0] = np.nan
+    theta = ephemeris.gmst(jd, fr)
+    pos_ecef = ephemeris.teme_to_ecef(position, theta)
+    # The ECEF frame rotates, so its velocity also has the -omega x r term.
+    vel_ecef = ephemeris.teme_to_ecef(velocity, theta)
+    vel_ecef[:, 0] += EARTH_ROTATION * pos_ecef[:, 1]
+    vel_ecef[:, 1] -= EARTH_ROTATION * pos_ecef[:, 0]
+    return pos_ecef, vel_ecef
+
+def _angle(loc: Location, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Angle (degrees) between ECEF positions (..., 3) as seen by the observer."""
+    obs = np.asarray(loc.position_ecef)
+    a = a - obs
+    b = b - obs
+    cross = np.linalg.norm(np.cross(a, b), axis=-1)
+    return np.degrees(np.arctan2(cross, np.sum(a * b, axis=-1)))
+
+class PassInterpolator: # pylint: disable=too-many-instance-attributes
+    """Satellite's azimuth, elevation and range between start and end, interpolated from
+       samples propagated every step seconds."""
+
+    def __init__(self, pred, loc: Location, start: datetime, end: datetime,
+                 step: float = DEFAULT_STEP):
+        if end < start:
+            raise ValueError(f"End of the pass ({end}) is before its start ({start})")
+        if step <= 0:
+            raise ValueError(f"Step must be positive, got {step}")
+
+        self.loc = loc
+        self.start = start
+        self.duration = (end - start).total_seconds()
+        self.step = float(step)
+        self._satrec = ephemeris.get_satrec(pred)
+
+        # At least one segment, and the last sample at or after the end.
+        segments = max(1, math.ceil(self.duration / self.step - 1e-9))
+        offsets = np.arange(segments + 1) * self.step
+        pos, vel = propagate_ecef_velocity(self._satrec, ephemeris.time_grid(start, offsets))
+        self._coeffs = self._hermite(pos, vel)
+
+        # Plain floats for the scalar path, NumPy overhead would dominate for single values.
+        self._coeffs_list = self._coeffs.tolist()
+        self._obs = tuple(float(v) for v in loc.position_ecef)
+        sin_lat, cos_lat = math.sin(loc.latitude_rad), math.cos(loc.latitude_rad)
+        sin_lon, cos_lon = math.sin(loc.longitude_rad), math.cos(loc.longitude_rad)
+        self._rot = (sin_lat * cos_lon, sin_lat * sin_lon, -cos_lat,
+                     -sin_lon, cos_lon,
+                     cos_lat * cos_lon, cos_lat * sin_lon, sin_lat)
+
+    def _hermite(self, pos: np.ndarray, vel: np.ndarray) -> np.ndarray:
+        """Returns polynomial coefficients (segments, 4, 3): position in segment i at
+           u = (t - t_i) / step, 0 <= u <= 1, is c0 + c1 u + c2 u^2 + c3 u^3."""
+        p0, p1 = pos[:-1], pos[1:]
+        # Derivatives with respect to u, not t.
+        m0, m1 = vel[:-1] * self.step, vel[1:] * self.step
+        c2 = 3 * (p1 - p0) - 2 * m0 - m1
+        c3 = 2 * (p0 - p1) + m0 + m1
+        return np.stack([p0, m0, c2, c3], axis=1)
+
+    def _offset(self, t: Union[datetime, float]) -> float:
+        offset = (t - self.start).total_seconds() if isinstance(t, datetime) else float(t)
+        if not -1e-6 <= offset <= self.duration + 1e-6:
+            raise ValueError(f"{t} is outside of the interpolated pass (0..{self.duration}s)")
+        return offset
+
+    def position_at(self, t: Union[datetime, float]) -> Tuple[float, float, float]:
+        """Returns azimuth (degrees, 0..360), elevation (degrees) and range (km) at t,
+           specified either as a timestamp or offset in seconds from the start."""
+        # pylint: disable=too-many-locals
+        offset = self._offset(t)
+        i = min(max(int(offset / self.step), 0), len(self._coeffs_list) - 1)
+        u = offset / self.step - i
+        c0, c1, c2, c3 = self._coeffs_list[i]
+
+        rx = c0[0] + u * (c1[0] + u * (c2[0] + u * c3[0])) - self._obs[0]
+        ry = c0[1] + u * (c1[1] + u * (c2[1] + u * c3[1])) - self._obs[1]
+        rz = c0[2] + u * (c1[2] + u * (c2[2] + u * c3[2])) - self._obs[2]
+
+        s_x, s_y, s_z, e_x, e_y, z_x, z_y, z_z = self._rot
+        top_s = s_x * rx + s_y * ry + s_z * rz
+        top_e = e_x * rx + e_y * ry
+        top_z = z_x * rx + z_y * ry + z_z * rz
+        rng = math.sqrt(top_s * top_s + top_e * top_e + top_z * top_z)
+        return (math.degrees(math.atan2(-top_e, top_s) + math.pi),
+                math.degrees(math.asin(top_z / rng)), rng)
+
+    def positions_ecef(self, offsets: np.ndarray) -> np.ndarray:
+        """Returns interpolated ECEF positions (offsets, 3) for offsets in seconds."""
+        offsets = np.asarray(offsets, dtype=float)
+        if offsets.size and (offsets.min() < -1e-6 or offsets.max() > self.duration + 1e-6):
+            raise ValueError(f"Offsets are outside of the interpolated pass (0..{self.duration}s)")
+        i = np.clip((offsets // self.step).astype(int), 0, len(self._coeffs) - 1)
+        u = (offsets / self.step - i)[:, np.newaxis]
+        c = self._coeffs[i]
+        return c[:, 0] + u * (c[:, 1] + u * (c[:, 2] + u * c[:, 3]))
+
+    def positions(self, offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Vectorized position_at(): returns azimuth, elevation and range arrays for offsets
+           in seconds from the start."""
+        return ephemeris.observe(self.loc, self.positions_ecef(offsets))
+
+    def error(self, step: float = 1.0) -> InterpolationError:
+        """Compares the interpolation with direct propagation every step seconds of the
+           pass."""
+        offsets = np.append(np.arange(0.0, self.duration, step), self.duration)
+        exact = ephemeris.propagate_ecef(self._satrec, ephemeris.time_grid(self.start, offsets))
+        interpolated = self.positions_ecef(offsets)
+
+        angle = _angle(self.loc, exact, interpolated)
+        obs = np.asarray(self.loc.position_ecef)
+        rng = np.abs(np.linalg.norm(exact - obs, axis=-1) -
+                     np.linalg.norm(interpolated - obs, axis=-1))
+        return InterpolationError(float(angle.max()), float(np.sqrt(np.mean(angle ** 2))),
+                                  float(rng.max()), len(offsets))
@@ -0,0 +1,171 @@
+"""
+Support for CCSDS OMM (Orbit Mean-Elements Message) orbital data, as served by the
+celestrak gp.php endpoint in JSON, CSV and XML formats (FORMAT=json, csv or xml), next to
+the legacy TLE text.
+
+All records are converted into the same Tle representation, so the rest of the code
+(catalog, predictors) doesn't care where the data came from. Unlike TLE text, OMM is not
+limited to 5 digit NORAD IDs. Larger IDs are stored in TLE lines using Alpha-5 format.
+"""
+
+import csv
+import json
+import logging
+import math
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from typing import Callable, Iterator, Optional, TextIO
+
+from svarog_ctl.tle import Tle, checksum, iter_tles, satnum_to_str
+
+FORMATS = ("tle", "json", "csv", "xml")
+
+def detect_format(name: str = "", head: str = "") -> str:
+    """Detects the format of orbital data. name is URL or a file name, head is the beginning
+       of the content. The URL/name is checked first (FORMAT=json query parameter, or .json
+       extension), then the content itself. TLE text is assumed if nothing else matches."""
+    name = name.lower()
+    for fmt in FORMATS:
+        if f"format={fmt}" in name or f"format-{fmt}" in name or name.endswith("." + fmt):
+            return fmt
+
+    head = head.lstrip("\ufeff \t\r\n")
+    if head[:1] in ("[", "{"):
+        return "json"
+    if head[:1] == "<":
+        return "xml"
+    if head.startswith("OBJECT_NAME") or head.startswith("CCSDS_OMM_VERS"):
+        return "csv"
+    return "tle"
+
+def _format_ndot(value: float) -> str:
+    """Formats first derivative of mean motion, e.g. ' .00022355' or '-.00000123'."""
+    txt = f"{abs(value):.8f}"[1:]
+    return ("-" if value < 0 else " ") + txt
+
+def _format_exp(value: float) -> str:
+    """Formats value with assumed leading decimal point and exponent, e.g. ' 19763-3'."""
+    if value == 0:
+        return " 00000-0"
+    exp = math.floor(math.log10(abs(value))) + 1
+    digits = round(abs(value) / 10 ** exp * 1e5)
+    if digits >= 100000:
+        digits //= 10
+        exp += 1
+    if exp < -9:
+        return " 00000-0"
+    if exp > 9:
+        raise ValueError(f"Value {value} out of range")
+    return f"{'-' if value < 0 else ' '}{digits:05d}{'-' if exp < 0 else '+'}{abs(exp)}"
+
+def _format_epoch(epoch: str) -> str:
+    """Converts OMM epoch (ISO 8601) into TLE epoch format (YYDDD.DDDDDDDD)."""
+    when = datetime.fromisoformat(epoch.rstrip("Z"))
+    day = (when - datetime(when.year, 1, 1)).total_seconds() / 86400.0 + 1
+    return f"{when.year % 100:02d}{day:012.8f}"
+
+def _format_intl_designator(object_id: str) -> str:
+    """Converts international designator from OMM (1998-067QM) into TLE (98067QM)."""
+    if not object_id or len(object_id) < 9 or object_id[4] != "-":
+        return ""
+    return object_id[2:4] + object_id[5:]
+
+def omm_to_tle(fields: dict) -> Tle:
+    """Converts a single OMM record (dictionary of OMM fields) into a Tle."""
+    sat = satnum_to_str(int(fields["NORAD_CAT_ID"]))
+    classification = (fields.get("CLASSIFICATION_TYPE") or "U")[:1]
+
+    line1 = (f"1 {sat}{classification} "
+             f"{_format_intl_designator(fields.get('OBJECT_ID') or ''):8} "
+             f"{_format_epoch(fields['EPOCH'])} "
+             f"{_format_ndot(float(fields['MEAN_MOTION_DOT']))} "
+             f"{_format_exp(float(fields['MEAN_MOTION_DDOT']))} "
+             f"{_format_exp(float(fields['BSTAR']))} "
+             f"{int(fields.get('EPHEMERIS_TYPE') or 0)} "
+             f"{int(fields.get('ELEMENT_SET_NO') or 0) % 10000:4d}")
+    eccentricity = f"{float(fields['ECCENTRICITY']):.7f}"[2:] # no leading "0."
+    line2 = (f"2 {sat} "
+             f"{float(fields['INCLINATION']):8.4f} "
+             f"{float(fields['RA_OF_ASC_NODE']):8.4f} "
+             f"{eccentricity} "
+             f"{float(fields['ARG_OF_PERICENTER']):8.4f} "
+             f"{float(fields['MEAN_ANOMALY']):8.4f} "
+             f"{float(fields['MEAN_MOTION']):11.8f}"
+             f"{int(fields.get('REV_AT_EPOCH') or 0) % 100000:5d}")
+    line1 += str(checksum(line1))
+    line2 += str(checksum(line2))
+
+    return Tle(line1, line2, (fields.get("OBJECT_NAME") or "").strip())
+
+def _iter_json(f: TextIO, chunk_size: int = 65536) -> Iterator[dict]:
+    """Yields objects from a JSON array one by one, without loading the whole document."""
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    while True:
+        # Skip whitespace and array punctuation between objects.
+        while pos < len(buf) and buf[pos] in " \t\r\n,[]\ufeff":
+            pos += 1
+        if pos < len(buf):
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                obj = None
+            if obj is not None:
+                pos = end
+                if isinstance(obj, dict):
+                    yield obj
+                continue
+        if eof:
+            return
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buf = buf[pos:] + chunk
+        pos = 0
+
+def _iter_csv(f: TextIO) -> Iterator[dict]:
+    yield from csv.DictReader(f)
+
+def _iter_xml(f: TextIO) -> Iterator[dict]:
+    """Yields OMM segments from XML, releasing every segment as soon as it's parsed."""
+    for _, elem in ET.iterparse(f, events=("end",)):
+        if elem.tag.rsplit("}", 1)[-1] != "segment":
+            continue
+        fields = {}
+        for child in elem.iter():
+            tag = child.tag.rsplit("}", 1)[-1]
+            if len(child) == 0 and child.text is not None:
+                fields[tag] = child.text.strip()
+        elem.clear()
+        yield fields
+
+_READERS = { "json": _iter_json, "csv": _iter_csv, "xml": _iter_xml }
+
+def iter_omm(f: TextIO, fmt: str,
+             on_error: Optional[Callable[[int, str], None]] = None) -> Iterator[Tle]:
+    """Parses OMM records in specified format (json, csv or xml) and yields them as TLEs.
+       Records that can't be converted are reported with on_error(record number, description)
+       and skipped. By default, they're logged as warnings."""
+    for recno, fields in enumerate(_READERS[fmt](f), start=1):
+        try:
+            yield omm_to_tle(fields)
+        except (KeyError, ValueError, TypeError) as e:
+            if on_error is not None:
+                on_error(recno, f"{type(e).__name__}: {e}")
+            else:
+                logging.warning("Skipping malformed OMM record %d: %s", recno, e)
+
+def iter_file(f: TextIO, name: str = "",
+              on_error: Optional[Callable[[int, str], None]] = None) -> Iterator[Tle]:
+    """Parses orbital data from a file in any supported format (TLE text or OMM) and yields
+       them as TLEs. The format is detected based on the name (URL or file name) and the
+       content. See iter_tles() for details about on_error."""
+    head = f.read(4096)
+    f.seek(0)
+    fmt = detect_format(name, head)
+    if fmt == "tle":
+        return iter_tles(f, on_error=on_error)
+    return iter_omm(f, fmt, on_error=on_error)
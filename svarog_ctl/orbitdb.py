@@ -3,37 +3,85 @@ OrbitDatabase is responsible for downloading and maintaining TLE orbital data.
 """
 
 import datetime
+import json
 import logging
 import os
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Tuple
 import requests
+import requests.adapters
 import requests.exceptions
 
-from orbit_predictor.sources import NoradTLESource
+from orbit_predictor.sources import get_predictor_from_tle_lines
 from orbit_predictor.predictors.base import CartesianPredictor
+from orbit_predictor.locations import Location
 
-from svarog_ctl.tle import Tle
+import numpy as np
+from sgp4.api import Satrec, SatrecArray, WGS84
 
+from svarog_ctl.tle import Tle, tles_to_array
+
+from . import ephemeris
+from .archive import TleArchive
+from .catalog import load_catalog, save_catalog
+from .omm import iter_file
 from .globalvars import APP_NAME, VERSION, CONFIG_DIRECTORY
 from .configuration import open_config
 from .utils import url_to_filename
 
 TLE_SOURCES = [
     "https://celestrak.org/NORAD/elements/gp.php?GROUP=active&FORMAT=tle" # Can be an url
+    # "https://celestrak.org/NORAD/elements/gp.php?GROUP=active&FORMAT=csv" # OMM works too
     # "file://local.txt" # can also be a local file
 ]
 
+# How many predictors get_predictor() keeps around. Building a predictor is cheap, but not free,
+# and a long running process typically asks about the same handful of sats over and over.
+PREDICTOR_CACHE_SIZE = 128
+
+# How many sources are downloaded at the same time.
+MAX_PARALLEL_DOWNLOADS = 8
+
+# HTTP caching information (ETag, Last-Modified) of every downloaded file is kept in a small
+# sidecar file next to it.
+HTTP_META_SUFFIX = ".http"
+
+# Columns of the array returned by get_visible(). Name is added separately, same as in
+# tles_to_array().
+VISIBLE_FIELDS = [
+    ('norad', np.int32),
+    ('time', 'datetime64[us]'),     # UTC, when the sat is at the reported position
+    ('az', np.float64),             # degrees
+    ('el', np.float64),             # degrees
+    ('range', np.float64),          # km
+]
+
+# How many timestamps get_visible() propagates at once. With a large catalog, every timestamp
+# takes ~240kB per 10k sats, so this caps the memory used for long windows.
+VISIBLE_CHUNK = 64
+
 def _get_create_time(path):
     stat = os.stat(path)
     ctime = stat.st_ctime
     return ctime
 
-def _is_in_source(source, sat_id):
+def _load_http_meta(tle_path) -> dict:
     try:
-        source.get_tle(sat_id, datetime.datetime.now(datetime.timezone.utc))
-        return True
-    except LookupError:
-        return False
+        with open(tle_path + HTTP_META_SUFFIX, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_http_meta(tle_path, meta: dict):
+    with open(tle_path + HTTP_META_SUFFIX, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+def _get_fetch_time(path):
+    """Returns the time the file was last fetched (or confirmed to be current)."""
+    return _load_http_meta(path).get("checked", _get_create_time(path))
 
 class OrbitDatabase:
     """
@@ -41,7 +89,7 @@ class OrbitDatabase:
     configurable Internet sources and local files.
     """
 
-    def __init__(self, urls=None, max_period=7*24*60*60):
+    def __init__(self, urls=None, max_period=7*24*60*60, datadir=None, archive=None):
         self.max_period = max_period
         if urls is None:
             urls = TLE_SOURCES
@@ -50,37 +98,95 @@ class OrbitDatabase:
         self.tle_names = {}
         self.tle_norad = {}
 
+        # The catalog as a structured array, built on demand. See to_array().
+        self._array = None
+
+        # TLEs and SGP4 propagators for the whole catalog, built on demand. See get_visible().
+        self._satrecs = None
+
+        # Predictors built so far, keyed by (norad id, TLE epoch), the least recently used first.
+        self._predictors = OrderedDict()
+
+        # HTTP session, created on first download. Keeps the connections open between requests.
+        # The downloads run in a thread pool (and refreshes in the daemon's thread), so it's
+        # created under the lock.
+        self._session = None
+        self._session_lock = threading.Lock()
+
         # Store all information in the ${DATADIR}/tle directory.
-        cfg = open_config()
-        logging.debug("Loaded config: %s", repr(cfg))
-        self.datadir = os.path.join(cfg['datadir'] if 'datadir' in cfg else CONFIG_DIRECTORY, 'tle')
+        if datadir is None:
+            cfg = open_config()
+            logging.debug("Loaded config: %s", repr(cfg))
+            datadir = cfg['datadir'] if 'datadir' in cfg else CONFIG_DIRECTORY
+            if archive is None:
+                archive = bool(cfg.get('tle_archive', False))
+        self.datadir = os.path.join(datadir, 'tle')
         os.makedirs(self.datadir, exist_ok = True)
 
+        # If enabled (archive parameter, or tle_archive in the config file), every distinct TLE
+        # ever downloaded is kept in the archive, so old passes can be replayed with orbital data
+        # from that time. It's off by default: it keeps a file per sat and makes every refresh
+        # with new epochs slower.
+        self.archive = TleArchive(os.path.join(self.datadir, 'history')) if archive else None
+
+    def _get_session(self) -> requests.Session:
+        with self._session_lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_maxsize=MAX_PARALLEL_DOWNLOADS)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({ 'user-agent': APP_NAME + " " + VERSION,
+                                         'Accept': 'text/plain, application/json, text/csv, '
+                                                   'application/xml;q=0.9, */*;q=0.8' })
+                self._session = session
+            return self._session
+
     def _get_tle_from_url(self, url):
+        fname = self.datadir + os.path.sep + url[7:]
+        logging.debug("Reading file [%s]", fname)
+
+        with open(fname, "r", encoding="utf-8") as f:
+            content = f.read()
+            logging.debug("Loaded %d bytes from file %s", len(content), fname)
+            return content
+
+    def _fetch_tle_and_save(self, url, tle_path):
         if url[:7] == "file://":
-            fname = self.datadir + os.path.sep + url[7:]
-            logging.debug("Reading file [%s]", fname)
+            content = self._get_tle_from_url(url)
+            with open(tle_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            return tle_path
+
+        logging.info("Downloading %s to local file %s", url, tle_path)
 
-            with open(fname, "r", encoding="utf-8") as f:
-                content = f.read()
-                f.close()
-                logging.debug("Loaded %d bytes from file %s", len(content), fname)
-                return content
+        # If we have the file already, ask the server to send it only if it has changed.
+        meta = _load_http_meta(tle_path) if os.path.exists(tle_path) else {}
+        headers = {}
+        if meta.get("etag"):
+            headers['If-None-Match'] = meta["etag"]
+        if meta.get("last_modified"):
+            headers['If-Modified-Since'] = meta["last_modified"]
 
-        headers = { 'user-agent': APP_NAME + " " + VERSION, 'Accept': 'text/plain' }
         try:
-            response = requests.get(url, headers=headers, timeout=10)
+            response = self._get_session().get(url, headers=headers, timeout=10)
+            response.raise_for_status()
         except requests.exceptions.RequestException as error:
             logging.error("Exception requesting TLE: %s", error)
             raise
-        return response.content.decode("UTF-8")
 
-    def _fetch_tle_and_save(self, url, tle_path):
-        logging.info("Downloading %s to local file %s", url, tle_path)
-
-        content = self._get_tle_from_url(url)
-        with open(tle_path, "w", encoding="utf-8") as f:
-            f.write(content)
+        if response.status_code == 304:
+            logging.info("%s not modified, keeping local file %s", url, tle_path)
+        else:
+            tmp_path = tle_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(response.content)
+            os.replace(tmp_path, tle_path)
+            meta = { "etag": response.headers.get("ETag"),
+                     "last_modified": response.headers.get("Last-Modified") }
+
+        meta["checked"] = time.time()
+        _save_http_meta(tle_path, meta)
         return tle_path
 
     def _get_tle_path_from_url(self, url):
@@ -90,7 +196,7 @@ class OrbitDatabase:
         return tle_path
 
     def _is_out_of_date(self, path):
-        ctime = _get_create_time(path)
+        ctime = _get_fetch_time(path)
         now = time.time()
         return now > ctime + self.max_period
 
@@ -108,68 +214,237 @@ class OrbitDatabase:
                 return tle_path
             raise
 
-    def get_predictor(self, name: str) -> CartesianPredictor:
-        """Returns a prediction for specified satellite"""
-        for url in self.urls:
-            path = self._get_current_tle_file(url)
-            source = NoradTLESource.from_file(path)
-            if _is_in_source(source, name):
-                return source.get_predictor(name)
+    def _get_current_tle_files(self, urls, force_fetch=False):
+        """Same as _get_current_tle_file(), but for many URLs at once. The downloads
+           are conducted in parallel, so the whole thing takes roughly as long as the
+           slowest source."""
+        if len(urls) <= 1:
+            return [self._get_current_tle_file(url, force_fetch) for url in urls]
+
+        workers = min(MAX_PARALLEL_DOWNLOADS, len(urls))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda url: self._get_current_tle_file(url, force_fetch), urls))
+
+    def get_tle(self, name, when: datetime.datetime = None) -> Tle:
+        """Returns TLE of specified satellite. The satellite can be specified by its name or
+           its NORAD ID. If no orbital data is loaded yet, it will be loaded first.
+
+           If when is specified, the archived TLE with epoch closest to that time is returned.
+           This is useful for replaying past passes. Otherwise, the latest TLE is returned."""
+        if not self.tle_norad:
+            self.parse_all()
+
+        t = self._find_tle(name)
+        if when is not None and self.archive is not None:
+            t = self.archive.closest(t.norad, when) or t
+        return t
+
+    def get_predictor(self, name, when: datetime.datetime = None) -> CartesianPredictor:
+        """Returns a prediction for specified satellite, using the TLE returned by get_tle()
+           (see there for the parameters)."""
+        t = self.get_tle(name, when)
+
+        # The epoch is part of the key, so a predictor for outdated TLE is never returned
+        # after the orbital data is refreshed.
+        key = (t.norad, t.epoch)
+        pred = self._predictors.get(key)
+        if pred is not None:
+            self._predictors.move_to_end(key)
+            return pred
+
+        pred = get_predictor_from_tle_lines((t.line1, t.line2))
+        self._predictors[key] = pred
+        if len(self._predictors) > PREDICTOR_CACHE_SIZE:
+            self._predictors.popitem(last=False)
+        return pred
+
+    def _find_tle(self, name) -> Tle:
+        """Finds the TLE by NORAD ID, exact name or (as a last resort) part of the name."""
+        if isinstance(name, int) or (isinstance(name, str) and name.isdigit()):
+            if int(name) in self.tle_norad:
+                return self.tle_norad[int(name)]
+        if name in self.tle_names:
+            return self.tle_names[name]
+        for sat_name, t in self.tle_names.items():
+            if str(name) in sat_name:
+                return t
         raise LookupError(f"Could not find {name} in orbit data.")
 
     def refresh_satellites(self, sat_ids):
         """Refresh satellite info from remote sources and local files."""
         all_sat_ids = set(sat_ids)
         found_sat_ids = set()
-        for url in self.urls:
+        for path in self._get_current_tle_files(self.urls, force_fetch=True):
             sats_to_search = all_sat_ids.difference(found_sat_ids)
             if len(sats_to_search) == 0:
                 return
 
-            path = self._get_current_tle_file(url, force_fetch=True)
-            source = NoradTLESource.from_file(path)
+            self.parse_tlebulk(path)
 
             for sat_id in sats_to_search:
-                if _is_in_source(source, sat_id):
+                try:
+                    self._find_tle(sat_id)
                     found_sat_ids.add(sat_id)
+                except LookupError:
+                    pass
 
         if all_sat_ids != found_sat_ids:
-            raise LookupError(f"Could not find {', '.join(all_sat_ids.difference(found_sat_ids))} in orbit data.")
-
-    def refresh_urls(self, force_fetch = False):
-        """Downloads all defined TLE information from TLE_SOURCES and other defined sources."""
-        urls = self.urls
-
-        for url in urls:
-            self._get_current_tle_file(url, force_fetch=force_fetch)
-            self.parse_tlebulk(self._get_tle_path_from_url(url))
+            missing = all_sat_ids.difference(found_sat_ids)
+            raise LookupError(f"Could not find {', '.join(map(str, missing))} in orbit data.")
+
+    def refresh_urls(self, force_fetch = False) -> bool:
+        """Downloads all defined TLE information from TLE_SOURCES and other defined sources.
+           Returns True if any of the TLEs changed (a new sat or a new epoch)."""
+        tle_names, tle_norad, changed = self.merge(self.fetch_urls(force_fetch))
+        self.replace(tle_names, tle_norad)
+        return changed
+
+    def fetch_urls(self, force_fetch = False) -> List[Tle]:
+        """Same as refresh_urls(), but the TLEs are returned rather than loaded, so they can
+           be downloaded and parsed while the database is still in use. See merge()."""
+        return [t for path in self._get_current_tle_files(self.urls, force_fetch=force_fetch)
+                for t in self._read_tlebulk(path)]
+
+    def merge(self, tles: Iterable[Tle]) -> Tuple[dict, dict, bool]:
+        """Returns the loaded TLEs with tles added, as new tle_names and tle_norad dicts (see
+           replace()), and whether any of them changed. The database itself is not changed."""
+        tle_names = dict(self.tle_names)
+        tle_norad = dict(self.tle_norad)
+        changed = False
+        for t in tles:
+            old = tle_norad.get(t.norad)
+            changed = changed or old is None or old.epoch != t.epoch
+            if t.name:
+                tle_names[t.name] = t
+            tle_norad[t.norad] = t
+        return tle_names, tle_norad, changed
+
+    def replace(self, tle_names: dict, tle_norad: dict):
+        """Replaces the loaded TLEs at once, e.g. with the ones returned by merge()."""
+        self.tle_names = tle_names
+        self.tle_norad = tle_norad
+        self._array = None
+        self._satrecs = None
 
     def parse_all(self):
         """Parses all files."""
-        for url in self.urls:
-            path = self._get_current_tle_file(url)
+        for path in self._get_current_tle_files(self.urls):
             self.parse_tlebulk(path)
 
     def parse_tlebulk(self, file: str = None):
         """Parses loaded TLE data, as downloaded from TLE_SOURCES. The file is essentially a
-           lot of TLE lines concatenated together."""
-
-        cnt = 0
-        with open(file, encoding="utf-8") as f:
-            lines = f.readlines()
-        for i in range(int(len(lines) / 3) ):
-            name = lines[3*i].strip()
-            line1 = lines[3*i+1].strip()
-            line2 = lines[3*i+2].strip()
-            self.add_tle(line1, line2, name)
-            cnt += 1
-        logging.info("Loaded %d TLEs.", cnt)
+           lot of TLE lines concatenated together, or OMM data in JSON, CSV or XML format.
+
+           The parsed data is compiled into a binary catalog stored next to the file. As long
+           as the file doesn't change, the catalog is loaded instead of parsing the text again."""
+        for t in self._read_tlebulk(file):
+            self.add(t)
+
+    def _read_tlebulk(self, file: str) -> List[Tle]:
+        tles = load_catalog(file)
+        if tles is not None:
+            logging.debug("Loaded compiled catalog for %s", file)
+        else:
+            errors = []
+            start = time.perf_counter()
+            with open(file, encoding="utf-8") as f:
+                tles = list(iter_file(f, file, on_error=lambda lineno, msg: errors.append(lineno)))
+            elapsed = time.perf_counter() - start
+            logging.debug("Parsed %d TLEs from %s in %.3fs (%.0f TLEs/s)", len(tles), file,
+                          elapsed, len(tles) / elapsed if elapsed else 0)
+            if errors:
+                logging.warning("Skipped %d malformed TLEs in %s, first at line/record %d",
+                                len(errors), file, errors[0])
+            if self.archive is not None:
+                self.archive.add(tles)
+            try:
+                save_catalog(file, tles)
+            except OSError as e:
+                logging.warning("Unable to save compiled catalog for %s: %s", file, e)
+
+        logging.info("Loaded %d TLEs.", len(tles))
+        return tles
 
     def add_tle(self, line1: str, line2: str, name: str):
         """Adds a new TLE entry from strings."""
-        t = Tle(line1, line2, name)
-        self.tle_names[name] = t
+        self.add(Tle(line1, line2, name))
+
+    def add(self, t: Tle):
+        """Adds a new TLE entry."""
+        if t.name:
+            self.tle_names[t.name] = t
         self.tle_norad[t.norad] = t
+        self._array = None
+        self._satrecs = None
+
+    def to_array(self) -> np.ndarray:
+        """Returns all loaded TLEs as a NumPy structured array, one row per satellite (see
+           tle.TLE_FIELDS for the list of columns). The array is built once and reused until
+           the catalog changes. Use it for vectorized queries over the whole catalog, e.g.
+           arr = db.to_array(); arr[arr['inclination'] > 97.0]['norad']"""
+        if self._array is None:
+            self._array = tles_to_array(list(self.tle_norad.values()))
+        return self._array
+
+    def _get_satrecs(self):
+        if self._satrecs is None:
+            tles = list(self.tle_norad.values())
+            satrecs = SatrecArray([Satrec.twoline2rv(t.line1, t.line2, WGS84) for t in tles])
+            self._satrecs = (tles, satrecs)
+        return self._satrecs
+
+    def get_visible(self, loc: Location, when: datetime.datetime = None, duration: float = 0,
+                    step: float = 10, min_elevation: float = 0) -> np.ndarray:
+        """Returns all satellites above min_elevation (degrees) as seen from specified
+           location, at specified time (now, if not specified). If duration (seconds) is
+           specified, the whole window from when to when+duration is checked, every step
+           seconds, and every sat that gets above min_elevation is included, at its highest
+           position in that window.
+
+           All sats are propagated together in one vectorized batch, so it's quick even for
+           a large catalog. The result is a structured array (see VISIBLE_FIELDS, plus name),
+           sorted by elevation, the highest first."""
+        # pylint: disable=too-many-locals
+        if not self.tle_norad:
+            self.parse_all()
+        if when is None:
+            when = datetime.datetime.now(datetime.timezone.utc)
+        tles, satrecs = self._get_satrecs()
+
+        offsets = np.arange(0, duration + step / 2, step) if duration > 0 else np.zeros(1)
+        times = ephemeris.time_grid(when, offsets)
+
+        # The highest position of every sat so far. Sats that couldn't be propagated (e.g.
+        # decayed) have NaN positions and never get above the mask.
+        best = np.full(len(tles), -np.inf)
+        best_az = np.zeros(len(tles))
+        best_rng = np.zeros(len(tles))
+        best_time = np.full(len(tles), times[0])
+        for i in range(0, len(times), VISIBLE_CHUNK):
+            chunk = times[i:i + VISIBLE_CHUNK]
+            az, el, rng = ephemeris.observe(loc, ephemeris.propagate_ecef(satrecs, chunk))
+            el = np.where(np.isnan(el), -np.inf, el)
+            highest = np.argmax(el, axis=1)
+            sats = np.arange(len(tles))
+            higher = el[sats, highest] > best
+            best[higher] = el[sats, highest][higher]
+            best_az[higher] = az[sats, highest][higher]
+            best_rng[higher] = rng[sats, highest][higher]
+            best_time[higher] = chunk[highest][higher]
+
+        visible = np.flatnonzero(best >= min_elevation)
+        visible = visible[np.argsort(-best[visible], kind='stable')]
+
+        names = [tles[i].name.encode("utf-8") for i in visible]
+        result = np.empty(len(visible), dtype=VISIBLE_FIELDS +
+                          [('name', f'S{max(map(len, names), default=1) or 1}')])
+        result['norad'] = [tles[i].norad for i in visible]
+        result['time'] = best_time[visible]
+        result['az'] = best_az[visible]
+        result['el'] = best[visible]
+        result['range'] = best_rng[visible]
+        result['name'] = names
+        return result
 
     def get_name(self, l: str) -> Tle:
         """Attempts to return a TLE by its name, e.g. get_name("NOAA 18") """
@@ -195,7 +470,7 @@ class OrbitDatabase:
             exists = os.path.exists(path)
             if exists:
                 out_of_date = self._is_out_of_date(path)
-                creation_time = _get_create_time(path)
+                creation_time = _get_fetch_time(path)
                 now = time.time()
                 age = now - creation_time
 
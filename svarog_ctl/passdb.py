@@ -0,0 +1,138 @@
+"""
+PassDatabase caches predicted passes in a local SQLite database.
+
+Finding passes is the most expensive part of a svarog-ctl run, and when it's started from cron
+every couple minutes, it keeps finding the very same passes over and over. Passes depend only
+on the TLE and the observer, so they're calculated a few days ahead and stored, keyed by
+NORAD ID, TLE epoch, observer's location and the elevation mask. The next pass after any time
+within those days is then a single indexed query. Once a TLE with a new epoch is used, the
+passes calculated from the older TLEs are dropped.
+"""
+
+import logging
+import os
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from orbit_predictor.locations import Location
+from orbit_predictor.sources import get_predictor_from_tle_lines
+
+from svarog_ctl.configuration import open_config
+from svarog_ctl.globalvars import CONFIG_DIRECTORY
+from svarog_ctl.passes import PlannedPass, find_passes
+from svarog_ctl.tle import Tle
+
+PASSDB_FILE = "passes.sqlite"
+
+# How far ahead the passes are calculated.
+CACHE_DAYS = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS spans (
+    norad INTEGER NOT NULL, lat REAL NOT NULL, lon REAL NOT NULL, alt REAL NOT NULL,
+    min_el REAL NOT NULL, epoch REAL NOT NULL, start REAL NOT NULL, end REAL NOT NULL,
+    PRIMARY KEY (norad, lat, lon, alt, min_el));
+CREATE TABLE IF NOT EXISTS passes (
+    norad INTEGER NOT NULL, lat REAL NOT NULL, lon REAL NOT NULL, alt REAL NOT NULL,
+    min_el REAL NOT NULL, epoch REAL NOT NULL, name TEXT NOT NULL,
+    aos REAL NOT NULL, los REAL NOT NULL, max_el REAL NOT NULL, max_el_time REAL NOT NULL,
+    aos_az REAL NOT NULL, los_az REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS passes_aos ON passes (norad, lat, lon, alt, min_el, aos);
+"""
+
+def _timestamp(when: datetime) -> float:
+    """Converts datetime into unix timestamp. Naive datetimes are assumed to be UTC."""
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return when.timestamp()
+
+def _datetime(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+def default_path() -> str:
+    """Returns the default location of the database: in the datadir (see the config file),
+       next to the tle directory."""
+    cfg = open_config()
+    datadir = cfg['datadir'] if 'datadir' in cfg else CONFIG_DIRECTORY
+    return os.path.join(datadir, PASSDB_FILE)
+
+class PassDatabase:
+    """Persistent cache of predicted passes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        """Closes the database."""
+        self._conn.close()
+
+    @staticmethod
+    def _key(t: Tle, loc: Location, min_elevation: float) -> Tuple:
+        # Rounded, so the same observer always gets the same key, despite float noise.
+        return (t.norad, round(loc.latitude_deg, 6), round(loc.longitude_deg, 6),
+                round(loc.elevation_m, 1), round(min_elevation, 3))
+
+    def get_next_pass(self, t: Tle, loc: Location, when: datetime,
+                      min_elevation: float = 5) -> Optional[PlannedPass]:
+        """Returns the next pass of the sat (or the one in progress) after specified time,
+           with maximum elevation above min_elevation degrees (same default as in
+           orbit_predictor). The passes are calculated only if they're not in the database
+           yet. Returns None if there's no such pass in the next CACHE_DAYS days. Returned
+           timestamps are in UTC."""
+        key = self._key(t, loc, min_elevation)
+        epoch = _timestamp(t.epoch)
+        ts = _timestamp(when)
+
+        span = self._conn.execute(
+            "SELECT epoch, start, end FROM spans "
+            "WHERE norad=? AND lat=? AND lon=? AND alt=? AND min_el=?", key).fetchone()
+        if span is not None and span[0] == epoch and span[1] <= ts <= span[2]:
+            found = self._find(key, ts, span[2])
+            if found is not None:
+                return found
+
+        # Nothing stored for this TLE and time, or no pass till the end of the stored span
+        # (maybe there's one later).
+        self._calculate(t, loc, min_elevation, when)
+        return self._find(key, ts, ts + CACHE_DAYS * 86400)
+
+    def _find(self, key: Tuple, ts: float, end: float) -> Optional[PlannedPass]:
+        row = self._conn.execute(
+            "SELECT name, aos, los, max_el, max_el_time, aos_az, los_az FROM passes "
+            "WHERE norad=? AND lat=? AND lon=? AND alt=? AND min_el=? AND los>? AND aos<=? "
+            "ORDER BY aos LIMIT 1", key + (ts, end)).fetchone()
+        if row is None:
+            return None
+        name, aos, los, max_el, max_el_time, aos_az, los_az = row
+        return PlannedPass(key[0], name, _datetime(aos), _datetime(los), max_el,
+                           _datetime(max_el_time), aos_az, los_az)
+
+    def _calculate(self, t: Tle, loc: Location, min_elevation: float, when: datetime):
+        """Calculates passes for the next CACHE_DAYS days and replaces whatever was stored
+           for this sat and observer."""
+        key = self._key(t, loc, min_elevation)
+        epoch = _timestamp(t.epoch)
+        start = datetime.fromtimestamp(_timestamp(when), timezone.utc)
+        end = start + timedelta(days=CACHE_DAYS)
+
+        pred = get_predictor_from_tle_lines((t.line1, t.line2))
+        passes = find_passes(pred, loc, start, end, min_elevation, t.norad, t.name)
+        logging.debug("Calculated %d passes of %d from %s till %s", len(passes), t.norad,
+                      start, end)
+
+        with self._conn:
+            self._conn.execute("DELETE FROM passes WHERE norad=? AND lat=? AND lon=? AND alt=? "
+                               "AND min_el=?", key)
+            # Passes for other observers calculated from older TLEs are useless too.
+            self._conn.execute("DELETE FROM passes WHERE norad=? AND epoch<?", (t.norad, epoch))
+            self._conn.execute("DELETE FROM spans WHERE norad=? AND epoch<?", (t.norad, epoch))
+            self._conn.execute("INSERT OR REPLACE INTO spans VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               key + (epoch, _timestamp(start), _timestamp(end)))
+            self._conn.executemany(
+                "INSERT INTO passes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [key + (epoch, p.name, _timestamp(p.aos), _timestamp(p.los), p.max_elevation,
+                        _timestamp(p.max_elevation_time), p.aos_az, p.los_az) for p in passes])
@@ -3,12 +3,36 @@ Calculates the next sat pass, using specified predictor and times. Several
 algorthims are envisaged.
 """
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 from math import sin, cos, acos, pi
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
 from orbit_predictor.predictors.base import CartesianPredictor
+from orbit_predictor.exceptions import NotReachable
 from orbit_predictor.locations import Location
 
+from svarog_ctl import ephemeris
+
+# Positions propagated at once by iter_pass().
+STREAM_CHUNK = 64
+
+# How far ahead find_next_pass() looks, so it doesn't search forever for a sat that's never
+# visible from the location.
+SEARCH_DAYS = 30
+
+class PlannedPass(NamedTuple):
+    """Single pass of a sat over the observer."""
+    norad: int
+    name: str
+    aos: datetime
+    los: datetime
+    max_elevation: float        # degrees
+    max_elevation_time: datetime
+    aos_az: float               # degrees
+    los_az: float               # degrees
+
 class PassAlgo(Enum):
     """List of available algorithms for calculating the sat pass."""
     TIME_TICKS = 1
@@ -16,6 +40,36 @@ class PassAlgo(Enum):
     MAX_STEPS = 3
 
 
+def find_passes(pred: CartesianPredictor, loc: Location, start: datetime, end: datetime,
+                min_elevation: float = 0, norad: int = 0, name: str = "") -> List[PlannedPass]:
+    """Returns all passes of the sat (identified by predictor) over the location between
+       start and end, with maximum elevation above min_elevation (degrees). A pass that is
+       already in progress at start is included too."""
+    return [_planned(pred, loc, p, norad, name)
+            for p in pred.passes_over(loc, start, limit_date=end, max_elevation_gt=min_elevation)]
+
+def find_next_pass(pred: CartesianPredictor, loc: Location, when: datetime,
+                   min_elevation: float = 5, norad: int = 0, name: str = "",
+                   days: float = SEARCH_DAYS) -> Optional[PlannedPass]:
+    """Returns the next pass of the sat (or the one in progress) after when, searching up to
+       days ahead. Unlike PassDatabase, nothing is cached, so this is meant for the passes
+       beyond the cached days. Returns None if there's no such pass."""
+    # pylint: disable=too-many-arguments
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    try:
+        p = pred.get_next_pass(loc, when_utc=when, max_elevation_gt=min_elevation,
+                               limit_date=when + timedelta(days=days))
+    except NotReachable:
+        return None
+    return _planned(pred, loc, p, norad, name)
+
+def _planned(pred: CartesianPredictor, loc: Location, p, norad: int, name: str) -> PlannedPass:
+    aos_az, _ = loc.get_azimuth_elev_deg(pred.get_position(p.aos))
+    los_az, _ = loc.get_azimuth_elev_deg(pred.get_position(p.los))
+    return PlannedPass(norad, name, p.aos, p.los, p.max_elevation_deg, p.max_elevation_date,
+                       aos_az, los_az)
+
 def get_pass(pred: CartesianPredictor, loc: Location, aos: datetime, los: datetime,
              algo: PassAlgo, delta: float):
     """Returns position list for specified satellite (identified by predictor) for
@@ -30,7 +84,7 @@ def get_pass(pred: CartesianPredictor, loc: Location, aos: datetime, los: dateti
 
        TIME_TICKS - antenna is moved every delta seconds
        DISTANCE - antenna is moved if its pointing deviates from the sat position
-                  by more than delta degrees (not implemented yet)
+                  by more than delta degrees
        MAX_STEPS - conducts the whole fly over with exactly delta number of steps
 
        TIME_TICKS is the most basic algorithm and easiest to implement and understand.
@@ -45,49 +99,151 @@ def get_pass(pred: CartesianPredictor, loc: Location, aos: datetime, los: dateti
        sat position differ. Tuning this parameter requires a knowledge of the
        antenna characteristics. If its very narrow, then you'd want to make many
        small adjustments. For wider beam antennas, fewer larger adjustments may
-       be better. The delta parameter is interpreted as angular degrees.
+       be better. The delta parameter is interpreted as angular degrees. The first
+       position is at AOS and the commands are placed exactly where needed (see
+       plan_distance), so there are few of them low over the horizon and many more
+       when the sat passes close to zenith.
 
        MAX_STEPS - this is another possible approach that splits the total pass
        into specified number of equal steps. It's somewhat similar to TIME_TICKS,
        but may possibly be a bit better in treating very long and very brief
        passes more uniformly. The delta parameter is interpreted as number of steps.
-       Highly experimental."""
+       Highly experimental.
+
+       TIME_TICKS and MAX_STEPS pick their samples from positions calculated in a single
+       batch (see svarog_ctl.ephemeris), rather than propagating the orbit one timestamp
+       at a time."""
 
-    pos_list = []
+    duration = (los - aos).total_seconds()
+    if algo == PassAlgo.DISTANCE:
+        offsets, az, el = plan_distance(ephemeris.get_az_el_func(pred, loc, aos), duration, delta)
+        times = ephemeris.to_datetimes(aos, np.array(offsets))
+        return [[t, a, e] for t, a, e in zip(times, az, el)]
 
     if algo == PassAlgo.TIME_TICKS:
-        d = timedelta(seconds = delta)
+        step = delta
     elif algo == PassAlgo.MAX_STEPS:
-        d = (los - aos) / delta
-    elif algo == PassAlgo.DISTANCE:
-        d = timedelta(seconds = 1)
+        step = duration / delta
     else:
         raise ValueError(f"Unknown algorithm: {algo}")
 
-    t = aos
-    while t < los:
-        t += d
-        # Make sure we don't do anything stupid, like tracking below horizon. If the next
-        # step would put as past LOS (i.e. below horizon), trim down the last interval
-        # and end it early.
-        t = min(t, los)
-        pos = pred.get_position(t)
-        az, el = loc.get_azimuth_elev_deg(pos)
-
-        if algo in [PassAlgo.TIME_TICKS, PassAlgo.MAX_STEPS]:
-            # Time ticks and maximum steps algorithms add the position all the time.
-            pos_list.append([t, az, el])
-        if algo == PassAlgo.DISTANCE:
-            # The distance algorithm adds the next position only if its distance is
-            # greater than specified value.
-            if not pos_list:
-                pos_list.append([t, az, el])
-                continue
-            [old_az, old_el] = pos_list[-1]
-            if distance(az, el, old_az, old_el) > delta:
-                pos_list.append([t, az, el])
-
-    return pos_list
+    # Samples are taken every step seconds after AOS. Make sure we don't do anything stupid,
+    # like tracking below horizon. If the next step would put us past LOS (i.e. below horizon),
+    # trim down the last interval and end it early.
+    offsets = get_offsets(duration, step)
+    az, el, _ = ephemeris.get_az_el(pred, loc, ephemeris.time_grid(aos, offsets))
+
+    times = ephemeris.to_datetimes(aos, offsets)
+    return [[t, a, e] for t, a, e in zip(times, az.tolist(), el.tolist())]
+
+def sample_count(duration: float, step: float) -> int:
+    """Returns number of samples every step seconds in duration, see get_offsets()."""
+    if duration <= 0:
+        return 0
+    # The tiny tolerance prevents float rounding from adding an extra, almost empty step.
+    return max(int(np.ceil(duration / step - 1e-9)), 1)
+
+def get_offsets(duration: float, step: float) -> np.ndarray:
+    """Returns sample offsets (in seconds since AOS) every step seconds, with the last one
+       clipped to duration (LOS)."""
+    count = sample_count(duration, step)
+    if count == 0:
+        return np.empty(0)
+    offsets = np.arange(1, count + 1, dtype=float) * step
+    offsets[-1] = duration
+    return offsets
+
+def iter_pass(pred: CartesianPredictor, loc: Location, aos: datetime, los: datetime,
+              step: float, stride: int = 1, chunk: int = STREAM_CHUNK) -> Iterator[list]:
+    """Generates the same positions as get_pass(..., PassAlgo.TIME_TICKS, step), lazily.
+       They're propagated chunk at a time, so memory use doesn't depend on the length of
+       the pass and the first ones are available right away. With stride, only every
+       stride-th position is generated (the first and the last one always are), e.g. for
+       a coarse preview of a long pass."""
+    duration = (los - aos).total_seconds()
+    count = sample_count(duration, step)
+    indexes = range(0, count, stride)
+    for begin in range(0, len(indexes), chunk):
+        sel = np.array(indexes[begin:begin + chunk], dtype=float)
+        if begin + chunk >= len(indexes) and sel[-1] != count - 1:
+            sel = np.append(sel, count - 1)
+        offsets = (sel + 1) * step
+        offsets[sel == count - 1] = duration
+        az, el, _ = ephemeris.get_az_el(pred, loc, ephemeris.time_grid(aos, offsets))
+        times = ephemeris.to_datetimes(aos, offsets)
+        yield from ([t, a, e] for t, a, e in zip(times, az.tolist(), el.tolist()))
+
+def plan_distance(az_el: Callable[[float], Tuple[float, float]], duration: float, delta: float,
+                  tolerance: float = 0.05) -> Tuple[List[float], List[float], List[float]]:
+    """Plans rotator commands for the DISTANCE algorithm. az_el returns the sat position
+       (azimuth, elevation) at specified offset (seconds since AOS), duration is the pass
+       length in seconds. The first command is at AOS, each next one at the moment when the
+       sat gets delta degrees away from the previous one. Returns offsets, azimuths and
+       elevations of the commands.
+
+       Rather than scanning the whole pass with a fixed step, the moment of every command is
+       searched for: the step is extrapolated from the local angular rate (doubling at most,
+       if the sat speeds up), then the crossing is narrowed down to tolerance seconds.
+       That takes just a couple of evaluations per command, so the planning cost depends on
+       the number of commands, not on the pass duration."""
+    offsets = [0.0]
+    az0, el0 = az_el(0.0)
+    azs = [az0]
+    els = [el0]
+
+    # Initial guess based on the angular rate right after AOS.
+    probe = min(1.0, duration)
+    rate = distance(az0, el0, *az_el(probe)) / probe if probe > 0 else 0.0
+    step = delta / rate if rate > 0 else duration
+
+    while True:
+        found = _find_crossing(az_el, offsets[-1], azs[-1], els[-1], step, duration, delta,
+                               tolerance)
+        if found is None:
+            break
+        t, az, el = found
+        step = t - offsets[-1]
+        offsets.append(t)
+        azs.append(az)
+        els.append(el)
+
+    return offsets, azs, els
+
+def _find_crossing(az_el, t0: float, az0: float, el0: float, step: float, duration: float,
+                   delta: float, tolerance: float) -> Optional[Tuple[float, float, float]]:
+    """Finds the first moment after t0 when the sat is more than delta degrees away from
+       (az0, el0). Returns (offset, az, el) or None, if it stays closer until duration."""
+
+    # Bracket the crossing: lo is known to be closer than delta, hi further away.
+    lo, d_lo = t0, 0.0
+    while True:
+        t = min(lo + step, duration)
+        az, el = az_el(t)
+        d = distance(az0, el0, az, el)
+        if d > delta:
+            hi, d_hi, hi_pos = t, d, (az, el)
+            break
+        if t >= duration:
+            return None
+        # Extrapolate from the local angular rate, overshooting a bit to get past the
+        # crossing. Never grow the step more than twice at a time.
+        rate = (d - d_lo) / (t - lo)
+        lo, d_lo = t, d
+        step = min(1.2 * (delta - d) / rate, 2 * step) if rate > 0 else 2 * step
+        step = max(step, tolerance)
+
+    # Narrow it down, interpolating linearly between lo and hi. Clamping keeps the bracket
+    # shrinking even if the interpolation is poor.
+    while hi - lo > tolerance:
+        frac = (delta - d_lo) / (d_hi - d_lo)
+        t = lo + min(max(frac, 0.1), 0.9) * (hi - lo)
+        az, el = az_el(t)
+        d = distance(az0, el0, az, el)
+        if d > delta:
+            hi, d_hi, hi_pos = t, d, (az, el)
+        else:
+            lo, d_lo = t, d
+    return hi, hi_pos[0], hi_pos[1]
 
 def deg2rad(x: float) -> float:
     """Converts value specified in degress into radians."""
@@ -110,5 +266,6 @@ def distance(az1: float, el1:float, az2:float, el2: float) -> float:
 
     # This is based on the classical great circle distance. See here for details:
     # https://en.wikipedia.org/wiki/Great-circle_distance#Formulae
-    d = acos(sin(el1)*sin(el2) + cos(el1)*cos(el2)*cos(az2-az1))
+    # Rounding errors may push the value slightly out of acos domain for (almost) identical points.
+    d = acos(min(1.0, max(-1.0, sin(el1)*sin(el2) + cos(el1)*cos(el2)*cos(az2-az1))))
     return rad2deg(d)
@@ -14,8 +14,26 @@ License: MIT
 import socket
 from socket import AF_INET, SOCK_STREAM
 import logging
+import time
+from typing import NamedTuple, Optional, Tuple
 
-class Rotctld:
+# Connection states, as reported by Rotctld.stats()
+STATE_DISCONNECTED = "disconnected"
+STATE_CONNECTED = "connected"
+STATE_RECONNECTING = "reconnecting"
+
+class ConnectionStats(NamedTuple):
+    """Snapshot of the connection health."""
+    state: str                  # one of the STATE_* values
+    connects: int               # successful connections, including reconnects
+    disconnects: int            # connections found dead
+    reconnect_attempts: int     # all attempts to reconnect, successful or not
+    commands: int               # commands that got a response
+    failed_commands: int        # commands that failed even after reconnecting
+    downtime: float             # total seconds spent without working connection
+    last_error: Optional[str]   # the most recent connection error
+
+class Rotctld: # pylint: disable=too-many-instance-attributes
     """ This is python 3 interface to the rotator controler rotctld, part of the excellent
         hamlib library. This class uses python logging."""
 
@@ -23,9 +41,20 @@ class Rotctld:
     _hostname : str
     _port : int
 
-    def __init__(self, hostname : str = "127.0.0.1", port : int = 4533, timeout : int = 3):
+    # Delay before the first reconnect attempt (seconds), doubled after every failed one,
+    # up to MAX_BACKOFF.
+    INITIAL_BACKOFF = 0.05
+    MAX_BACKOFF = 1.0
+
+    def __init__(self, hostname : str = "127.0.0.1", port : int = 4533, timeout : int = 3,
+                 az_min : float = -180.0, az_max : float = 180.0, el_max : float = 90.0,
+                 reconnect_attempts : int = 5):
         """ Initializes the object, but does not do anything. Before sending any commands,
-            please make sure you call connect() first. """
+            please make sure you call connect() first. az_min and az_max specify
+            the rotator's azimuth range (e.g. 0..450 for rotators with overlap), el_max
+            is 180 for rotators capable of elevation flip. If the connection is lost,
+            up to reconnect_attempts attempts to reconnect are made, with exponential
+            backoff (0 disables reconnecting). """
 
         # Attempt to do some sanity checks here.
         port = int(port)
@@ -34,11 +63,28 @@ class Rotctld:
 
         # There's no easy way to sanity check the hostname, as it could be IPv4, IPv6,
         # a hostname or even a FQDN
-        self.sock = socket.socket(AF_INET, SOCK_STREAM)
-        self.sock.settimeout(timeout)
+        self.sock = None
+        self._timeout = timeout
         self._hostname = hostname
         self._port = port
         self._connected = False
+        self.az_min = az_min
+        self.az_max = az_max
+        self.el_max = el_max
+        self.reconnect_attempts = reconnect_attempts
+
+        # The most recent position requested with set_pos(), re-sent after reconnecting.
+        self._target : Optional[Tuple[float, float]] = None
+
+        self._connects = 0
+        self._disconnects = 0
+        self._attempts = 0
+        self._commands = 0
+        self._failed = 0
+        self._downtime = 0.0
+        self._down_since : Optional[float] = None
+        self._last_error : Optional[str] = None
+        self._state = STATE_DISCONNECTED
 
     def connected(self) -> bool:
         """ Returns the status of the connection. """
@@ -46,24 +92,52 @@ class Rotctld:
 
     def connect(self) -> str:
         """ Attempts to connect to rotctld. If the connection is established,
-            it returns the rotator model as a string. """
-        self.sock.connect((self._hostname,self._port))
-        model = self.get_model()
-        if model is None:
-            # Timeout!
-            self.close()
-            raise Exception("Timeout!")
+            it returns the rotator model as a string. The connection can be closed
+            and connected again. """
+        model = self._open()
+        logging.info("Rotator model reported as %s", model)
+        return model
+
+    def _open(self) -> str:
+        """ Opens a new connection and checks that rotctld responds. """
+        self._close_socket()
+        self.sock = socket.socket(AF_INET, SOCK_STREAM)
+        self.sock.settimeout(self._timeout)
+        try:
+            self.sock.connect((self._hostname,self._port))
+            model = self._exchange("_")
+        except OSError:
+            self._close_socket()
+            raise
         self._connected = True
+        self._connects += 1
+        self._state = STATE_CONNECTED
+        if self._down_since is not None:
+            self._downtime += time.monotonic() - self._down_since
+            self._down_since = None
         return model
 
+    def _close_socket(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        self._connected = False
+
     def close(self):
         """ Closes the connection. """
-        self.sock.close()
-        self._connected = False
+        self._close_socket()
+        self._state = STATE_DISCONNECTED
 
-    def send_command(self, cmd: str):
-        """ Send a command to the connected rotctld instance,
-            and return the return value. """
+    def stats(self) -> ConnectionStats:
+        """ Returns the connection health metrics. """
+        downtime = self._downtime
+        if self._down_since is not None:
+            downtime += time.monotonic() - self._down_since
+        return ConnectionStats(self._state, self._connects, self._disconnects, self._attempts,
+                               self._commands, self._failed, downtime, self._last_error)
+
+    def _exchange(self, cmd: str) -> str:
+        """ Sends the command and reads the response, without any error handling. """
         if (cmd and len(cmd)>0 and cmd[-1] != '\n'):
             cmd_safe = cmd + '\n'
         else:
@@ -71,13 +145,73 @@ class Rotctld:
 
         self.sock.sendall(bytes(cmd_safe, 'utf-8'))
         resp = self.sock.recv(1024)
-        if resp is not None:
-            resp = resp.decode().strip()
+        if not resp:
+            raise ConnectionError("Connection closed by rotctld")
+        resp = resp.decode().strip()
 
         resp_txt = resp.replace("\n"," ")
         logging.debug("Sent command [%s], received response [%s]", cmd, resp_txt)
         return resp
 
+    def _reconnect(self, resend_target: bool):
+        """ Reconnects with exponential backoff. Once reconnected, the most recent target
+            position is sent again (if resend_target is set), as the rotator (or rotctld)
+            might have lost it. Raises ConnectionError if all attempts fail. """
+        self._state = STATE_RECONNECTING
+        backoff = self.INITIAL_BACKOFF
+        for attempt in range(1, self.reconnect_attempts + 1):
+            time.sleep(backoff)
+            self._attempts += 1
+            try:
+                self._open()
+            except OSError as e:
+                self._last_error = str(e)
+                logging.warning("Reconnect attempt %d/%d to rotctld at %s:%d failed: %s",
+                                attempt, self.reconnect_attempts, self._hostname, self._port, e)
+                backoff = min(backoff * 2, self.MAX_BACKOFF)
+                continue
+
+            logging.info("Reconnected to rotctld at %s:%d", self._hostname, self._port)
+            if resend_target and self._target is not None:
+                self._exchange("P %3.1f %2.1f" % self._target)
+            return
+
+        raise ConnectionError(f"Can't reconnect to rotctld at {self._hostname}:{self._port}: "
+                              f"{self._last_error}")
+
+    def send_command(self, cmd: str):
+        """ Send a command to the connected rotctld instance,
+            and return the return value. If the connection turns out to be dead,
+            reconnects and sends the command again. Raises ConnectionError if
+            that's not possible. """
+        if self._state == STATE_DISCONNECTED:
+            raise ConnectionError("Not connected to rotctld, call connect() first")
+
+        try:
+            if self.sock is None:
+                raise ConnectionError("Connection to rotctld lost")
+            resp = self._exchange(cmd)
+        except OSError as e:
+            # socket.timeout and ConnectionError are OSErrors too.
+            logging.error("Command [%s] failed: %s", cmd.strip(), e)
+            self._last_error = str(e)
+            if self._connected:
+                self._disconnects += 1
+                self._down_since = time.monotonic()
+            self._close_socket()
+            try:
+                # No point in sending the target before a command that sets a new one.
+                self._reconnect(resend_target=not cmd.startswith("P"))
+                resp = self._exchange(cmd)
+            except OSError as e2:
+                # Still in STATE_RECONNECTING, the next command will try again.
+                self._failed += 1
+                self._close_socket()
+                raise ConnectionError(f"Command [{cmd.strip()}] failed: {e2}") from e2
+
+        self._commands += 1
+        return resp
+
     def get_model(self):
         """ Get the rotator model from rotctld """
         model = self.send_command("_")
@@ -85,15 +219,22 @@ class Rotctld:
         return model
 
     def norm_az(self, az: float) -> float:
-        """Get the normalized (-180.0.. 180) azimuth."""
-        return ((az + 180.0) % 360.0) - 180.0
+        """Get the azimuth normalized to the rotator's range (-180.0..180 by default).
+           Azimuths already within the range are kept as they are, as with overlapping
+           ranges (e.g. 0..450) the same direction can be reached in two ways."""
+        if self.az_min <= az <= self.az_max:
+            return az
+        az = ((az - self.az_min) % 360.0) + self.az_min
+
+        # Truncate, if the range is narrower than 360 degrees.
+        return min(az, self.az_max)
 
     def norm_el(self, el: float) -> float:
-        """Get the normalized (0..90) elevation."""
+        """Get the normalized (0..90, or 0..180 for flip capable rotators) elevation."""
 
         # Truncate if necessary
-        if el > 90.0:
-            el = 90.0
+        if el > self.el_max:
+            el = self.el_max
         elif el < 0.0:
             el = 0.0
 
@@ -113,6 +254,7 @@ class Rotctld:
         elevation = self.norm_el(elevation)
         azimuth = self.norm_az(azimuth)
 
+        self._target = (azimuth, elevation)
         command = "P %3.1f %2.1f" % (azimuth,elevation)
         logging.debug(f"Setting position to {command}")
         resp = self.send_command(command)
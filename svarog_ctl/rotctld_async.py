@@ -0,0 +1,201 @@
+"""
+rotctld_async - asyncio interface to rotctld
+
+Rotctld sends a command and reads whatever arrives in a single recv(), so it relies on the
+whole reply coming in one segment, and every command costs a full round trip. This client
+uses the extended response protocol instead: every command is prefixed with '+', so rotctld
+ends each reply with an "RPRT n" line. Replies are read line by line until that line, no
+matter how they're split into segments, and multi-line answers (position, capabilities) are
+handled the same way as single-line ones.
+
+rotctld processes commands in the order they arrive and answers them in the same order, so
+commands don't need to wait for the previous reply. Every command sent gets a future, queued
+in the order of sending, and a single reader task resolves them as the replies come in.
+Concurrent calls (e.g. asyncio.gather(ctl.set_pos(...), ctl.get_pos())) are pipelined on the
+same connection.
+"""
+
+import asyncio
+import collections
+import logging
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from svarog_ctl.rotctld import Rotctld
+
+class Reply(NamedTuple):
+    """Reply to a command in the extended response protocol."""
+    code: int                   # RPRT code, 0 means success, negative values are errors
+    lines: List[str]            # all lines before the RPRT, the first one echoes the command
+
+    @property
+    def values(self) -> Dict[str, str]:
+        """Returns "Key: value" lines as dictionary."""
+        result = {}
+        for line in self.lines[1:]:
+            key, sep, value = line.partition(":")
+            if sep:
+                result[key.strip()] = value.strip()
+        return result
+
+    def __str__(self) -> str:
+        return "\n".join(self.lines + [f"RPRT {self.code}"])
+
+class AsyncRotctld: # pylint: disable=too-many-instance-attributes
+    """ asyncio interface to rotctld, with the same normalization of positions as Rotctld.
+        Commands may be issued concurrently, they're pipelined over one connection. """
+
+    # Positions are normalized the same way as in the blocking version.
+    norm_az = Rotctld.norm_az
+    norm_el = Rotctld.norm_el
+
+    def __init__(self, hostname : str = "127.0.0.1", port : int = 4533, timeout : float = 3,
+                 az_min : float = -180.0, az_max : float = 180.0, el_max : float = 90.0):
+        """ Initializes the object, but does not do anything. Before sending any commands,
+            please make sure you call connect() first. """
+        port = int(port)
+        if port < 0 or port > 65535:
+            raise IndexError(f"invalid port {port}")
+
+        self._hostname = hostname
+        self._port = port
+        self._timeout = timeout
+        self.az_min = az_min
+        self.az_max = az_max
+        self.el_max = el_max
+
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: collections.deque = collections.deque()
+
+    def connected(self) -> bool:
+        """ Returns the status of the connection. """
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self) -> str:
+        """ Attempts to connect to rotctld. If the connection is established,
+            it returns the rotator model as a string. """
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self._hostname, self._port), self._timeout)
+        self._reader_task = asyncio.get_running_loop().create_task(self._read_replies())
+        return await self.get_model()
+
+    async def close(self):
+        """ Closes the connection. Commands still waiting for reply fail with
+            ConnectionError. """
+        # Stop reading first, so closing the connection isn't reported as lost.
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+        self._fail_pending(ConnectionError("Connection closed"))
+        self._reader = self._writer = self._reader_task = None
+
+    def _fail_pending(self, exc: Exception):
+        while self._pending:
+            fut = self._pending.popleft()
+            if not fut.done():
+                fut.set_exception(exc)
+
+    async def _read_replies(self):
+        """ Reads replies as they come and hands them over to the commands, in order. """
+        lines = []
+        try:
+            while True:
+                raw = await self._reader.readline()
+                if not raw:
+                    raise ConnectionError("Connection closed by rotctld")
+                line = raw.decode().rstrip("\r\n")
+                if not line.startswith("RPRT "):
+                    lines.append(line)
+                    continue
+
+                reply = Reply(int(line[5:]), lines)
+                lines = []
+                if not self._pending:
+                    logging.warning("Unexpected reply from rotctld: %s", reply)
+                    continue
+                fut = self._pending.popleft()
+                if not fut.done():
+                    fut.set_result(reply)
+        except (ConnectionError, OSError, ValueError) as e:
+            logging.error("Lost connection to rotctld: %s", e)
+            self._fail_pending(ConnectionError(str(e)))
+            if self._writer is not None:
+                self._writer.close()
+
+    async def send_command(self, cmd: str) -> Reply:
+        """ Sends a command to the connected rotctld instance and returns its reply.
+            The command is sent right away, without waiting for replies to the commands
+            sent before it. """
+        if not self.connected():
+            raise ConnectionError("Not connected to rotctld")
+
+        cmd = cmd.strip()
+        fut = asyncio.get_running_loop().create_future()
+        # Queueing the future and writing the command must not be separated by an await,
+        # or the replies could be matched with wrong commands.
+        self._pending.append(fut)
+        self._writer.write(bytes(f"+{cmd}\n", 'utf-8'))
+        await self._writer.drain()
+
+        try:
+            reply = await asyncio.wait_for(fut, self._timeout)
+        except asyncio.TimeoutError:
+            # There's no telling which reply belongs to which command anymore.
+            logging.error("Timeout waiting for reply to [%s], disconnecting", cmd)
+            await self.close()
+            raise
+        logging.debug("Sent command [%s], received response [%s]", cmd,
+                      str(reply).replace("\n", " "))
+        return reply
+
+    async def get_model(self) -> str:
+        """ Get the rotator model from rotctld """
+        reply = await self.send_command("_")
+        values = reply.values
+        model = values["Info"] if "Info" in values else " ".join(reply.lines[1:])
+        logging.info("Rotator model reported as %s", model)
+        return model
+
+    async def set_pos(self, azimuth : float, elevation : float) -> Tuple[bool, Reply]:
+        """Command rotator to a particular azimuth/elevation. Returns a tuple (boolean, Reply),
+           where the first one describes if the command was executed correctly. As with
+           Rotctld, the rotator needs some time to actually get there."""
+        elevation = self.norm_el(elevation)
+        azimuth = self.norm_az(azimuth)
+
+        reply = await self.send_command(f"P {azimuth:3.1f} {elevation:2.1f}")
+        return reply.code == 0, reply
+
+    async def get_pos(self) -> Tuple[Optional[float], Optional[float]]:
+        """ Returns the antenna position. Returns a tuple: azimuth and elevation """
+        reply = await self.send_command("p")
+        try:
+            values = reply.values
+            return float(values["Azimuth"]), float(values["Elevation"])
+        except (KeyError, ValueError) as e:
+            logging.error("Could not parse position: %s: %s", reply, e)
+            return None, None
+
+    async def stop(self) -> Reply:
+        """ Tells the rotator to stop rotating immediately."""
+        return await self.send_command("S")
+
+    async def park(self) -> Reply:
+        """Tells the rotator to park itself. Some rotators don't support this operation."""
+        return await self.send_command("K")
+
+    async def capabilities(self) -> str:
+        """Attempts to get what the rotctld lib knows about this specific backend. Response
+           is very much rotctld dependent."""
+        reply = await self.send_command("1")
+        return "\n".join(reply.lines[1:])
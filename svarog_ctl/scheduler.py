@@ -0,0 +1,143 @@
+"""
+Plans passes of many satellites over several days, for a station with a single rotator.
+
+Passes of all sats are calculated in parallel (one process per CPU core). Then the overlaps
+are resolved: the rotator can follow only one sat at a time and needs some time to move
+from the LOS position of one pass to the AOS position of the next one. The result is
+a timeline of passes to track, plus the passes that had to be skipped and why.
+
+Only compute_passes needs orbit_predictor, numpy and the process pool, they're imported
+there, so the conflict resolution and the constants are cheap to import, e.g. by the
+command line parser.
+"""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from orbit_predictor.locations import Location
+    from svarog_ctl.passes import PlannedPass
+    from svarog_ctl.tle import Tle
+
+# Conflict resolution policies.
+POLICY_PRIORITY = "priority"            # higher priority sats first, then higher passes
+POLICY_MAX_ELEVATION = "max_elevation"  # higher passes first, regardless of the sat
+POLICIES = (POLICY_PRIORITY, POLICY_MAX_ELEVATION)
+
+# Default rotator slew rate (degrees per second) and extra time for the rotator to settle
+# before the next pass (seconds). Typical amateur rotators move at 2-6 degrees per second.
+SLEW_RATE = 3.0
+SETTLE_TIME = 5.0
+
+def _compute_sat_passes(args: tuple) -> List[PlannedPass]:
+    """Calculates all passes of a single sat. Runs in a worker process, so it gets only plain,
+       picklable values: (norad, name, TLE lines, observer's lat/lon/alt, start, end, mask)."""
+    # pylint: disable=import-outside-toplevel
+    from orbit_predictor.locations import Location
+    from orbit_predictor.sources import get_predictor_from_tle_lines
+    from svarog_ctl.passes import find_passes
+
+    norad, name, lines, (lat, lon, alt), start, end, min_elevation = args
+    pred = get_predictor_from_tle_lines(lines)
+    loc = Location('Observer', lat, lon, alt)
+    return find_passes(pred, loc, start, end, min_elevation, norad, name)
+
+def compute_passes(tles: Sequence[Tle], loc: Location, start: datetime, days: float,
+                   min_elevation: float = 0, workers: Optional[int] = None
+                   ) -> List[PlannedPass]:
+    """Calculates passes of all specified sats, between start and start + days, with maximum
+       elevation above min_elevation (degrees). Sats are spread over worker processes
+       (one per CPU core by default). Returns passes sorted by AOS."""
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    end = start + timedelta(days=days)
+    location = (loc.latitude_deg, loc.longitude_deg, loc.elevation_m)
+    jobs = [(t.norad, t.name, (t.line1, t.line2), location, start, end, min_elevation)
+            for t in tles]
+
+    begin = time.perf_counter()
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers <= 1:
+        results = [_compute_sat_passes(job) for job in jobs]
+    else:
+        from concurrent.futures import ProcessPoolExecutor # pylint: disable=import-outside-toplevel
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_compute_sat_passes, jobs))
+
+    passes = sorted((p for sat_passes in results for p in sat_passes), key=lambda p: p.aos)
+    logging.info("Calculated %d passes of %d sats over %.1f days in %.2fs (%d workers)",
+                 len(passes), len(jobs), days, time.perf_counter() - begin, max(workers, 1))
+    return passes
+
+def slew_time(az1: float, az2: float, rate: float = SLEW_RATE) -> float:
+    """Returns time (seconds) needed to turn the rotator from azimuth az1 to az2 (degrees),
+       the shorter way around. Passes start and end at the horizon, so elevation doesn't
+       need to move."""
+    diff = abs(az2 - az1) % 360
+    return min(diff, 360 - diff) / rate
+
+def _fits(prev: PlannedPass, nxt: PlannedPass, rate: float, settle: float) -> bool:
+    """Checks if the rotator can get from the end of prev to the start of nxt in time."""
+    gap = (nxt.aos - prev.los).total_seconds()
+    return gap >= slew_time(prev.los_az, nxt.aos_az, rate) + settle
+
+def resolve_conflicts(passes: Sequence[PlannedPass], policy: str = POLICY_MAX_ELEVATION,
+                      priorities: Optional[Dict[int, int]] = None, rate: float = SLEW_RATE,
+                      settle: float = SETTLE_TIME
+                      ) -> Tuple[List[PlannedPass], List[Tuple[PlannedPass, PlannedPass]]]:
+    """Picks passes to track with a single rotator. Passes are considered in the order of
+       importance (see POLICIES; priorities maps NORAD ID to a priority, higher is more
+       important, unlisted sats get 0) and each one is accepted if the rotator can get to
+       its AOS after the previous accepted pass and to the next accepted pass after its LOS.
+
+       Returns (selected, skipped). Selected passes are sorted by AOS. Skipped is a list of
+       (pass, the selected pass it conflicts with)."""
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy: {policy}, expected one of {', '.join(POLICIES)}")
+    priorities = priorities or {}
+
+    def importance(p: PlannedPass):
+        if policy == POLICY_PRIORITY:
+            return (-priorities.get(p.norad, 0), -p.max_elevation, p.aos)
+        return (-p.max_elevation, p.aos)
+
+    selected: List[PlannedPass] = []     # sorted by AOS
+    skipped = []
+    for p in sorted(passes, key=importance):
+        # Find where it would go in the timeline and check both neighbours.
+        i = bisect.bisect_left(selected, p.aos, key=lambda x: x.aos)
+        if i > 0 and not _fits(selected[i - 1], p, rate, settle):
+            skipped.append((p, selected[i - 1]))
+        elif i < len(selected) and not _fits(p, selected[i], rate, settle):
+            skipped.append((p, selected[i]))
+        else:
+            selected.insert(i, p)
+
+    skipped.sort(key=lambda x: x[0].aos)
+    return selected, skipped
+
+def format_timeline(selected: Sequence[PlannedPass],
+                    skipped: Sequence[Tuple[PlannedPass, PlannedPass]],
+                    zone=timezone.utc) -> str:
+    """Returns a human readable timeline: all passes sorted by AOS, the skipped ones
+       marked with the reason."""
+    entries = [(p, None) for p in selected] + list(skipped)
+    entries.sort(key=lambda x: x[0].aos)
+
+    lines = []
+    for p, conflict in entries:
+        line = (f"{p.aos.astimezone(zone):%Y-%m-%d %H:%M:%S} - "
+                f"{p.los.astimezone(zone):%H:%M:%S} {p.norad:6d} {p.name:24s} "
+                f"max el {p.max_elevation:4.1f}, az {p.aos_az:5.1f} -> {p.los_az:5.1f}")
+        if conflict is not None:
+            line = "  " + line + f"  SKIPPED, conflicts with {conflict.name or conflict.norad}"
+        else:
+            line = "* " + line
+        lines.append(line)
+    return "\n".join(lines)
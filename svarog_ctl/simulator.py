@@ -0,0 +1,299 @@
+"""
+simulator - local stand-in for rotctld, for testing and benchmarking without hardware.
+
+It listens on TCP and speaks the rotctld protocol subset svarog-ctl uses: P (set position),
+p (get position), S (stop), K (park), _ (model) and 1 (capabilities), in both the plain and
+the extended response ('+' prefix) flavour, also with long command names (\\set_pos etc.).
+
+Unlike the hamlib's dummy rotator, it tries to behave like real hardware: the antenna moves
+towards the target at limited azimuth and elevation slew rates, positions outside of the
+limits are rejected, replies are delayed by configurable latency (plus random jitter) as if
+sent over a slow network, and can be split into small fragments. The true antenna position
+is available from Simulator.position(), so the pointing error can be measured.
+
+Run it with:
+
+    python -m svarog_ctl.simulator --port 4533 --az-rate 3 --el-rate 3 --latency 0.02
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import NamedTuple, Optional, Tuple
+
+MODEL = "Svarog simulator"
+
+# Error codes, as in hamlib
+RIG_EINVAL = 1      # invalid parameter
+RIG_EPROTO = 8      # protocol error
+RIG_ENAVAIL = 11    # function not available
+
+# Long command names, as accepted by rotctld
+LONG_COMMANDS = {
+    "set_pos": "P",
+    "get_pos": "p",
+    "stop": "S",
+    "park": "K",
+    "get_info": "_",
+    "dump_caps": "1",
+}
+
+class _Motion(NamedTuple):
+    """Movement towards the target, started at start (monotonic clock) from az, el."""
+    start: float
+    az: float
+    el: float
+    target_az: float
+    target_el: float
+
+def _move(start: float, target: float, rate: Optional[float], elapsed: float) -> float:
+    """Position on a single axis after elapsed seconds of moving at rate (degrees per second,
+       None means instant)."""
+    if rate is None:
+        return target
+    dist = rate * elapsed
+    if abs(target - start) <= dist:
+        return target
+    return start + dist if target > start else start - dist
+
+class Simulator: # pylint: disable=too-many-instance-attributes
+    """Simulated rotator, served over TCP. Rates are in degrees per second (None means the
+       antenna moves instantly), latency and jitter in seconds, fragment is the maximum
+       number of bytes sent at once (0 sends whole replies)."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 4533,
+                 az_rate: Optional[float] = 3.0, el_rate: Optional[float] = 3.0,
+                 az_min: float = -180.0, az_max: float = 180.0,
+                 el_min: float = 0.0, el_max: float = 90.0,
+                 latency: float = 0.0, jitter: float = 0.0, fragment: int = 0,
+                 park: Tuple[float, float] = (0.0, 0.0), seed: Optional[int] = None):
+        self.host = host
+        self.port = port
+        self.az_rate = az_rate
+        self.el_rate = el_rate
+        self.az_min = az_min
+        self.az_max = az_max
+        self.el_min = el_min
+        self.el_max = el_max
+        self.latency = latency
+        self.jitter = jitter
+        self.fragment = fragment
+        self.park_pos = park
+
+        # Commands received, as (monotonic time, command) tuples.
+        self.commands = []
+
+        self._random = random.Random(seed)
+        az, el = self._clamp(*park)
+        self._motion = _Motion(time.monotonic(), az, el, az, el)
+        self._server = None
+        self._tasks = set()
+        self._loop = None
+        self._thread = None
+
+    def _clamp(self, az: float, el: float) -> Tuple[float, float]:
+        return (min(max(az, self.az_min), self.az_max), min(max(el, self.el_min), self.el_max))
+
+    def position(self, when: Optional[float] = None) -> Tuple[float, float]:
+        """Returns the antenna azimuth and elevation at when (monotonic clock, now by
+           default)."""
+        # A single read, so it's consistent even if read from another thread.
+        m = self._motion
+        elapsed = max(0.0, (time.monotonic() if when is None else when) - m.start)
+        return (_move(m.az, m.target_az, self.az_rate, elapsed),
+                _move(m.el, m.target_el, self.el_rate, elapsed))
+
+    def target(self) -> Tuple[float, float]:
+        """Returns the position the antenna is moving to."""
+        return self._motion.target_az, self._motion.target_el
+
+    def _set_target(self, az: float, el: float):
+        now = time.monotonic()
+        cur_az, cur_el = self.position(now)
+        self._motion = _Motion(now, cur_az, cur_el, az, el)
+
+    def capabilities(self) -> str:
+        """Returns capabilities dump, in rotctld format."""
+        return "\n".join([
+            "Caps dump for model:\t0",
+            f"Model name:\t\t{MODEL}",
+            "Mfg name:\t\tsvarog-ctl",
+            "Rot type:\t\tAz-El",
+            f"Min Azimuth:\t\t{self.az_min:.2f}",
+            f"Max Azimuth:\t\t{self.az_max:.2f}",
+            f"Min Elevation:\t\t{self.el_min:.2f}",
+            f"Max Elevation:\t\t{self.el_max:.2f}",
+            f"Azimuth rate:\t\t{self.az_rate if self.az_rate is not None else 'instant'}",
+            f"Elevation rate:\t\t{self.el_rate if self.el_rate is not None else 'instant'}"])
+
+    def execute(self, line: str) -> str:
+        """Executes a single command line and returns the reply, including the final
+           newline."""
+        extended = line.startswith("+")
+        args = line.lstrip("+").split()
+        if not args:
+            return ""
+        cmd = args[0]
+        if cmd.startswith("\\"):
+            cmd = LONG_COMMANDS.get(cmd[1:], cmd)
+        self.commands.append((time.monotonic(), cmd))
+
+        # In the extended protocol, the reply starts with the long command name.
+        header = next((k for k, v in LONG_COMMANDS.items() if v == cmd), cmd) + ":"
+        code = 0
+        values = []
+        if cmd == "P":
+            try:
+                az, el = float(args[1]), float(args[2])
+            except (IndexError, ValueError):
+                code = -RIG_EPROTO
+            else:
+                if self.az_min <= az <= self.az_max and self.el_min <= el <= self.el_max:
+                    self._set_target(az, el)
+                    header += f" {az:f} {el:f}"
+                else:
+                    code = -RIG_EINVAL
+        elif cmd == "p":
+            az, el = self.position()
+            values = [("Azimuth", f"{az:f}"), ("Elevation", f"{el:f}")]
+        elif cmd == "S":
+            self._set_target(*self.position())
+        elif cmd == "K":
+            self._set_target(*self._clamp(*self.park_pos))
+        elif cmd == "_":
+            values = [("Info", MODEL)]
+        elif cmd == "1":
+            values = [(None, self.capabilities())]
+        else:
+            code = -RIG_ENAVAIL
+
+        logging.debug("Received [%s], result %d", line, code)
+        if extended:
+            lines = [header] + [f"{k}: {v}" if k else v for k, v in values]
+            return "\n".join(lines + [f"RPRT {code}"]) + "\n"
+        if values:
+            return "\n".join(v for _, v in values) + "\n"
+        return f"RPRT {code}\n"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._tasks.add(asyncio.current_task())
+        # Commands are read as they come, replies wait in the queue till they're due, so
+        # the latency behaves like a network delay, not like a slow rotctld.
+        queue = asyncio.Queue()
+
+        async def send():
+            last_due = 0.0
+            while True:
+                due, data = await queue.get()
+                due = max(due, last_due)
+                last_due = due
+                await asyncio.sleep(max(0.0, due - time.monotonic()))
+                step = self.fragment or len(data)
+                for i in range(0, len(data), step):
+                    writer.write(data[i:i + step])
+                    await writer.drain()
+
+        sender = asyncio.ensure_future(send())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode().strip()
+                if line in ("q", "Q", "\\quit"):
+                    break
+                delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+                queue.put_nowait((time.monotonic() + delay, self.execute(line).encode()))
+        except (ConnectionError, asyncio.CancelledError):
+            # Client gone or the simulator is shutting down. The handler must not end
+            # cancelled, asyncio would log it as an error.
+            pass
+        finally:
+            sender.cancel()
+            writer.close()
+            self._tasks.discard(asyncio.current_task())
+
+    async def serve(self):
+        """Starts listening. If port is 0, a free port is picked and stored in port."""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logging.info("Simulated rotator listening on %s:%d", self.host, self.port)
+
+    async def shutdown(self):
+        """Stops listening and drops all connections."""
+        if self._server is not None:
+            self._server.close()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def start(self) -> "Simulator":
+        """Starts the simulator in a background thread, so it can be used by blocking
+           clients. Returns self."""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.serve(), self._loop).result()
+        return self
+
+    def stop(self):
+        """Stops the simulator started with start()."""
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    """Runs the simulator until interrupted."""
+    parser = argparse.ArgumentParser(description="Simulated rotctld, for testing without "
+                                     "hardware.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", "-t", default=4533, type=int, help="Port to listen on")
+    parser.add_argument("--az-rate", default=3.0, type=float,
+                        help="Azimuth slew rate in degrees per second (0 means instant)")
+    parser.add_argument("--el-rate", default=3.0, type=float,
+                        help="Elevation slew rate in degrees per second (0 means instant)")
+    parser.add_argument("--az-range", nargs=2, type=float, default=[-180.0, 180.0],
+                        metavar=("MIN", "MAX"), help="Azimuth range")
+    parser.add_argument("--el-range", nargs=2, type=float, default=[0.0, 90.0],
+                        metavar=("MIN", "MAX"), help="Elevation range")
+    parser.add_argument("--latency", default=0.0, type=float,
+                        help="Delay of every reply in seconds")
+    parser.add_argument("--jitter", default=0.0, type=float,
+                        help="Random extra delay of every reply, up to this many seconds")
+    parser.add_argument("--fragment", default=0, type=int,
+                        help="Send replies in fragments of this many bytes")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Log every command")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s %(levelname)7s: %(message)s', datefmt='%H:%M:%S')
+
+    sim = Simulator(args.host, args.port, args.az_rate or None, args.el_rate or None,
+                    args.az_range[0], args.az_range[1], args.el_range[0], args.el_range[1],
+                    args.latency, args.jitter, args.fragment)
+
+    async def run():
+        await sim.serve()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await sim.shutdown()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Streams rotator commands for a pass as it unfolds, instead of computing all of them up front.
+
+The pass is planned (trajectory.plan) on a preview: positions sampled with the same step,
+but at most PREVIEW_POINTS of them, spread evenly over the pass. That's enough to choose how
+the pass is mapped into the rotator's range and to time the pre-positioning command, and it
+takes the same time for a 10 minute LEO pass as for hours of drift of a GEO sat. The actual
+commands are then propagated a chunk at a time (passes.iter_pass) and mapped the same way
+(trajectory.follow). For the passes short enough to be previewed in full, they're the same
+as the ones trajectory.plan() would return for the whole pass.
+
+prefetch() runs the propagation in a worker thread, a bounded number of commands ahead of
+the tracking loop, so the loop never waits for them and memory use doesn't depend on the
+length of the pass.
+"""
+
+import math
+import queue
+import threading
+from datetime import datetime
+from typing import Iterable, Iterator, Optional, Tuple
+
+from orbit_predictor.locations import Location
+from orbit_predictor.predictors.base import CartesianPredictor
+
+from svarog_ctl import passes, trajectory
+
+# How many positions the pass is planned on, at most.
+PREVIEW_POINTS = 1000
+
+# How many commands prefetch() keeps ready.
+AHEAD = 64
+
+# Interval between commands (seconds).
+STEP = 5.0
+
+# How often the prefetch worker checks if it's still needed (seconds).
+_CHECK_INTERVAL = 0.5
+
+_DONE = object()
+
+def plan_pass(pred: CartesianPredictor, loc: Location, aos: datetime, los: datetime,
+              limits: trajectory.RotatorLimits, step: float = STEP,
+              current: Optional[Tuple[float, float]] = None) -> trajectory.Trajectory:
+    """Plans the trajectory for the pass on its preview (see the module description).
+       The positions of the returned trajectory are the preview, in rotator coordinates,
+       starting with the pre-positioning command."""
+    # pylint: disable=too-many-arguments
+    count = passes.sample_count((los - aos).total_seconds(), step)
+    stride = max(1, math.ceil(count / PREVIEW_POINTS))
+    preview = list(passes.iter_pass(pred, loc, aos, los, step, stride=stride))
+    return trajectory.plan(preview, limits, current)
+
+def stream_pass(pred: CartesianPredictor, loc: Location, aos: datetime, los: datetime,
+                limits: trajectory.RotatorLimits, traj: trajectory.Trajectory,
+                step: float = STEP) -> Iterator[list]:
+    """Generates rotator commands for the pass planned by plan_pass() (traj): the
+       pre-positioning one, then one every step seconds until LOS."""
+    # pylint: disable=too-many-arguments
+    if not traj.positions:
+        return
+    yield traj.positions[0]
+    yield from trajectory.follow(passes.iter_pass(pred, loc, aos, los, step), limits,
+                                 traj.mapping)
+
+def shift(positions: Iterable, delta) -> Iterator[list]:
+    """Moves the positions by delta (timedelta) back in time, lazily."""
+    return ([p[0] - delta, p[1], p[2]] for p in positions)
+
+def prefetch(positions: Iterable, ahead: int = AHEAD) -> Iterator:
+    """Iterates over positions, with up to ahead of them generated in advance by a worker
+       thread. Exceptions raised by the generator are raised by the iteration. When the
+       iteration is abandoned (closed or garbage collected), the worker stops."""
+    ready: queue.Queue = queue.Queue(maxsize=ahead)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=_CHECK_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def work():
+        try:
+            for item in positions:
+                if not put(item):
+                    return
+        except Exception as e: # pylint: disable=broad-except
+            put(e)
+            return
+        put(_DONE)
+
+    worker = threading.Thread(target=work, name="prefetch", daemon=True)
+    worker.start()
+    try:
+        for item in iter(ready.get, _DONE):
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,278 @@
+"""
+Telemetry of tracked passes: what the rotator was told to do and what it actually did.
+
+Every pass gets its own directory with two append-only files, one for the commands sent
+(planned time, intended position, round-trip time, status) and one for the polled antenna
+positions. Rows are buffered and written in blocks, so memory use doesn't grow with the
+length of the pass. Both files are regular NumPy .npy files with structured dtype, so they
+can be loaded with np.load() (and memory mapped), with each field being a column. The row
+count in the header is updated after every block, so the files are valid even if svarog-ctl
+is killed mid-pass.
+
+The recorded passes can be analyzed (summarize) and plotted (plot_charts) offline, also
+headless, with:
+
+    python -m svarog_ctl.telemetry DIRECTORY
+"""
+
+import argparse
+import logging
+import os
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from svarog_ctl.configuration import open_config
+from svarog_ctl.globalvars import CONFIG_DIRECTORY
+
+COMMANDS_FILE = "commands.npy"
+POSITIONS_FILE = "positions.npy"
+CHART_FILE = "tracking.png"
+
+# Times are unix timestamps (UTC), angles in degrees, round-trip times in seconds.
+COMMAND_DTYPE = np.dtype([('planned', 'f8'), ('sent', 'f8'), ('az', 'f8'), ('el', 'f8'),
+                          ('rtt', 'f4'), ('ok', '?')])
+POSITION_DTYPE = np.dtype([('time', 'f8'), ('az', 'f8'), ('el', 'f8'), ('rtt', 'f4')])
+
+# Rows kept in memory before they're written.
+BLOCK_ROWS = 256
+
+# Space reserved for the .npy header, so the row count can be updated in place.
+_HEADER_SIZE = 256
+
+# How far back (seconds) the intended track is searched when estimating the lag.
+MAX_LAG = 60.0
+
+def default_directory() -> str:
+    """Returns the default location of the telemetry: telemetry directory in the datadir
+       (see the config file)."""
+    cfg = open_config()
+    datadir = cfg['datadir'] if 'datadir' in cfg else CONFIG_DIRECTORY
+    return os.path.join(datadir, "telemetry")
+
+def pass_directory(norad: int, aos: datetime, base: Optional[str] = None) -> str:
+    """Returns directory for the telemetry of the pass."""
+    return os.path.join(base or default_directory(),
+                        f"{norad}-{aos.astimezone(timezone.utc):%Y%m%d-%H%M%S}")
+
+def _npy_header(dtype: np.dtype, rows: int) -> bytes:
+    """Returns version 1.0 .npy header, padded to _HEADER_SIZE bytes."""
+    header = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                   'shape': (rows,)})
+    # magic (6), version (2), header length (2), header and newline
+    header = header.ljust(_HEADER_SIZE - 10 - 1) + "\n"
+    return (np.lib.format.MAGIC_PREFIX + bytes([1, 0]) +
+            len(header).to_bytes(2, 'little') + header.encode('latin1'))
+
+class ColumnFile:
+    """Append-only .npy file of structured rows."""
+
+    def __init__(self, path: str, dtype: np.dtype):
+        self.dtype = dtype
+        self.rows = 0
+        self._buffer = []
+        self._file = open(path, "wb") # pylint: disable=consider-using-with
+        self._file.write(_npy_header(dtype, 0))
+        self._file.flush()
+
+    def append(self, row: tuple):
+        """Adds a row, written once the block is full."""
+        self._buffer.append(row)
+        if len(self._buffer) >= BLOCK_ROWS:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered rows and updates the row count."""
+        if self._buffer:
+            self._file.write(np.array(self._buffer, dtype=self.dtype).tobytes())
+            self.rows += len(self._buffer)
+            self._buffer = []
+            # Data first, then the header, so the header never claims more than is there.
+            self._file.seek(0)
+            self._file.write(_npy_header(self.dtype, self.rows))
+            self._file.seek(0, os.SEEK_END)
+        self._file.flush()
+
+    def close(self):
+        """Writes the buffered rows and closes the file."""
+        self.flush()
+        self._file.close()
+
+class TelemetryRecorder:
+    """Records telemetry of a single pass into directory."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._commands = ColumnFile(os.path.join(directory, COMMANDS_FILE), COMMAND_DTYPE)
+        self._positions = ColumnFile(os.path.join(directory, POSITIONS_FILE), POSITION_DTYPE)
+
+    def command(self, planned: datetime, sent: datetime, az: float, el: float, rtt: float,
+                ok: bool):
+        """Records a command sent to the rotator."""
+        self._commands.append((planned.timestamp(), sent.timestamp(), az, el, rtt, ok))
+
+    def position(self, when: datetime, az: Optional[float], el: Optional[float], rtt: float):
+        """Records polled antenna position, None if it couldn't be read."""
+        self._positions.append((when.timestamp(), np.nan if az is None else az,
+                                np.nan if el is None else el, rtt))
+
+    def flush(self):
+        """Writes everything recorded so far."""
+        self._commands.flush()
+        self._positions.flush()
+
+    def close(self):
+        """Writes everything and closes the files."""
+        self._commands.close()
+        self._positions.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class Telemetry(NamedTuple):
+    """Recorded telemetry of a pass, see COMMAND_DTYPE and POSITION_DTYPE."""
+    commands: np.ndarray
+    positions: np.ndarray
+
+def load(directory: str) -> Telemetry:
+    """Loads the recorded telemetry (memory mapped)."""
+    return Telemetry(np.load(os.path.join(directory, COMMANDS_FILE), mmap_mode='r'),
+                     np.load(os.path.join(directory, POSITIONS_FILE), mmap_mode='r'))
+
+class TrackingSummary(NamedTuple):
+    """Pointing accuracy of a tracked pass. Errors in degrees, times in seconds."""
+    positions: int              # polled positions taken into account
+    rms_error: float
+    max_error: float
+    mean_lag: float             # how far the antenna was behind the intended track
+    max_lag: float
+    commands: int
+    failed_commands: int
+    mean_rtt: float             # command round-trip time
+    max_rtt: float
+
+def _angle(az1, el1, az2, el2) -> np.ndarray:
+    """Angular distance (degrees) between directions."""
+    az1, el1, az2, el2 = (np.radians(x) for x in (az1, el1, az2, el2))
+    cos = np.sin(el1) * np.sin(el2) + np.cos(el1) * np.cos(el2) * np.cos(az1 - az2)
+    return np.degrees(np.arccos(np.clip(cos, -1.0, 1.0)))
+
+def intended(commands: np.ndarray, times: np.ndarray):
+    """Returns the intended azimuth and elevation at times: the commanded positions,
+       linearly interpolated."""
+    return (np.interp(times, commands['planned'], commands['az']),
+            np.interp(times, commands['planned'], commands['el']))
+
+def pointing_error(telemetry: Telemetry, start: Optional[float] = None):
+    """Returns times, pointing errors and lags of the polled positions after start (unix
+       timestamp, defaults to the first command, use AOS to leave out pre-positioning)."""
+    cmds = telemetry.commands
+    pos = telemetry.positions
+    if start is None:
+        start = cmds['planned'][0] if len(cmds) else -np.inf
+    end = cmds['planned'][-1] if len(cmds) else np.inf
+    pos = pos[(pos['time'] >= start) & (pos['time'] <= end) & ~np.isnan(pos['az'])]
+    if len(cmds) == 0 or len(pos) == 0:
+        return np.empty(0), np.empty(0), np.empty(0)
+
+    times = pos['time']
+    az, el = intended(cmds, times)
+    error = _angle(az, el, pos['az'], pos['el'])
+
+    # The lag is how long ago the antenna should have been where it actually is. Searched
+    # in chunks of positions, so long passes polled often don't need huge arrays.
+    back = np.arange(0.0, MAX_LAG, 0.1)
+    lag = np.empty(len(times))
+    for i in range(0, len(times), BLOCK_ROWS):
+        chunk = slice(i, i + BLOCK_ROWS)
+        past_az, past_el = intended(cmds, times[chunk, np.newaxis] - back[np.newaxis, :])
+        dist = _angle(past_az, past_el, pos['az'][chunk, np.newaxis],
+                      pos['el'][chunk, np.newaxis])
+        lag[chunk] = back[np.argmin(dist, axis=1)]
+    return times, error, lag
+
+def summarize(telemetry: Telemetry, start: Optional[float] = None) -> TrackingSummary:
+    """Returns pointing accuracy statistics of the pass, see pointing_error()."""
+    _, error, lag = pointing_error(telemetry, start)
+    cmds = telemetry.commands
+    rtt = cmds['rtt'][cmds['ok']] if len(cmds) else np.empty(0)
+
+    def stat(func, values):
+        return float(func(values)) if len(values) else float('nan')
+
+    return TrackingSummary(len(error), stat(lambda e: np.sqrt(np.mean(e ** 2)), error),
+                           stat(np.max, error), stat(np.mean, lag), stat(np.max, lag),
+                           len(cmds), int(np.count_nonzero(~cmds['ok'])) if len(cmds) else 0,
+                           stat(np.mean, rtt), stat(np.max, rtt))
+
+def plot_charts(directory: str, start: Optional[float] = None,
+                output: Optional[str] = None) -> Optional[str]:
+    """Renders intended vs actual azimuth and elevation, and the pointing error of the pass
+       recorded in directory, into a PNG file (tracking.png in the same directory by
+       default). Returns the file name, or None if matplotlib is not available."""
+    try:
+        # Optional dependency, only needed here.
+        import matplotlib # pylint: disable=import-outside-toplevel
+        matplotlib.use("Agg")
+        from matplotlib import pyplot as plt # pylint: disable=import-outside-toplevel
+    except ImportError:
+        logging.warning("matplotlib is not installed, can't plot the charts")
+        return None
+
+    telemetry = load(directory)
+    cmds, pos = telemetry.commands, telemetry.positions
+    times, error, _ = pointing_error(telemetry, start)
+    summary = summarize(telemetry, start)
+
+    def dates(ts):
+        return [datetime.fromtimestamp(t, timezone.utc) for t in ts]
+
+    fig, (ax_az, ax_el, ax_err) = plt.subplots(3, 1, sharex=True, figsize=(10, 9))
+    for ax, field in ((ax_az, 'az'), (ax_el, 'el')):
+        ax.plot(dates(cmds['planned']), cmds[field], label="intended")
+        ax.plot(dates(pos['time']), pos[field], ".", label="actual")
+        ax.set_ylabel("azimuth [deg]" if field == 'az' else "elevation [deg]")
+        ax.legend()
+        ax.grid(True)
+    ax_err.plot(dates(times), error)
+    ax_err.set_ylabel("pointing error [deg]")
+    ax_err.set_xlabel("time [UTC]")
+    ax_err.grid(True)
+    fig.suptitle(f"{os.path.basename(os.path.normpath(directory))}: RMS error "
+                 f"{summary.rms_error:.2f} deg, max {summary.max_error:.2f} deg, "
+                 f"lag {summary.mean_lag:.1f}s")
+
+    output = output or os.path.join(directory, CHART_FILE)
+    fig.savefig(output)
+    plt.close(fig)
+    return output
+
+def format_summary(summary: TrackingSummary) -> str:
+    """Returns the summary as human readable text."""
+    return (f"pointing error RMS {summary.rms_error:.2f} deg, max {summary.max_error:.2f} deg "
+            f"({summary.positions} positions), lag mean {summary.mean_lag:.1f}s, "
+            f"max {summary.max_lag:.1f}s, {summary.commands} commands "
+            f"({summary.failed_commands} failed), round-trip mean "
+            f"{summary.mean_rtt * 1000:.1f}ms, max {summary.max_rtt * 1000:.1f}ms")
+
+def main():
+    """Prints the summary and plots charts of the recorded passes."""
+    parser = argparse.ArgumentParser(description="Analyzes telemetry of tracked passes.")
+    parser.add_argument("directories", nargs="+", help="Telemetry directories of the passes")
+    parser.add_argument("--no-plot", action="store_true", help="Print the summary only")
+    args = parser.parse_args()
+
+    for directory in args.directories:
+        print(f"{directory}: {format_summary(summarize(load(directory)))}")
+        if not args.no_plot:
+            chart = plot_charts(directory)
+            if chart:
+                print(f"Charts saved to {chart}")
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,77 @@
 """
-Class representing TLE
+Class representing TLE, plus a streaming parser for files with many TLEs.
 """
 
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+# Orbital elements stored in every row of the catalog array (see tles_to_array). The name
+# field is added separately, as its size depends on the longest name in the catalog.
+TLE_FIELDS = [
+    ('norad', np.int32),
+    ('epoch', 'datetime64[us]'),     # UTC
+    ('inclination', np.float64),     # degrees
+    ('raan', np.float64),            # right ascension of the ascending node, degrees
+    ('eccentricity', np.float64),
+    ('arg_perigee', np.float64),     # argument of perigee, degrees
+    ('mean_anomaly', np.float64),    # degrees
+    ('mean_motion', np.float64),     # revolutions per day
+    ('bstar', np.float64),           # drag term, 1/earth radii
+    ('element_number', np.int32),
+]
+
+# Alpha-5 encoding of NORAD IDs above 99999: the first digit is replaced with a letter, A=10,
+# B=11, ... Z=33, with I and O skipped to avoid confusion with 1 and 0.
+_ALPHA5 = "ABCDEFGHJKLMNPQRSTUVWXYZ"
+
+def satnum_from_str(field: str) -> int:
+    """Parses the satellite number (NORAD ID) field of a TLE line, including Alpha-5 format
+       (e.g. 'E4427' is 144427)."""
+    field = field.strip()
+    if field[:1].isalpha():
+        return (_ALPHA5.index(field[0].upper()) + 10) * 10000 + int(field[1:])
+    return int(field)
+
+def satnum_to_str(norad: int) -> str:
+    """Formats NORAD ID as 5 character satellite number field of a TLE line, using Alpha-5
+       format for IDs above 99999."""
+    if norad < 100000:
+        return f"{norad:05d}"
+    if norad >= 340000:
+        raise ValueError(f"NORAD ID {norad} can't be expressed in TLE format")
+    return _ALPHA5[norad // 10000 - 10] + f"{norad % 10000:04d}"
+
+def _parse_epoch(field: str) -> datetime:
+    """Parses the TLE epoch (YYDDD.DDDDDDDD) into UTC timestamp."""
+    year = int(field[:2])
+    year += 2000 if year < 57 else 1900
+    return datetime(year, 1, 1, tzinfo=timezone.utc) + timedelta(days=float(field[2:]) - 1)
+
+def _parse_decimal_exp(field: str) -> float:
+    """Parses values with assumed leading decimal point and exponent, e.g. ' 19763-3'
+       or '+24973-4', as used by B* and second derivative of mean motion."""
+    field = field.strip()
+    if not field:
+        return 0.0
+    sign = -1.0 if field[0] == '-' else 1.0
+    field = field.lstrip('+-')
+    return sign * float("0." + field[:-2]) * 10 ** int(field[-2:])
+
 class Tle():
     """
     TLE class represents a TLE, Two Line Element that describes an Earth orbit.
     See https://en.wikipedia.org/wiki/Two-line_element_set
+
+    All orbital elements are parsed when the object is created. There are lots of these
+    objects around (one for every sat in the catalog), so they don't have __dict__.
     """
+    __slots__ = ('line1', 'line2', 'name', 'norad', 'id', 'epoch', 'inclination', 'raan',
+                 'eccentricity', 'arg_perigee', 'mean_anomaly', 'mean_motion', 'bstar',
+                 'element_number')
+
     def __init__(self, line1: str, line2: str, line0: str = ""):
         self.set_line1(line1)
         self.set_line2(line2)
@@ -14,18 +79,46 @@ class Tle():
 
         self.parse(line1, line2)
 
+    @classmethod
+    def from_row(cls, row: tuple, line1: str, line2: str, name: str) -> "Tle":
+        """Creates a TLE from values that were already parsed and validated before (e.g.
+           loaded from the compiled catalog), without parsing the lines again. row is
+           a tuple of values in TLE_FIELDS order."""
+        t = cls.__new__(cls)
+        t.line1 = line1
+        t.line2 = line2
+        t.name = name
+        (t.norad, epoch, t.inclination, t.raan, t.eccentricity, t.arg_perigee,
+         t.mean_anomaly, t.mean_motion, t.bstar, t.element_number) = row
+        t.epoch = epoch.replace(tzinfo=timezone.utc)
+        t.id = t.norad
+        return t
+
     def parse(self, line1: str, line2: str):
         """Parses the TLE lines"""
-        x1 = line1.split() # not used yet
+        x1 = line1.split()
         x2 = line2.split()
-        self.id = int(x2[1])
+        self.id = satnum_from_str(line2[2:7])
 
         if x1[0] != '1':
             raise ValueError(f"First line of TLE ({line1}) malformed. Expected to start with '1'")
         if x2[0] != '2':
             raise ValueError(f"Second line of TLE ({line2}) malformed. Expected to start with '2'")
 
-        # many more fields to parse here
+        # The fields are defined by their column positions, not by separators.
+        try:
+            self.epoch = _parse_epoch(line1[18:32])
+            self.bstar = _parse_decimal_exp(line1[53:61])
+            self.element_number = int(line1[64:68])
+
+            self.inclination = float(line2[8:16])
+            self.raan = float(line2[17:25])
+            self.eccentricity = float("0." + line2[26:33].strip())
+            self.arg_perigee = float(line2[34:42])
+            self.mean_anomaly = float(line2[43:51])
+            self.mean_motion = float(line2[52:63])
+        except ValueError as e:
+            raise ValueError(f"TLE ({line1}, {line2}) malformed: {e}") from e
 
     def get_id(self) -> int:
         """Returns NORAD ID of the satellite"""
@@ -44,7 +137,7 @@ class Tle():
         if tokens[0] != '1':
             raise ValueError(f"First line of TLE ({line}) malformed. Expected '1'")
 
-        self.norad = int(''.join(ch for ch in tokens[1] if ch.isdigit()))
+        self.norad = satnum_from_str(line[2:7])
 
         self.line1 = line
 
@@ -60,3 +153,118 @@ class Tle():
 
     def __repr__(self) -> str:
         return self.__str__()
+
+
+# Maps every byte to its weight in the TLE checksum: digits count as their value, minus signs
+# as 1, everything else as 0. With this, the checksum is computed without a python-level loop.
+_CHECKSUM_WEIGHTS = bytes(ch - ord('0') if ord('0') <= ch <= ord('9') else int(ch == ord('-'))
+                          for ch in range(256))
+
+def tles_to_array(tles: List[Tle], lines: bool = False) -> np.ndarray:
+    """Converts a list of TLEs into a NumPy structured array, one row per satellite, with
+       columns defined in TLE_FIELDS plus name. This allows vectorized queries over the
+       whole catalog, e.g. arr[arr['inclination'] > 97.0]. If lines is True, the original
+       TLE lines are included too."""
+    names = [t.name.encode("utf-8") for t in tles]
+    fields = TLE_FIELDS + [('name', f'S{max(map(len, names), default=1) or 1}')]
+    if lines:
+        line_len = max((len(t.line1) for t in tles), default=69)
+        line_len = max(line_len, max((len(t.line2) for t in tles), default=69))
+        fields += [('line1', f'S{line_len}'), ('line2', f'S{line_len}')]
+
+    arr = np.empty(len(tles), dtype=fields)
+    arr['norad'] = [t.norad for t in tles]
+    arr['epoch'] = [t.epoch.replace(tzinfo=None) for t in tles]
+    for field in ('inclination', 'raan', 'eccentricity', 'arg_perigee', 'mean_anomaly',
+                  'mean_motion', 'bstar', 'element_number'):
+        arr[field] = [getattr(t, field) for t in tles]
+    arr['name'] = names
+    if lines:
+        arr['line1'] = [t.line1.encode("ascii") for t in tles]
+        arr['line2'] = [t.line2.encode("ascii") for t in tles]
+    return arr
+
+def array_to_tles(arr: np.ndarray) -> List[Tle]:
+    """Converts an array created by tles_to_array(lines=True) back into a list of TLEs."""
+    field_names = [f[0] for f in TLE_FIELDS]
+    rows = arr[field_names].tolist()
+    return [Tle.from_row(row, line1.decode("ascii"), line2.decode("ascii"), name.decode("utf-8"))
+            for row, name, line1, line2 in zip(rows, arr['name'].tolist(),
+                                                arr['line1'].tolist(), arr['line2'].tolist())]
+
+def checksum(line: str) -> int:
+    """Computes the TLE checksum of a line: sum of all digits, with minus signs counted as 1,
+       modulo 10. The last character of the line (the checksum itself) is not included."""
+    return sum(line[:68].encode("ascii", "replace").translate(_CHECKSUM_WEIGHTS)) % 10
+
+def is_checksum_valid(line: str) -> bool:
+    """Checks if the last character of a TLE line matches the checksum of the line."""
+    return len(line) >= 69 and line[68].isdigit() and int(line[68]) == checksum(line)
+
+def _is_tle_line(line: str, marker: str) -> bool:
+    # A sat name could start with "1 " or "2 " too, but it would never be this long.
+    return line[:2] == marker + " " and len(line) >= 64
+
+def _log_error(lineno: int, msg: str):
+    logging.warning("Skipping malformed TLE at line %d: %s", lineno, msg)
+
+def iter_tles(lines: Iterable[str], validate: bool = True,
+              on_error: Optional[Callable[[int, str], None]] = None) -> Iterator[Tle]:
+    """Parses TLEs from a file object or any other iterable of lines and yields them one by
+       one, so even very large files are parsed in constant memory.
+
+       Both 2-line (no name) and 3-line formats are accepted, also mixed in a single file.
+       The parser synchronizes on the '1 ' and '2 ' line markers, so a blank line, a missing
+       name or a damaged entry affects only that single entry, not the following ones.
+
+       lines - file object or iterable of strings (trailing newlines are ignored)
+       validate - if True, entries with incorrect checksums are rejected
+       on_error - called with (line number, description) for every rejected entry. By default,
+                  rejected entries are logged as warnings."""
+
+    report = on_error if on_error is not None else _log_error
+    name = ""
+    line1 = None
+    line1_no = 0
+
+    for lineno, line in enumerate(lines, start=1):
+        line = line.rstrip()
+        if not line:
+            continue
+
+        if _is_tle_line(line, "1"):
+            if line1 is not None:
+                report(line1_no, "line 1 not followed by line 2")
+            line1 = line
+            line1_no = lineno
+            continue
+
+        if _is_tle_line(line, "2"):
+            if line1 is None:
+                report(lineno, "line 2 without preceding line 1")
+                name = ""
+                continue
+            try:
+                if validate and not is_checksum_valid(line1):
+                    raise ValueError(f"checksum mismatch in line 1: {line1}")
+                if validate and not is_checksum_valid(line):
+                    raise ValueError(f"checksum mismatch in line 2: {line}")
+                if line1[2:7] != line[2:7]:
+                    raise ValueError(f"satellite number differs in line 1 and 2: {line}")
+                t = Tle(line1, line, name)
+            except (ValueError, IndexError) as e:
+                report(line1_no, str(e))
+            else:
+                yield t
+            name = ""
+            line1 = None
+            continue
+
+        # Anything else is a name line. The 3LE format prefixes names with "0 ".
+        if line1 is not None:
+            report(line1_no, "line 1 not followed by line 2")
+            line1 = None
+        name = line[2:].strip() if line[:2] == "0 " else line.strip()
+
+    if line1 is not None:
+        report(line1_no, "line 1 not followed by line 2")
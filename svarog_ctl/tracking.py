@@ -0,0 +1,352 @@
+"""
+Tracking loop: sends the planned commands to the rotator on time and records the antenna's
+actual position.
+
+Commands are scheduled on the monotonic clock, so they're not affected by system clock
+adjustments during the pass. The loop sleeps exactly until the next deadline, either the
+next command or the next position poll, whichever comes first. Polling has its own cadence
+and never delays commands. How late every command was sent (relative to its planned time)
+is recorded, so the timing can be verified.
+
+Optionally, the loop is closed (see ClosedLoop): the polled positions are compared with the
+planned track, and the commands are corrected for how far behind the rotator is.
+"""
+
+import collections
+import itertools
+import logging
+import math
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Deque, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from svarog_ctl.trajectory import RotatorLimits
+
+# Default interval (seconds) between position polls.
+POLL_INTERVAL = 3.0
+
+# Closed loop defaults: weight of every polled position in the learned lag and offset, the
+# largest lead (seconds, also how far the lag is searched) and the largest correction of the
+# direction (degrees).
+LOOP_SMOOTHING = 0.1
+MAX_LEAD = 10.0
+MAX_CORRECTION = 2.0
+
+# Step (seconds) of the search for the antenna's lag behind the track.
+_LAG_STEP = 0.05
+
+# Command lateness values kept for the percentile (see TimingAccumulator).
+TIMING_SAMPLE = 1024
+
+class CommandTiming(NamedTuple):
+    """A command as it was sent."""
+    planned: datetime           # when it was supposed to be sent
+    az: float
+    el: float
+    lateness: float             # seconds after the planned time it was actually sent
+    ok: bool                    # was it accepted by the rotator?
+
+class TimingStats(NamedTuple):
+    """Statistics of command lateness, in seconds."""
+    count: int
+    mean: float
+    p95: float
+    max: float
+
+class TimingAccumulator:
+    """Accumulates command lateness for TimingStats, in bounded memory: the percentile is
+       taken from a uniform sample (reservoir) of at most size commands, which is all of them
+       for any pass with fewer commands."""
+
+    def __init__(self, size: int = TIMING_SAMPLE, seed: int = 0):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.sample: List[float] = []
+        self._size = size
+        self._random = random.Random(seed)
+
+    def add(self, lateness: float):
+        """Adds lateness (seconds) of a sent command."""
+        self.count += 1
+        self.total += lateness
+        self.max = max(self.max, lateness)
+        if len(self.sample) < self._size:
+            self.sample.append(lateness)
+        else:
+            i = self._random.randrange(self.count)
+            if i < self._size:
+                self.sample[i] = lateness
+
+    def stats(self) -> TimingStats:
+        """Returns the statistics of the commands added so far."""
+        if not self.count:
+            return TimingStats(0, 0.0, 0.0, 0.0)
+        late = sorted(self.sample)
+        p95 = late[min(len(late) - 1, math.ceil(0.95 * len(late)) - 1)]
+        return TimingStats(self.count, self.total / self.count, p95, self.max)
+
+class TrackingResult(NamedTuple):
+    """Outcome of tracking the pass. If it was recorded, the polled positions and the sent
+       commands are not kept here (the lists are empty), they're in the telemetry."""
+    actual: list                # [timestamp, az, el] of the polled antenna positions
+    commands: List[CommandTiming]
+    skipped: int                # commands that were already in the past when tracking began
+    lateness: TimingAccumulator
+
+    def timing(self) -> TimingStats:
+        """Returns lateness statistics of the sent commands."""
+        return self.lateness.stats()
+
+class ClosedLoop: # pylint: disable=too-many-instance-attributes
+    """Corrects the commands using the rotator's position feedback.
+
+       The rotator is told to go where the sat is at the planned time, so it's always a bit
+       behind: it needs time to get there, and then the sat moves on until the next command.
+       Each command is therefore aimed where the sat will be a lead time later. Every polled
+       position shows how long ago the sat was where the antenna is (the lag behind the
+       track), and so how far behind its own commands the rotator is (that lag plus the lead
+       it was given). That's the rotator's effective lag, learned over the pass (smoothed,
+       starting at half the interval between the commands) and used as the lead. Whatever is
+       left, the antenna being off the track (e.g. because of the rotator's dead band or
+       calibration), is learned the same way and corrected by a bias, bounded by
+       max_correction degrees.
+
+       The track is the commands themselves, learned as they're sent (see follow), so it has
+       the same resolution however long the pass is. Only the part around the current time
+       (max_lead seconds both ways) is kept.
+
+       positions - the planned commands known upfront (see track), in rotator coordinates
+       limits - the rotator's limits, the corrected commands are kept within them
+       smoothing - weight of every polled position in the learned values (0..1)"""
+
+    def __init__(self, positions: Iterable = (), limits: RotatorLimits = RotatorLimits(),
+                 smoothing: float = LOOP_SMOOTHING, max_lead: float = MAX_LEAD,
+                 max_correction: float = MAX_CORRECTION):
+        # pylint: disable=too-many-arguments
+        self.limits = limits
+        self.smoothing = smoothing
+        self.max_lead = max_lead
+        self.max_correction = max_correction
+        self._window: Deque[Tuple[float, float, float]] = collections.deque()
+        self._arrays: Optional[tuple] = None
+        self._added = 0
+        self._start: Optional[float] = None        # of the track
+        self.lag = 0.0
+        self._lead_limit = 0.0
+        self.offset = (0.0, 0.0)        # of the antenna from its commands, degrees
+        self.lags: List[float] = []     # measured lags behind the track (negative: ahead)
+        for pos in positions:
+            self.add(pos)
+
+    def add(self, pos):
+        """Adds the command (see track) to the end of the track. Commands planned before the
+           last one added are ignored."""
+        t = pos[0].timestamp()
+        if self._window and t <= self._window[-1][0]:
+            return
+        self._window.append((t, float(pos[1]), float(pos[2])))
+        self._arrays = None
+        self._added += 1
+        # The first command is the pre-positioning one, not a part of the track.
+        if self._added == 2:
+            self._start = t
+        elif self._added == 3:
+            interval = t - self._start
+            self.lag = interval / 2
+            # Aiming more than a command ahead doesn't help a rotator that can't keep up.
+            self._lead_limit = min(interval, self.max_lead)
+
+    def follow(self, positions: Iterable) -> Iterator:
+        """Yields the commands (positions, any iterable), adding them to the track ahead: a
+           command is yielded once the track is known max_lead seconds past it (or there are
+           no more commands), so it can be aimed ahead and the positions polled till it's
+           sent can be compared with the track."""
+        ahead: Deque = collections.deque()
+        for pos in positions:
+            self.add(pos)
+            ahead.append(pos)
+            # The lead depends on the interval between the commands of the track.
+            while self._added > 2 and (pos[0] - ahead[0][0]).total_seconds() >= self.max_lead:
+                yield ahead.popleft()
+        yield from ahead
+
+    def _forget(self, before: float):
+        # Keeps the last point before the time, so the track can be interpolated at it.
+        while len(self._window) > 2 and self._window[1][0] <= before:
+            self._window.popleft()
+            self._arrays = None
+
+    def _get_arrays(self) -> tuple:
+        if self._arrays is None:
+            times, az, el = (np.array(a) for a in zip(*self._window))
+            # Where the rotator swings around (see trajectory.plan), there's nothing to
+            # interpolate, so there are no corrections around these times.
+            jumps = np.abs(np.diff(az)) > 180.0
+            self._arrays = (times, az, el, times[:-1][jumps], times[1:][jumps])
+        return self._arrays
+
+    @property
+    def lead(self) -> float:
+        """How far ahead (seconds) the commands are aimed."""
+        return min(max(self.lag, 0.0), self._lead_limit)
+
+    @property
+    def bias(self) -> Tuple[float, float]:
+        """Correction (degrees) added to the commands."""
+        bound = self.max_correction
+        return tuple(min(max(-o, -bound), bound) for o in self.offset)
+
+    def _track(self, t):
+        times, az, el = self._get_arrays()[:3]
+        return np.interp(t, times, az), np.interp(t, times, el)
+
+    def _wrap_between(self, start: float, end: float) -> bool:
+        wraps_start, wraps_end = self._get_arrays()[3:]
+        return bool(np.any((wraps_end > start) & (wraps_start < end)))
+
+    def adjust(self, planned: datetime, az: float, el: float) -> Tuple[float, float]:
+        """Returns the corrected command planned for the specified time, to az and el."""
+        t = planned.timestamp()
+        # Neither this nor the positions polled after it are compared with an older track.
+        self._forget(t - self.max_lead)
+        lead = self.lead
+        if not self._window or self._wrap_between(t, t + lead):
+            return az, el
+        lead_az, lead_el = self._track(t + lead)
+        bias = self.bias
+        lim = self.limits
+        return (min(max(float(lead_az) + bias[0], lim.az_min), lim.az_max),
+                min(max(float(lead_el) + bias[1], lim.el_min), lim.el_max))
+
+    def update(self, when: datetime, az: Optional[float], el: Optional[float]):
+        """Learns from the antenna position polled at when (None if it couldn't be read)."""
+        t = when.timestamp()
+        self._forget(t - self.max_lead)
+        # Before the pass starts and after it ends, the antenna is not supposed to move.
+        if az is None or self._start is None or not self._start < t < self._window[-1][0] or \
+           self._wrap_between(t - self.max_lead, t + self.max_lead):
+            return
+
+        # Find when the sat was (or will be) where the antenna is.
+        offsets = np.arange(-self.max_lead, self.max_lead + _LAG_STEP / 2, _LAG_STEP)
+        track_az, track_el = self._track(t - offsets)
+        dist = np.hypot((track_az - az) * math.cos(math.radians(min(el, 90.0))), track_el - el)
+        i = int(np.argmin(dist))
+        lag = float(offsets[i])
+        self.lags.append(lag)
+
+        # Relative to the commands, which were aimed lead seconds ahead and corrected by
+        # the bias.
+        lead, bias = self.lead, self.bias
+        rate = self.smoothing
+        self.lag += rate * (lag + lead - self.lag)
+        self.offset = tuple(float(o + rate * (e - b - o)) for o, e, b in
+                            zip(self.offset, (az - track_az[i], el - track_el[i]), bias))
+
+def track(positions: Iterable, rotator, poll_interval: Optional[float] = POLL_INTERVAL,
+          clock: Callable[[], float] = time.monotonic,
+          sleep: Callable[[float], None] = time.sleep, recorder=None,
+          loop: Optional[ClosedLoop] = None) -> TrackingResult:
+    """Sends commands to the rotator at planned times and polls its position every
+       poll_interval seconds (None disables polling).
+
+       positions - commands: [timestamp (aware), azimuth, elevation], a list or any iterable
+                   (e.g. generated as the pass unfolds, see svarog_ctl.stream)
+       rotator - connected Rotctld instance (or anything with set_pos and get_pos)
+       recorder - telemetry.TelemetryRecorder, if the commands and positions are to be
+                  recorded. The planned positions are recorded, even if the commands sent
+                  were corrected, so the pointing error is measured against the sat. They're
+                  not kept in the result then, so memory use doesn't grow with the pass.
+       loop - ClosedLoop, if the commands are to be corrected using the polled positions,
+              it learns the track from the commands (see ClosedLoop.follow)
+
+       Returns once the last command is sent. Commands planned before the tracking began are
+       not sent, except the latest of them, which is where the antenna should be now."""
+    # pylint: disable=too-many-locals,too-many-arguments,too-many-statements,too-many-branches
+    # The only place where the wall clock is used, everything else is on the monotonic
+    # clock.
+    start_wall = datetime.now(timezone.utc)
+    start = clock()
+
+    def deadline(pos) -> float:
+        return start + (pos[0] - start_wall).total_seconds()
+
+    # Skip the commands in the past, but keep the latest one.
+    commands_left = iter(positions if loop is None else loop.follow(positions))
+    pos = next(commands_left, None)
+    upcoming = next(commands_left, None)
+    skipped = 0
+    while upcoming is not None and deadline(upcoming) <= start:
+        pos, upcoming = upcoming, next(commands_left, None)
+        skipped += 1
+    if skipped:
+        logging.info("Skipping %d commands planned before tracking began", skipped)
+    if upcoming is not None:
+        commands_left = itertools.chain([upcoming], commands_left)
+
+    # Not kept for the whole pass if it's recorded, only the lateness statistics are.
+    actual = []
+    commands = []
+    timing = TimingAccumulator()
+    next_poll = start if poll_interval else math.inf
+    poll_duration = 0.0
+
+    while pos is not None:
+        now = clock()
+        due = deadline(pos)
+        if due <= now:
+            lateness = now - due
+            az, el = loop.adjust(pos[0], pos[1], pos[2]) if loop is not None else pos[1:3]
+            try:
+                ok, resp = rotator.set_pos(az, el)
+            except ConnectionError as e:
+                # Rotctld keeps trying to reconnect with every command, don't lose the rest
+                # of the pass.
+                ok, resp = False, str(e)
+            if recorder is not None:
+                recorder.command(pos[0], start_wall + timedelta(seconds=now - start), pos[1],
+                                 pos[2], clock() - now, ok)
+            if not ok:
+                logging.warning("set_pos command failed. response=%s", resp)
+            logging.info("Sent command to move to az=%.1f, el=%.1f, %.1fms late", az, el,
+                         lateness * 1000)
+            timing.add(lateness)
+            if recorder is None:
+                commands.append(CommandTiming(pos[0], az, el, lateness, ok))
+            pos = next(commands_left, None)
+            continue
+
+        # Poll only if it's done before the next command is due (judging by the previous
+        # poll), otherwise it waits till after the command.
+        if next_poll <= now and now + poll_duration < due:
+            try:
+                az, el = rotator.get_pos()
+            except ConnectionError as e:
+                logging.error("Can't get rotator position: %s", e)
+                az, el = None, None
+            poll_duration = clock() - now
+            polled = datetime.now(timezone.utc)
+            if recorder is not None:
+                recorder.position(polled, az, el, poll_duration)
+            else:
+                actual.append([polled, az, el])
+            if loop is not None:
+                # The position was read somewhere during the round-trip, most likely in the
+                # middle of it.
+                loop.update(start_wall + timedelta(seconds=now + poll_duration / 2 - start),
+                            az, el)
+            logging.debug("Antenna at az=%s, el=%s, the next command in %.1fs", az, el,
+                          due - now)
+            # Keep the cadence, even if polling took a while.
+            next_poll += poll_interval * max(1, math.ceil((now - next_poll) / poll_interval))
+            continue
+
+        # A postponed poll doesn't wake the loop up, the command does.
+        wake_up = min(due, next_poll) if next_poll > now else due
+        sleep(wake_up - now)
+
+    return TrackingResult(actual, commands, skipped, timing)
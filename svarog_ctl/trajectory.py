@@ -0,0 +1,199 @@
+"""
+Plans the rotator trajectory for a pass, taking the rotator's kinematics into account.
+
+Positions returned by passes.get_pass() use the usual 0..360 azimuth. Rotators, however,
+have their own azimuth range, e.g. -180..180 (the cable wraps around south), 0..360 or even
+0..450 (overlap), and can't simply jump between its ends. A pass crossing the end of the
+range would make the rotator swing almost 360 degrees in the middle of the pass and lose
+the sat. Some rotators can also go beyond 90 degrees of elevation (flip), which lets them
+follow the pass "from the other side", with azimuth offset by 180 degrees.
+
+The planner tries all possible ways to map the pass into the rotator's range (azimuth
+offsets of 360 degrees, with or without flip) and picks the one that needs no wrap in the
+middle of the pass, can be followed at the rotator's slew rates and needs the least time
+to get to the starting point. It also adds a command to move the rotator to the starting
+point before AOS. The chosen mapping is returned too, so that further positions of the same
+pass can be mapped the same way, one at a time (see follow).
+"""
+
+import math
+from datetime import timedelta
+from typing import Iterable, Iterator, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# Extra time (seconds) for the rotator to get to the starting point before AOS.
+PREPOSITION_MARGIN = 10.0
+
+# How the pass can be mapped into the rotator's range.
+MODE_NORMAL = "normal"
+MODE_FLIP = "flip"                      # the whole pass from the other side
+MODE_OVER_THE_TOP = "over the top"      # elevation past 90 degrees for the other half
+
+class RotatorLimits(NamedTuple):
+    """Rotator kinematics. Azimuths are in the rotator's own range, e.g. -180..180
+       or 0..450 for rotators with overlap."""
+    az_min: float = -180.0
+    az_max: float = 180.0
+    el_min: float = 0.0
+    el_max: float = 90.0        # 180 for rotators capable of elevation flip
+    az_rate: float = 3.0        # degrees per second
+    el_rate: float = 3.0        # degrees per second
+
+    @property
+    def flip(self) -> bool:
+        """Can the rotator go over 90 degrees of elevation?"""
+        return self.el_max > 90.0
+
+    def slew_time(self, start: Tuple[float, float], end: Tuple[float, float]) -> float:
+        """Returns time (seconds) needed to move between (az, el) positions, in rotator
+           coordinates. Both axes move at the same time."""
+        return max(abs(end[0] - start[0]) / self.az_rate, abs(end[1] - start[1]) / self.el_rate)
+
+class Mapping(NamedTuple):
+    """How the pass is mapped into the rotator's range."""
+    mode: str                   # one of the MODE_* values
+    offset: float               # added to the continuous azimuth track, multiple of 360
+    first_az: float             # azimuth (0..360) of the first position of the pass
+    clipped: bool = False       # the track is clipped to a range narrower than 360 degrees
+
+class Trajectory(NamedTuple):
+    """Planned trajectory: commands in rotator coordinates, ready to be sent as they are."""
+    positions: list             # [timestamp, az, el], the first one is the pre-position
+    flipped: bool               # is elevation flip (above 90 degrees) used?
+    wraps: int                  # how many times the rotator has to swing around mid-pass
+    unreachable: list           # timestamps of commands that can't be reached in time
+    mapping: Optional[Mapping] = None
+
+class _Wrapper: # pylint: disable=too-few-public-methods
+    """Maps continuous azimuth track into the rotator range, one point at a time, starting
+       with the track as it is (its first point has to be in range). Whenever the track
+       leaves the range, it's wrapped by 360 degrees."""
+
+    def __init__(self, limits: RotatorLimits):
+        self.limits = limits
+        self.shift = 0.0
+        self.wraps = 0
+
+    def __call__(self, track_az: float) -> float:
+        limits = self.limits
+        az = track_az + self.shift
+        if az > limits.az_max or az < limits.az_min:
+            new_shift = self.shift - 360.0 * math.floor((az - limits.az_min) / 360.0)
+            if limits.az_min <= track_az + new_shift <= limits.az_max:
+                self.shift = new_shift
+                self.wraps += 1
+            az = min(max(track_az + self.shift, limits.az_min), limits.az_max)
+        return az
+
+def _fit(track: np.ndarray, limits: RotatorLimits) -> Tuple[np.ndarray, int]:
+    """Maps continuous azimuth track into the rotator range, see _Wrapper. Returns the
+       mapped track and number of wraps."""
+    wrapper = _Wrapper(limits)
+    result = np.array([wrapper(az) for az in track.tolist()], dtype=float)
+    return result, wrapper.wraps
+
+def _unreachable(times: np.ndarray, az: np.ndarray, el: np.ndarray,
+                 limits: RotatorLimits) -> np.ndarray:
+    """Returns indexes of commands that can't be reached from the previous one in time."""
+    dt = np.diff(times)
+    slew = np.maximum(np.abs(np.diff(az)) / limits.az_rate, np.abs(np.diff(el)) / limits.el_rate)
+    # A small tolerance, so rounding doesn't make exactly reachable points unreachable.
+    return np.flatnonzero(slew > dt + 1e-6) + 1
+
+def plan(positions: list, limits: RotatorLimits = RotatorLimits(),
+         current: Optional[Tuple[float, float]] = None) -> Trajectory:
+    """Plans rotator trajectory for the positions (list of [timestamp, az, el], as returned
+       by passes.get_pass) and the rotator with specified limits. current is the rotator's
+       position before the pass (in rotator coordinates), if known. It's used to pick the
+       trajectory that's the quickest to get to and to time the pre-positioning command."""
+    # pylint: disable=too-many-locals
+    if not positions:
+        return Trajectory([], False, 0, [])
+
+    start = positions[0][0]
+    times = np.array([(p[0] - start).total_seconds() for p in positions])
+    az = np.array([p[1] for p in positions], dtype=float)
+    el = np.array([p[2] for p in positions], dtype=float)
+    track = np.degrees(np.unwrap(np.radians(az)))
+
+    modes = [(MODE_NORMAL, track, el)]
+    if limits.flip:
+        # The whole pass from the other side...
+        modes.append((MODE_FLIP, track + 180.0, 180.0 - el))
+        # ...or over the top: the antenna stays around the AOS azimuth and elevation goes
+        # past 90 degrees for the other half of the pass. For passes close to zenith, this
+        # avoids the fast azimuth swing at the culmination.
+        other_side = np.abs((az - az[0] + 180.0) % 360.0 - 180.0) > 90.0
+        over_az = np.where(other_side, az + 180.0, az)
+        over_el = np.where(other_side, 180.0 - el, el)
+        modes.append((MODE_OVER_THE_TOP, np.degrees(np.unwrap(np.radians(over_az))), over_el))
+
+    best = None
+    best_score = None
+    for mode, mode_az, mode_el in modes:
+        flipped = mode != MODE_NORMAL
+        mode_el = np.clip(mode_el, limits.el_min, limits.el_max)
+        # Every offset of 360 degrees that puts the first point within the range.
+        first = mode_az[0]
+        k_min = math.ceil((limits.az_min - first) / 360.0)
+        k_max = math.floor((limits.az_max - first) / 360.0)
+        for k in range(k_min, k_max + 1):
+            cand_az, wraps = _fit(mode_az + 360.0 * k, limits)
+            unreachable = _unreachable(times, cand_az, mode_el, limits)
+            preposition = (limits.slew_time(current, (cand_az[0], mode_el[0]))
+                           if current is not None else 0.0)
+            # Prefer no wraps, then no lagging behind, then the quickest to get to.
+            score = (wraps, len(unreachable), preposition, flipped)
+            if best_score is None or score < best_score:
+                best_score = score
+                best = (flipped, cand_az, mode_el, wraps, unreachable,
+                        Mapping(mode, 360.0 * k, float(az[0])))
+
+    if best is None:
+        # Range narrower than 360 degrees and the first point is outside. Just get as close
+        # as possible.
+        cand_az, wraps = _fit(np.clip(track, limits.az_min, limits.az_max), limits)
+        mode_el = np.clip(el, limits.el_min, limits.el_max)
+        best = (False, cand_az, mode_el, wraps, _unreachable(times, cand_az, mode_el, limits),
+                Mapping(MODE_NORMAL, 0.0, float(az[0]), clipped=True))
+
+    flipped, cand_az, cand_el, wraps, unreachable, mapping = best
+
+    # Get to the starting point before the pass begins. If the current position is not
+    # known, assume the worst case.
+    if current is not None:
+        lead = limits.slew_time(current, (cand_az[0], cand_el[0]))
+    else:
+        lead = max((limits.az_max - limits.az_min) / limits.az_rate,
+                   (limits.el_max - limits.el_min) / limits.el_rate)
+    lead += PREPOSITION_MARGIN
+
+    planned = [[start - timedelta(seconds=lead), float(cand_az[0]), float(cand_el[0])]]
+    planned += [[p[0], a, e] for p, a, e in zip(positions, cand_az.tolist(), cand_el.tolist())]
+    return Trajectory(planned, flipped, wraps, [positions[i][0] for i in unreachable], mapping)
+
+def follow(positions: Iterable, limits: RotatorLimits, mapping: Mapping) -> Iterator[list]:
+    """Maps positions of the pass ([timestamp, az, el], e.g. generated by
+       passes.iter_pass) into the rotator's range, one at a time, the way plan() did with
+       mapping. They have to start with the same position as the ones given to plan(), then
+       the result is the same, without the whole pass being held in memory."""
+    wrapper = _Wrapper(limits)
+    prev = None
+    track = 0.0
+    for t, az, el in positions:
+        if mapping.mode == MODE_FLIP or (mapping.mode == MODE_OVER_THE_TOP and
+                                         abs((az - mapping.first_az + 180.0) % 360.0 - 180.0)
+                                         > 90.0):
+            az, el = az + 180.0, 180.0 - el
+        if prev is None:
+            track = az
+        else:
+            # Continuous track, as np.unwrap would make it.
+            diff = (az - prev + 180.0) % 360.0 - 180.0
+            track += 180.0 if diff == -180.0 and az > prev else diff
+        prev = az
+        mapped = track + mapping.offset
+        if mapping.clipped:
+            mapped = min(max(mapped, limits.az_min), limits.az_max)
+        yield [t, wrapper(mapped), min(max(el, limits.el_min), limits.el_max)]
@@ -0,0 +1,87 @@
+from svarog_ctl import orbitdb
+from svarog_ctl.archive import TleArchive
+from svarog_ctl.tle import Tle, checksum
+from datetime import datetime, timezone
+import os
+import tempfile
+import unittest
+
+LINE1 = "1 44427U 98067QM  21192.54020985  .00022355  00000-0  19763-3 0  999"
+LINE2 = "2 44427  51.6376 177.8799 0003618 359.5888  93.1405 15.68562202115256"
+
+def make_tle(day: float) -> Tle:
+    """Returns KRAKSAT TLE with epoch set to specified day of 2021."""
+    line1 = LINE1[:20] + f"{day:012.8f}" + LINE1[32:]
+    return Tle(line1 + str(checksum(line1)), LINE2, "KRAKSAT")
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._dir.name, "history")
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_dedup(self):
+        archive = TleArchive(self._path)
+        self.assertEqual(archive.add([make_tle(190.5), make_tle(192.5)]), 2)
+
+        # The same data, downloaded again. Nothing should be added.
+        self.assertEqual(archive.add([make_tle(190.5), make_tle(192.5)]), 0)
+
+        # One new TLE, one older that wasn't seen before, one duplicate.
+        self.assertEqual(archive.add([make_tle(193.5), make_tle(191.5), make_tle(190.5)]), 2)
+
+        # A fresh instance should see the same data, sorted by epoch.
+        archive = TleArchive(self._path)
+        self.assertEqual(archive.add([make_tle(193.5)]), 0)
+        days = [t.epoch.timetuple().tm_yday for t in archive.get(44427)]
+        self.assertEqual(days, [190, 191, 192, 193])
+        self.assertEqual(archive.get(12345), [])
+
+    def test_closest(self):
+        archive = TleArchive(self._path)
+        archive.add([make_tle(190.5), make_tle(192.5), make_tle(200.5)])
+
+        def closest_day(when):
+            return archive.closest(44427, when).epoch.timetuple().tm_yday
+
+        self.assertEqual(closest_day(datetime(2021, 1, 1)), 190)
+        self.assertEqual(closest_day(datetime(2021, 7, 11, 6, 0, tzinfo=timezone.utc)), 192)
+        self.assertEqual(closest_day(datetime(2021, 7, 15)), 192)
+        self.assertEqual(closest_day(datetime(2021, 7, 17)), 200)
+        self.assertEqual(closest_day(datetime(2022, 1, 1)), 200)
+        self.assertIsNone(archive.closest(12345, datetime(2021, 7, 17)))
+
+    def test_orbitdb(self):
+        """The database archives every TLE version it parses and uses it for past passes."""
+        tle_dir = os.path.join(self._dir.name, "tle")
+        os.makedirs(tle_dir)
+        path = os.path.join(tle_dir, "sats.txt")
+
+        for day in (190.5, 200.5):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(str(make_tle(day)) + "\n")
+            db = orbitdb.OrbitDatabase(urls=["file://sats.txt"], datadir=self._dir.name,
+                                       archive=True)
+            db.parse_tlebulk(path)
+
+        # The database knows only the current TLE, but the archive has both.
+        self.assertEqual(db.get_norad(44427).epoch.timetuple().tm_yday, 200)
+        pred = db.get_predictor("KRAKSAT", when=datetime(2021, 7, 10))
+        self.assertEqual(pred.tle.lines[0][20:32], "190.50000000")
+        pred = db.get_predictor("KRAKSAT")
+        self.assertEqual(pred.tle.lines[0][20:32], "200.50000000")
+
+    def test_opt_in(self):
+        """Without being asked for, nothing is archived."""
+        tle_dir = os.path.join(self._dir.name, "tle")
+        os.makedirs(tle_dir)
+        path = os.path.join(tle_dir, "sats.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(str(make_tle(190.5)) + "\n")
+        db = orbitdb.OrbitDatabase(urls=["file://sats.txt"], datadir=self._dir.name)
+        db.parse_tlebulk(path)
+        self.assertIsNone(db.archive)
+        self.assertFalse(os.path.exists(os.path.join(tle_dir, "history")))
@@ -0,0 +1,42 @@
+from svarog_ctl import benchmark
+from svarog_ctl.tle import iter_tles
+import json
+import unittest
+
+class BenchmarkTest(unittest.TestCase):
+
+    def test_synthetic_catalog(self):
+        errors = []
+        tles = list(iter_tles(benchmark.synthetic_catalog(500),
+                              on_error=lambda lineno, msg: errors.append(msg)))
+        self.assertEqual(errors, [])
+        self.assertEqual(len(tles), 500)
+        self.assertEqual(len({t.norad for t in tles}), 500)
+        self.assertEqual(len({t.raan for t in tles}), 500)
+        self.assertEqual(tles[0].mean_motion, tles[-1].mean_motion)
+
+    def test_measure(self):
+        calls = []
+        result = benchmark.measure("sleep", lambda: calls.append("run"), ops=4, repeat=3,
+                                   setup=lambda: calls.append("setup"))
+        self.assertEqual(calls, ["setup", "run"] * 3)
+        self.assertLessEqual(result.best, result.median)
+        self.assertAlmostEqual(result.per_op, result.best / 4)
+
+    def test_run(self):
+        results = benchmark.run(["distance", "rotctld"], quick=True)
+        # Stored as JSON.
+        results = json.loads(json.dumps(results))
+        self.assertEqual([r["name"] for r in results["results"]],
+                         ["passes.distance", "rotctld.get_pos", "rotctld.set_pos"])
+        self.assertEqual(results["results"][0]["ops"],
+                         benchmark.DISTANCE_CALLS // benchmark.QUICK_FACTOR)
+        self.assertTrue(results["quick"])
+
+        slower = json.loads(json.dumps(results))
+        slower["results"][0]["per_op"] *= 2
+        del slower["results"][1]
+        comparison = benchmark.compare(slower, results)
+        self.assertEqual([c.name for c in comparison], ["passes.distance", "rotctld.set_pos"])
+        self.assertAlmostEqual(comparison[0].ratio, 2.0)
+        self.assertAlmostEqual(comparison[1].ratio, 1.0)
@@ -0,0 +1,68 @@
+from svarog_ctl import catalog, orbitdb
+import os
+import tempfile
+import unittest
+
+TLES = """NOAA 15
+1 25338U 98030A   19351.71640046 +.00000015 +00000-0 +24973-4 0  9993
+2 25338 098.7340 012.5392 0011411 075.8229 284.4218 14.25943731122932
+KRAKSAT
+1 44427U 98067QM  21192.54020985  .00022355  00000-0  19763-3 0  9995
+2 44427  51.6376 177.8799 0003618 359.5888  93.1405 15.68562202115256
+"""
+
+class CatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._tle_dir = os.path.join(self._dir.name, "tle")
+        os.makedirs(self._tle_dir)
+        self._path = os.path.join(self._tle_dir, "sample.txt")
+        with open(self._path, "w", encoding="utf-8") as f:
+            f.write(TLES)
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_catalog_created(self):
+        # There's no catalog before the file is parsed for the first time.
+        self.assertIsNone(catalog.load_catalog(self._path))
+
+        db = orbitdb.OrbitDatabase(urls=["file://sample.txt"], datadir=self._dir.name)
+        db.refresh_urls()
+        self.assertEqual(db.count(), 2)
+        self.assertTrue(os.path.exists(catalog.catalog_path(self._path)))
+
+        tles = catalog.load_catalog(self._path)
+        self.assertEqual(len(tles), 2)
+        self.assertEqual(tles[0].name, "NOAA 15")
+        self.assertEqual(tles[0].norad, 25338)
+        self.assertEqual(tles[1].line1, db.get_name("KRAKSAT").line1)
+        self.assertEqual(tles[1].line2, db.get_name("KRAKSAT").line2)
+
+    def test_catalog_used(self):
+        db = orbitdb.OrbitDatabase(urls=["file://sample.txt"], datadir=self._dir.name)
+        db.refresh_urls()
+
+        # Second instance should get exactly the same data, this time from the catalog.
+        db2 = orbitdb.OrbitDatabase(urls=["file://sample.txt"], datadir=self._dir.name)
+        db2.refresh_urls()
+        self.assertEqual(db2.count(), 2)
+        self.assertEqual(db2.get_norad(25338).name, "NOAA 15")
+        self.assertEqual(db2.get_name_by_norad(44427), "KRAKSAT")
+        self.assertEqual(str(db2.get_norad(44427)), str(db.get_norad(44427)))
+
+    def test_catalog_stale(self):
+        db = orbitdb.OrbitDatabase(urls=["file://sample.txt"], datadir=self._dir.name)
+        db.refresh_urls()
+        self.assertIsNotNone(catalog.load_catalog(self._path))
+
+        # Once the text file changes, the catalog must not be used anymore.
+        with open(self._path, "w", encoding="utf-8") as f:
+            f.write(TLES[:TLES.find("KRAKSAT")])
+        self.assertIsNone(catalog.load_catalog(self._path))
+
+        db2 = orbitdb.OrbitDatabase(urls=["file://sample.txt"], datadir=self._dir.name)
+        db2.refresh_urls()
+        self.assertEqual(db2.count(), 1)
+        self.assertEqual(len(catalog.load_catalog(self._path)), 1)
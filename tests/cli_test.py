@@ -0,0 +1,67 @@
+from svarog_ctl import orbitdb, passdb, utils
+from tests.daemon_test import recent
+from tests.scheduler_test import KRAKSAT, NOAA15
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class CliTest(unittest.TestCase):
+    """Runs svarog_ctl.py offline, with orbital data already downloaded into a temporary
+       datadir."""
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        config_dir = os.path.join(self._dir.name, "config")
+        os.makedirs(config_dir)
+        with open(os.path.join(config_dir, "config.yml"), "w", encoding="utf-8") as f:
+            f.write(f"datadir: {self._dir.name}\nlogging:\n  file: stdout\n")
+        tle_dir = os.path.join(self._dir.name, "tle")
+        os.makedirs(tle_dir)
+        # Fresh, so it's not downloaded again.
+        with open(os.path.join(tle_dir, utils.url_to_filename(orbitdb.TLE_SOURCES[0])), "w",
+                  encoding="utf-8") as f:
+            for t in (recent(KRAKSAT), recent(NOAA15)):
+                f.write(f"{t.get_name()}\n{t.line1}\n{t.line2}\n")
+        self._env = dict(os.environ, SVAROG_CONFIG_DIR=config_dir)
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def run_cli(self, *args):
+        return subprocess.run([sys.executable, "svarog_ctl.py", "--lat", "53.35", "--lon", "18.53"]
+                              + list(args), capture_output=True, text=True, cwd=ROOT,
+                              env=self._env, check=False)
+
+    def test_schedule_missing_sat(self):
+        result = self.run_cli("--schedule", "1", "--sats", "25338,12345")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("No orbital data for sat 12345, skipped", result.stderr)
+        self.assertIn("NOAA 15", result.stdout)
+
+        result = self.run_cli("--schedule", "1", "--sats", "12345")
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("ERROR: No orbital data", result.stdout)
+        self.assertNotIn("Traceback", result.stderr)
+
+    def test_pass_beyond_cache(self):
+        """A pass further ahead than the pass database caches is still found."""
+        when = datetime.now(timezone.utc) + timedelta(days=passdb.CACHE_DAYS + 2)
+        result = self.run_cli("--satid", "25338", "--time", when.isoformat(), "--dry-run",
+                              "--format", "jsonl")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        rows = [json.loads(line) for line in result.stdout.splitlines() if line.startswith("{")]
+        self.assertGreater(len(rows), 10)
+        self.assertGreater(rows[-1]["time"], when.isoformat())
+
+    def test_dry_run_npy_stdout(self):
+        result = self.run_cli("--satid", "25338", "--dry-run", "--format", "npy")
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("ERROR: The npy format can't be written to stdout", result.stderr)
+        self.assertNotIn("ERROR", result.stdout)
+        self.assertNotIn("Traceback", result.stderr)
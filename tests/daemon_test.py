@@ -0,0 +1,168 @@
+from svarog_ctl import daemon, passdb, telemetry, tle
+from svarog_ctl.orbitdb import OrbitDatabase
+from svarog_ctl.passes import PlannedPass
+from svarog_ctl.rotctld import Rotctld
+from svarog_ctl.simulator import Simulator
+from tests.scheduler_test import KRAKSAT, NOAA15
+from tests.tracking_test import make_positions
+from orbit_predictor.locations import Location
+from datetime import datetime, timezone
+from unittest import mock
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+DATE = datetime(2021, 7, 14, 0, 0, 0, tzinfo=timezone.utc)
+
+def recent(t: tle.Tle) -> tle.Tle:
+    """Returns the same TLE, with epoch moved to now, so the passes can be tracked for real."""
+    now = datetime.now(timezone.utc)
+    day = (now - datetime(now.year, 1, 1, tzinfo=timezone.utc)).total_seconds() / 86400 + 1
+    line1 = t.line1[:18] + f"{now.year % 100:02d}{day:012.8f}" + t.line1[32:68]
+    return tle.Tle(line1 + str(tle.checksum(line1 + "0")), t.line2, t.get_name())
+
+class DaemonTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._db = OrbitDatabase(urls=[], datadir=self._dir.name, archive=False)
+        self._loc = Location('Gdansk', 53.35, 18.53, 120)
+        self._socket = os.path.join(self._dir.name, daemon.SOCKET_FILE)
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def make_daemon(self, sats, rotator=None, **kwargs):
+        return daemon.Daemon(self._db, self._loc, rotator, sats,
+                             pass_db_path=os.path.join(self._dir.name, passdb.PASSDB_FILE),
+                             telemetry_dir=os.path.join(self._dir.name, "telemetry"), **kwargs)
+
+    def test_next_pass(self):
+        self._db.add(KRAKSAT)
+        self._db.add(NOAA15)
+        # Sats with no orbital data are left out.
+        svc = self.make_daemon([25338, 44427, 12345])
+        self.assertEqual(svc.sats(), [25338, 44427])
+
+        pass_db = passdb.PassDatabase(os.path.join(self._dir.name, "expected.sqlite"))
+        noaa = pass_db.get_next_pass(NOAA15, self._loc, DATE, 0)
+        kraksat = pass_db.get_next_pass(KRAKSAT, self._loc, DATE, 0)
+        pass_db.close()
+        self.assertEqual(svc.next_pass(DATE), min(noaa, kraksat, key=lambda p: p.aos))
+
+        svc.remove(44427)
+        self.assertEqual(svc.next_pass(DATE), noaa)
+        svc.remove(25338)
+        self.assertIsNone(svc.next_pass(DATE))
+
+        with self.assertRaises(ValueError):
+            svc.add(12345)
+        with self.assertRaises(ValueError):
+            svc.remove(25338)
+
+    def test_refresh(self):
+        """The orbital data is downloaded without the lock, the passes are looked up again only
+           if it changed."""
+        self._db.add(NOAA15)
+        svc = self.make_daemon([25338])
+        updated = recent(NOAA15)
+        fetched = []
+        checked = threading.Event()
+
+        def fetch_urls():
+            fetched.append(svc._lock.locked())
+            if len(fetched) == 3:
+                checked.wait(5)
+                svc.stop()
+            return [NOAA15] if len(fetched) < 3 else [updated]
+
+        with mock.patch.object(daemon, "REFRESH_CHECK", 0.01), \
+             mock.patch.object(self._db, "fetch_urls", fetch_urls):
+            svc._changed.clear()
+            refresh = threading.Thread(target=svc._refresh_loop)
+            refresh.start()
+            for _ in range(100):
+                if len(fetched) == 3:
+                    break
+                time.sleep(0.01)
+            # The same TLEs twice, the third refresh is waiting.
+            self.assertFalse(svc._changed.is_set())
+            checked.set()
+            refresh.join(5)
+        self.assertEqual(fetched, [False] * 3)
+        self.assertTrue(svc._changed.is_set())
+        self.assertEqual(self._db.get_norad(25338), updated)
+
+    def test_control(self):
+        self._db.add(recent(NOAA15))
+        self._db.add(recent(KRAKSAT))
+        with Simulator(port=0, az_rate=None, el_rate=None) as sim:
+            ctl = Rotctld("127.0.0.1", sim.port)
+            svc = self.make_daemon([25338], ctl, socket_path=self._socket)
+            runner = threading.Thread(target=svc.run)
+            runner.start()
+            try:
+                # The daemon is waiting for the next pass.
+                for _ in range(100):
+                    if svc.upcoming is not None:
+                        break
+                    time.sleep(0.05)
+                self.assertEqual(svc.state, daemon.STATE_WAITING)
+                self.assertTrue(ctl.connected())
+
+                def send(cmd):
+                    return daemon.send_command(self._socket, cmd)
+
+                self.assertEqual(send("list"), "25338 NOAA 15\nOK")
+                self.assertTrue(send("next").startswith("25338 NOAA 15 "))
+                self.assertEqual(send("add 44427"), "OK")
+                self.assertEqual(send("list"), "25338 NOAA 15\n44427 KRAKSAT\nOK")
+                self.assertEqual(send("remove 25338"), "OK")
+                self.assertEqual(send("add 12345"), "ERROR No orbital data for sat 12345")
+                self.assertEqual(send("remove"), "ERROR Usage: remove NORAD")
+                self.assertEqual(send("fly"), "ERROR Unknown command: fly")
+                status = send("status")
+                self.assertIn("state: waiting", status)
+                self.assertIn("rotctld: connected, 1 connects", status)
+
+                # The pass is looked up again after the change.
+                for _ in range(100):
+                    if svc.upcoming is not None and svc.upcoming.norad == 44427:
+                        break
+                    time.sleep(0.05)
+                self.assertEqual(svc.upcoming.norad, 44427)
+            finally:
+                svc.stop()
+                runner.join(5)
+            ctl.close()
+
+        self.assertFalse(runner.is_alive())
+        self.assertFalse(os.path.exists(self._socket))
+
+    def test_track(self):
+        with Simulator(port=0, az_rate=None, el_rate=None) as sim:
+            ctl = Rotctld("127.0.0.1", sim.port)
+            ctl.connect()
+            self._db.add(NOAA15)
+            svc = self.make_daemon([25338], ctl, poll_interval=0.05)
+            positions = make_positions([0.05 * i for i in range(5)])
+            pass_ = PlannedPass(25338, "NOAA 15", positions[0][0], positions[-1][0], 10.0,
+                                positions[2][0], 0.0, 4.0)
+
+            svc._track(pass_, iter(positions))
+            self.assertEqual(svc.passes_tracked, 1)
+            self.assertEqual(sim.target(), (4.0, 10.0))
+            data = telemetry.load(telemetry.pass_directory(25338, pass_.aos, svc.telemetry_dir))
+            self.assertEqual(len(data.commands), 5)
+
+            # Stopping the daemon aborts the pass.
+            positions = make_positions([0.05, 10])
+            threading.Timer(0.2, svc.stop).start()
+            start = time.monotonic()
+            svc._track(pass_._replace(aos=positions[0][0]), iter(positions))
+            self.assertLess(time.monotonic() - start, 2)
+            self.assertEqual(svc.passes_tracked, 1)
+            self.assertIsNone(svc.current)
+            ctl.close()
@@ -0,0 +1,66 @@
+from svarog_ctl import ephemeris, passes
+from orbit_predictor.locations import Location
+from orbit_predictor.sources import get_predictor_from_tle_lines
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import unittest
+
+LINE1='1 44427U 98067QM  21192.54020985  .00022355  00000-0  19763-3 0  9995'
+LINE2='2 44427  51.6376 177.8799 0003618 359.5888  93.1405 15.68562202115256'
+
+DATE = datetime(2021, 7, 14, 18, 44, 0)
+
+class EphemerisTest(unittest.TestCase):
+
+    def setUp(self):
+        self._pred = get_predictor_from_tle_lines((LINE1, LINE2))
+        self._loc = Location('Gdansk', 53.35, 18.53, 120)
+
+    def test_matches_predictor(self):
+        """Batch positions must be the same as calculated by orbit_predictor, one by one."""
+        times = [DATE + timedelta(seconds=s) for s in range(0, 1200, 7)]
+        az, el, rng = ephemeris.get_az_el(self._pred, self._loc, times)
+        self.assertEqual(az.shape, (len(times),))
+
+        for i, t in enumerate(times):
+            pos = self._pred.get_position(t)
+            exp_az, exp_el = self._loc.get_azimuth_elev_deg(pos)
+            self.assertAlmostEqual(az[i], exp_az, delta=1e-4)
+            self.assertAlmostEqual(el[i], exp_el, delta=1e-4)
+            exp_rng = np.linalg.norm(np.array(pos.position_ecef) - self._loc.position_ecef)
+            self.assertAlmostEqual(rng[i], exp_rng, delta=1e-3)
+
+    def test_single_timestamp(self):
+        """get_az_el_func() gives the same positions as the batch."""
+        start = DATE.replace(tzinfo=timezone.utc)
+        offsets = [0.0, 0.25, 333.5, 1199.0]
+        az, el, _ = ephemeris.get_az_el(self._pred, self._loc, ephemeris.time_grid(start, offsets))
+        az_el = ephemeris.get_az_el_func(self._pred, self._loc, start)
+        for i, offset in enumerate(offsets):
+            self.assertAlmostEqual(az_el(offset)[0], az[i], places=6)
+            self.assertAlmostEqual(az_el(offset)[1], el[i], places=6)
+
+    def test_timezones(self):
+        """Aware timestamps are converted to UTC, naive ones are assumed to be UTC."""
+        naive = ephemeris.to_datetime64([DATE])
+        aware = ephemeris.to_datetime64([DATE.replace(tzinfo=timezone.utc)])
+        cest = ephemeris.to_datetime64([(DATE + timedelta(hours=2)).replace(
+            tzinfo=timezone(timedelta(hours=2)))])
+        self.assertEqual(naive[0], aware[0])
+        self.assertEqual(naive[0], cest[0])
+
+    def test_to_datetimes(self):
+        start = DATE.replace(tzinfo=timezone.utc)
+        times = ephemeris.to_datetimes(start, np.array([0.5, 1.0, 90.000001]))
+        self.assertEqual(times, [start + timedelta(seconds=0.5), start + timedelta(seconds=1),
+                                 start + timedelta(seconds=90, microseconds=1)])
+        self.assertEqual(times[0].tzinfo, timezone.utc)
+
+    def test_offsets(self):
+        np.testing.assert_allclose(passes.get_offsets(95.5, 30), [30, 60, 90, 95.5])
+        np.testing.assert_allclose(passes.get_offsets(90, 30), [30, 60, 90])
+        np.testing.assert_allclose(passes.get_offsets(10, 30), [10])
+        self.assertEqual(len(passes.get_offsets(0, 30)), 0)
+
+        # MAX_STEPS must produce exactly the requested number of steps.
+        self.assertEqual(len(passes.get_offsets(597.2, 597.2 / 100)), 100)
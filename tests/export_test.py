@@ -0,0 +1,94 @@
+from svarog_ctl import export
+from tests.scheduler_test import KRAKSAT
+from datetime import datetime, timedelta, timezone
+import contextlib
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+AOS = datetime(2021, 7, 14, 18, 48, 21, 500000, tzinfo=timezone.utc)
+
+POSITIONS = [[AOS + timedelta(seconds=s), az, el]
+             for s, az, el in [(-30, 200.0, 0.0), (0, 200.0, 0.0), (5, 210.5, 3.25),
+                               (10, 370.125, 7.5)]]
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self._dir.name, name)
+
+    def test_csv(self):
+        self.assertEqual(export.export_plan(iter(POSITIONS), self.path("plan.csv"), norad=44427,
+                                            aos=AOS), 4)
+        with open(self.path("plan.csv"), encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(list(rows[0]), [f.name for f in export.SCHEMA])
+        self.assertEqual(rows[0], {"norad": "44427", "time": "2021-07-14T18:47:51.500000+00:00",
+                                   "offset": "-30.000", "az": "200.0000", "el": "0.0000"})
+        self.assertEqual(rows[3]["az"], "370.1250")
+
+    def test_jsonl(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            count = export.export_plan(POSITIONS, "-", export.FORMAT_JSONL, 44427)
+        self.assertEqual(count, 4)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        # Without AOS, the offsets are counted from the first command.
+        self.assertEqual(rows[2], {"norad": 44427, "time": "2021-07-14T18:48:26.500000+00:00",
+                                   "offset": 35.0, "az": 210.5, "el": 3.25})
+
+    def test_npy(self):
+        path = self.path("plan.npy")
+        export.export_plan(POSITIONS, path, norad=44427, aos=AOS)
+        plan = np.load(path)
+        self.assertEqual(plan.dtype, export.PLAN_DTYPE)
+        self.assertEqual(plan['time'].tolist(), [p[0].timestamp() for p in POSITIONS])
+        self.assertEqual(plan['offset'].tolist(), [-30, 0, 5, 10])
+        self.assertEqual(plan['az'].tolist(), [p[1] for p in POSITIONS])
+        self.assertEqual(plan['norad'].tolist(), [44427] * 4)
+
+        # Nothing to export.
+        self.assertEqual(export.export_plan([], path), 0)
+        self.assertEqual(len(np.load(path)), 0)
+
+    def test_errors(self):
+        self.assertEqual(export.guess_format("plans/a.JSONL"), export.FORMAT_JSONL)
+        self.assertEqual(export.guess_format("-"), export.FORMAT_CSV)
+        with self.assertRaises(ValueError):
+            export.export_plan(POSITIONS, "-", export.FORMAT_NPY)
+        with self.assertRaises(ValueError):
+            export.export_plan(POSITIONS, self.path("plan.xml"), "xml")
+
+    def test_dry_run(self):
+        """The pass is planned without connecting to rotctld."""
+        env = dict(os.environ, SVAROG_CONFIG_DIR=self.path("config"))
+        os.makedirs(env["SVAROG_CONFIG_DIR"])
+        with open(os.path.join(env["SVAROG_CONFIG_DIR"], "config.yml"), "w",
+                  encoding="utf-8") as f:
+            f.write("logging:\n  file: stdout\n")
+        result = subprocess.run([sys.executable, "svarog_ctl.py", "--tle1", KRAKSAT.line1,
+                                 "--tle2", KRAKSAT.line2, "--lat", "53.35", "--lon", "18.53",
+                                 "--time", "2021-07-14T18:44:00Z", "--az-range", "0", "450",
+                                 "--dry-run", "--format", "jsonl", "--port", "1"],
+                                capture_output=True, text=True, cwd=ROOT, env=env, check=False)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        rows = [json.loads(line) for line in result.stdout.splitlines()]
+        self.assertGreater(len(rows), 100)
+        self.assertLess(rows[0]["offset"], 0)
+        self.assertTrue(all(0 <= r["az"] <= 450 for r in rows))
+        self.assertIn("Dry run", result.stderr)
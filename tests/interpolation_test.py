@@ -0,0 +1,70 @@
+from svarog_ctl import ephemeris, interpolation
+from orbit_predictor.locations import Location
+from orbit_predictor.sources import get_predictor_from_tle_lines
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import unittest
+
+LINE1='1 44427U 98067QM  21192.54020985  .00022355  00000-0  19763-3 0  9995'
+LINE2='2 44427  51.6376 177.8799 0003618 359.5888  93.1405 15.68562202115256'
+
+# The pass from passes_test.py
+AOS = datetime(2021, 7, 14, 18, 48, 21, tzinfo=timezone.utc)
+LOS = datetime(2021, 7, 14, 18, 58, 18, tzinfo=timezone.utc)
+
+class InterpolationTest(unittest.TestCase):
+
+    def setUp(self):
+        self._pred = get_predictor_from_tle_lines((LINE1, LINE2))
+        self._loc = Location('Gdansk', 53.35, 18.53, 120)
+        self._interp = interpolation.PassInterpolator(self._pred, self._loc, AOS, LOS)
+
+    def test_matches_propagation(self):
+        offsets = np.arange(0, 597, 3.7)
+        az, el, rng = ephemeris.get_az_el(self._pred, self._loc,
+                                          ephemeris.time_grid(AOS, offsets))
+        for i, offset in enumerate(offsets):
+            exp = (az[i], el[i], rng[i])
+            # Both as timestamp and offset.
+            for t in (offset, AOS + timedelta(seconds=float(offset))):
+                pos = self._interp.position_at(t)
+                self.assertAlmostEqual(pos[0], exp[0], delta=1e-3)
+                self.assertAlmostEqual(pos[1], exp[1], delta=1e-3)
+                self.assertAlmostEqual(pos[2], exp[2], delta=1e-2)
+
+        # Batch version returns the same.
+        batch = self._interp.positions(offsets)
+        np.testing.assert_allclose(batch[0], [self._interp.position_at(o)[0] for o in offsets])
+        np.testing.assert_allclose(batch[1], [self._interp.position_at(o)[1] for o in offsets])
+
+    def test_velocity(self):
+        """ECEF velocity must match the change of ECEF position."""
+        satrec = ephemeris.get_satrec(self._pred)
+        times = ephemeris.time_grid(AOS, np.array([-0.5, 0, 0.5]))
+        pos, vel = interpolation.propagate_ecef_velocity(satrec, times)
+        np.testing.assert_allclose(pos[2] - pos[0], vel[1], atol=1e-4)
+
+    def test_error(self):
+        err = self._interp.error(step=0.5)
+        self.assertEqual(err.samples, 1195)
+        self.assertLess(err.max_angle, 0.001)
+        self.assertLessEqual(err.rms_angle, err.max_angle)
+        self.assertLess(err.max_range, 0.01)
+
+        # Longer step means worse accuracy.
+        coarse = interpolation.PassInterpolator(self._pred, self._loc, AOS, LOS, step=300)
+        self.assertGreater(coarse.error().max_angle, err.max_angle)
+
+    def test_range(self):
+        # Ends are included.
+        self._interp.position_at(AOS)
+        self._interp.position_at(LOS)
+
+        with self.assertRaises(ValueError):
+            self._interp.position_at(AOS - timedelta(seconds=1))
+        with self.assertRaises(ValueError):
+            self._interp.position_at(598.0)
+        with self.assertRaises(ValueError):
+            self._interp.positions([10, 600])
+        with self.assertRaises(ValueError):
+            interpolation.PassInterpolator(self._pred, self._loc, LOS, AOS)
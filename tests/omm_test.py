@@ -0,0 +1,112 @@
+from svarog_ctl import omm, orbitdb
+import io
+import json
+import os
+import tempfile
+import unittest
+
+LINE1 = "1 44427U 98067QM  21192.54020985  .00022355  00000-0  19763-3 0  9995"
+LINE2 = "2 44427  51.6376 177.8799 0003618 359.5888  93.1405 15.68562202115256"
+
+FIELDS = {
+    "OBJECT_NAME": "KRAKSAT",
+    "OBJECT_ID": "1998-067QM",
+    "EPOCH": "2021-07-11T12:57:54.131040",
+    "MEAN_MOTION": 15.68562202,
+    "ECCENTRICITY": 0.0003618,
+    "INCLINATION": 51.6376,
+    "RA_OF_ASC_NODE": 177.8799,
+    "ARG_OF_PERICENTER": 359.5888,
+    "MEAN_ANOMALY": 93.1405,
+    "EPHEMERIS_TYPE": 0,
+    "CLASSIFICATION_TYPE": "U",
+    "NORAD_CAT_ID": 44427,
+    "ELEMENT_SET_NO": 999,
+    "REV_AT_EPOCH": 11525,
+    "BSTAR": 0.00019763,
+    "MEAN_MOTION_DOT": 0.00022355,
+    "MEAN_MOTION_DDOT": 0
+}
+
+def as_csv(records):
+    header = ",".join(FIELDS.keys())
+    rows = [",".join(str(r[k]) for k in FIELDS) for r in records]
+    return "\n".join([header] + rows) + "\n"
+
+def as_xml(records):
+    segments = []
+    for r in records:
+        meta = "".join(f"<{k}>{r[k]}</{k}>" for k in ("OBJECT_NAME", "OBJECT_ID"))
+        mean = "".join(f"<{k}>{r[k]}</{k}>" for k in ("EPOCH", "MEAN_MOTION", "ECCENTRICITY",
+                       "INCLINATION", "RA_OF_ASC_NODE", "ARG_OF_PERICENTER", "MEAN_ANOMALY"))
+        params = "".join(f"<{k}>{r[k]}</{k}>" for k in ("EPHEMERIS_TYPE", "CLASSIFICATION_TYPE",
+                         "NORAD_CAT_ID", "ELEMENT_SET_NO", "REV_AT_EPOCH", "BSTAR",
+                         "MEAN_MOTION_DOT", "MEAN_MOTION_DDOT"))
+        segments.append(f"<segment><metadata>{meta}</metadata><data><meanElements>{mean}"
+                        f"</meanElements><tleParameters>{params}</tleParameters></data></segment>")
+    return ('<?xml version="1.0" encoding="UTF-8"?><ndm><omm><body>' + "".join(segments)
+            + '</body></omm></ndm>')
+
+class OmmTest(unittest.TestCase):
+
+    def setUp(self):
+        big = dict(FIELDS, OBJECT_NAME="BIGSAT", NORAD_CAT_ID=144427)
+        self._records = [FIELDS, big]
+
+    def check_tles(self, tles):
+        self.assertEqual(len(tles), 2)
+        self.assertEqual(tles[0].name, "KRAKSAT")
+        self.assertEqual(tles[0].line1, LINE1)
+        self.assertEqual(tles[0].line2, LINE2)
+
+        # NORAD IDs above 99999 are stored using Alpha-5 format
+        self.assertEqual(tles[1].norad, 144427)
+        self.assertEqual(tles[1].line1[:8], "1 E4427U")
+
+    def test_json(self):
+        text = json.dumps(self._records, indent=1)
+        self.check_tles(list(omm.iter_omm(io.StringIO(text), "json")))
+
+        # Make sure objects split across read chunks are handled properly.
+        records = list(omm._iter_json(io.StringIO(text), chunk_size=7))
+        self.assertEqual(records, self._records)
+
+    def test_csv(self):
+        self.check_tles(list(omm.iter_omm(io.StringIO(as_csv(self._records)), "csv")))
+
+    def test_xml(self):
+        self.check_tles(list(omm.iter_omm(io.StringIO(as_xml(self._records)), "xml")))
+
+    def test_bad_record(self):
+        errors = []
+        text = as_csv([FIELDS, dict(FIELDS, EPOCH="garbage"), FIELDS])
+        tles = list(omm.iter_omm(io.StringIO(text), "csv", on_error=lambda n, msg: errors.append(n)))
+        self.assertEqual(len(tles), 2)
+        self.assertEqual(errors, [2])
+
+    def test_detect_format(self):
+        url = "https://celestrak.org/NORAD/elements/gp.php?GROUP=active&FORMAT="
+        self.assertEqual(omm.detect_format(url + "json"), "json")
+        self.assertEqual(omm.detect_format(url + "CSV"), "csv")
+        self.assertEqual(omm.detect_format(url + "tle"), "tle")
+        self.assertEqual(omm.detect_format("celestrak.org-norad-elements-gp.php-group-active-format-xml"),
+                         "xml")
+
+        self.assertEqual(omm.detect_format("data.txt", '[{"OBJECT_NAME": "X"}]'), "json")
+        self.assertEqual(omm.detect_format("data.txt", as_xml(self._records)), "xml")
+        self.assertEqual(omm.detect_format("data.txt", as_csv(self._records)), "csv")
+        self.assertEqual(omm.detect_format("data.txt", "KRAKSAT\n" + LINE1), "tle")
+
+    def test_orbitdb(self):
+        """OMM files can be loaded into the orbit database just like TLE files."""
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "tle"))
+            with open(os.path.join(tmp, "tle", "sats.csv"), "w", encoding="utf-8") as f:
+                f.write(as_csv(self._records))
+
+            db = orbitdb.OrbitDatabase(urls=["file://sats.csv"], datadir=tmp)
+            db.refresh_urls()
+            self.assertEqual(db.count(), 2)
+            self.assertEqual(db.get_norad(44427).line1, LINE1)
+            self.assertEqual(db.get_name_by_norad(144427), "BIGSAT")
+            self.assertEqual(db.get_predictor(144427).tle.lines[0][:7], "1 E4427")
@@ -1,8 +1,45 @@
 from svarog_ctl import orbitdb
 from svarog_ctl import tle
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from orbit_predictor.locations import Location
+import numpy as np
+import os
 import pytest
+import tempfile
+import threading
+import time
 import unittest
 
+TLES = b"""KRAKSAT
+1 44427U 98067QM  21192.54020985  .00022355  00000-0  19763-3 0  9995
+2 44427  51.6376 177.8799 0003618 359.5888  93.1405 15.68562202115256
+"""
+
+class TleHandler(BaseHTTPRequestHandler):
+    """A local stand-in for celestrak. Every request takes DELAY seconds, the data
+       are always the same, so the ETag never changes."""
+
+    DELAY = 0.5
+    ETAG = '"kraksat-1"'
+    requests = []
+
+    def do_GET(self):
+        TleHandler.requests.append((self.path, self.headers.get("If-None-Match")))
+        time.sleep(self.DELAY)
+        if self.headers.get("If-None-Match") == self.ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", self.ETAG)
+        self.send_header("Content-Length", str(len(TLES)))
+        self.end_headers()
+        self.wfile.write(TLES)
+
+    def log_message(self, format, *args):
+        pass
+
 class PassesTest(unittest.TestCase):
 
 
@@ -75,3 +112,140 @@ class PassesTest(unittest.TestCase):
         self.assertIsInstance(tle2, tle.Tle)
 
         self.assertEqual(db.get_name_by_norad(44427), "KRAKSAT")
+
+    def test_predictor_cache(self):
+
+        LINE1 = "1 44427U 98067QM  21192.54020985  .00022355  00000-0  19763-3 0  9995"
+        LINE2 = "2 44427  51.6376 177.8799 0003618 359.5888  93.1405 15.68562202115256"
+        NEW_LINE1 = "1 44427U 98067QM  21193.54020985  .00022355  00000-0  19763-3 0  9996"
+
+        db = orbitdb.OrbitDatabase()
+        db.add_tle(LINE1, LINE2, "KRAKSAT")
+
+        # The predictor can be found by name or NORAD ID and it's built only once.
+        pred1 = db.get_predictor("KRAKSAT")
+        pred2 = db.get_predictor(44427)
+        self.assertEqual(pred1.tle.lines, (LINE1, LINE2))
+        self.assertIs(pred1, pred2)
+
+        # New TLE (with different epoch) means a new predictor.
+        db.add_tle(NEW_LINE1, LINE2, "KRAKSAT")
+        pred3 = db.get_predictor("KRAKSAT")
+        self.assertIsNot(pred1, pred3)
+        self.assertEqual(pred3.tle.lines, (NEW_LINE1, LINE2))
+
+        with pytest.raises(LookupError):
+            db.get_predictor("nonexistent")
+
+    def test_to_array(self):
+
+        LINE1 = "1 44427U 98067QM  21192.54020985  .00022355  00000-0  19763-3 0  9995"
+        LINE2 = "2 44427  51.6376 177.8799 0003618 359.5888  93.1405 15.68562202115256"
+
+        db = orbitdb.OrbitDatabase()
+        self.assertEqual(len(db.to_array()), 0)
+
+        db.add_tle(LINE1, LINE2, "KRAKSAT")
+        arr = db.to_array()
+        self.assertEqual(len(arr), 1)
+        self.assertEqual(arr[0]['norad'], 44427)
+        self.assertAlmostEqual(arr[0]['mean_motion'], 15.68562202)
+
+    def test_get_visible(self):
+
+        LINE1 = "1 44427U 98067QM  21192.54020985  .00022355  00000-0  19763-3 0  9995"
+        LINE2 = "2 44427  51.6376 177.8799 0003618 359.5888  93.1405 15.68562202115256"
+        NOAA1 = "1 25338U 98030A   19351.71640046 +.00000015 +00000-0 +24973-4 0  9993"
+        NOAA2 = "2 25338 098.7340 012.5392 0011411 075.8229 284.4218 14.25943731122932"
+
+        db = orbitdb.OrbitDatabase()
+        db.add_tle(LINE1, LINE2, "KRAKSAT")
+        db.add_tle(NOAA1, NOAA2, "NOAA 15")
+        loc = Location('Gdansk', 53.35, 18.53, 120)
+
+        # KRAKSAT culminates at ~48.7 deg around 18:53:16 (see passes_test.py).
+        when = datetime(2021, 7, 14, 18, 53, 16)
+        visible = db.get_visible(loc, when)
+        self.assertEqual(len(visible), 1)
+        self.assertEqual(visible[0]['norad'], 44427)
+        self.assertEqual(visible[0]['name'], b"KRAKSAT")
+
+        pred = db.get_predictor(44427)
+        az, el = loc.get_azimuth_elev_deg(pred.get_position(when))
+        self.assertAlmostEqual(visible[0]['az'], az, delta=0.001)
+        self.assertAlmostEqual(visible[0]['el'], el, delta=0.001)
+
+        # Mask above the culmination.
+        self.assertEqual(len(db.get_visible(loc, when, min_elevation=50)), 0)
+
+        # Over a window, the highest position is reported.
+        visible = db.get_visible(loc, datetime(2021, 7, 14, 18, 44), duration=1200, step=5)
+        self.assertEqual(len(visible), 1)
+        self.assertAlmostEqual(visible[0]['el'], 48.7, delta=0.5)
+        self.assertAlmostEqual((visible[0]['time'] - np.datetime64(when)) / np.timedelta64(1, 's'),
+                               0, delta=10)
+
+        # Adding a sat invalidates the batch propagators.
+        self.assertEqual(len(db.get_visible(loc, when, min_elevation=-90)), 2)
+        db.add_tle(LINE1.replace("44427", "44428"), LINE2.replace("44427", "44428"), "KRAKSAT 2")
+        self.assertEqual(len(db.get_visible(loc, when, min_elevation=-90)), 3)
+
+class DownloadTest(unittest.TestCase):
+
+    def setUp(self):
+        TleHandler.requests = []
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), TleHandler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        self._dir = tempfile.TemporaryDirectory()
+
+        base = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._urls = [f"{base}/tle{i}.txt" for i in range(5)]
+
+    def tearDown(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._dir.cleanup()
+
+    def test_parallel_download(self):
+        db = orbitdb.OrbitDatabase(urls=self._urls, datadir=self._dir.name)
+
+        start = time.monotonic()
+        db.refresh_urls()
+        elapsed = time.monotonic() - start
+
+        # 5 sources, 0.5 second each. Sequentially, this would take 2.5 seconds.
+        self.assertLess(elapsed, 2.0)
+        self.assertEqual(len(TleHandler.requests), 5)
+        self.assertEqual(db.get_name_by_norad(44427), "KRAKSAT")
+
+    def test_shared_session(self):
+        """Downloads started at the same time share one session."""
+        db = orbitdb.OrbitDatabase(urls=self._urls, datadir=self._dir.name)
+        barrier = threading.Barrier(8)
+        sessions = []
+        def get():
+            barrier.wait()
+            sessions.append(db._get_session())
+        threads = [threading.Thread(target=get) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len({id(s) for s in sessions}), 1)
+
+    def test_conditional_download(self):
+        db = orbitdb.OrbitDatabase(urls=self._urls[:1], datadir=self._dir.name)
+        self.assertTrue(db.refresh_urls())
+        path = db._get_tle_path_from_url(self._urls[0])
+        mtime = os.stat(path).st_mtime_ns
+
+        # The file is still fresh, so there should be no download at all.
+        self.assertFalse(db.refresh_urls())
+        self.assertEqual(len(TleHandler.requests), 1)
+
+        # When forced, the request is sent, but the server says the data didn't change.
+        self.assertFalse(db.refresh_urls(force_fetch=True))
+        self.assertEqual(TleHandler.requests[-1][1], TleHandler.ETAG)
+        self.assertEqual(os.stat(path).st_mtime_ns, mtime)
+        self.assertEqual(db.get_name_by_norad(44427), "KRAKSAT")
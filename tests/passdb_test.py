@@ -0,0 +1,91 @@
+from svarog_ctl import passdb, tle
+from orbit_predictor.locations import Location
+from orbit_predictor.sources import get_predictor_from_tle_lines
+from datetime import datetime, timedelta, timezone
+import os
+import sqlite3
+import tempfile
+import unittest
+
+LINE1 = '1 44427U 98067QM  21192.54020985  .00022355  00000-0  19763-3 0  9995'
+LINE2 = '2 44427  51.6376 177.8799 0003618 359.5888  93.1405 15.68562202115256'
+
+# The same sat, but a newer TLE
+NEW_LINE1 = '1 44427U 98067QM  21193.54020985  .00022355  00000-0  19763-3 0  9995'
+
+DATE = datetime(2021, 7, 14, 18, 44, 0, tzinfo=timezone.utc)
+
+class PassDatabaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._dir.name, passdb.PASSDB_FILE)
+        self._db = passdb.PassDatabase(self._path)
+        self._tle = tle.Tle(LINE1, LINE2, "KRAKSAT")
+        self._loc = Location('Gdansk', 53.35, 18.53, 120)
+
+    def tearDown(self):
+        self._db.close()
+        self._dir.cleanup()
+
+    def _tamper(self):
+        """Modifies all stored passes, so it's possible to tell if they came from the
+           database or were calculated again."""
+        with sqlite3.connect(self._path) as conn:
+            conn.execute("UPDATE passes SET max_el = 99")
+
+    def test_same_as_predictor(self):
+        pred = get_predictor_from_tle_lines((LINE1, LINE2))
+        exp = pred.get_next_pass(self._loc, when_utc=DATE)
+
+        p = self._db.get_next_pass(self._tle, self._loc, DATE)
+        self.assertEqual(p.norad, 44427)
+        self.assertEqual(p.name, "KRAKSAT")
+        self.assertAlmostEqual(p.aos, exp.aos, delta=timedelta(seconds=1))
+        self.assertAlmostEqual(p.los, exp.los, delta=timedelta(seconds=1))
+        self.assertAlmostEqual(p.max_elevation, exp.max_elevation_deg, delta=0.01)
+        self.assertEqual(p.aos.tzinfo, timezone.utc)
+
+    def test_cached(self):
+        first = self._db.get_next_pass(self._tle, self._loc, DATE)
+        self._tamper()
+
+        # Later lookups are served from the database, also by another instance.
+        db2 = passdb.PassDatabase(self._path)
+        second = db2.get_next_pass(self._tle, self._loc, DATE + timedelta(minutes=1))
+        db2.close()
+        self.assertEqual(second.aos, first.aos)
+        self.assertEqual(second.max_elevation, 99)
+
+        # Pass in progress is returned too.
+        during = self._db.get_next_pass(self._tle, self._loc, first.aos + timedelta(minutes=5))
+        self.assertEqual(during.aos, first.aos)
+
+        # And the one after it.
+        after = self._db.get_next_pass(self._tle, self._loc, first.los)
+        self.assertGreater(after.aos, first.los)
+        self.assertEqual(after.max_elevation, 99)
+
+    def test_different_key(self):
+        self._db.get_next_pass(self._tle, self._loc, DATE)
+        self._tamper()
+
+        # Different observer or elevation mask must not get the stored passes.
+        other = Location('Warsaw', 52.23, 21.01, 100)
+        self.assertNotEqual(self._db.get_next_pass(self._tle, other, DATE).max_elevation, 99)
+        self.assertNotEqual(self._db.get_next_pass(self._tle, self._loc, DATE,
+                                                   min_elevation=10).max_elevation, 99)
+        self.assertEqual(self._db.get_next_pass(self._tle, self._loc, DATE).max_elevation, 99)
+
+    def test_new_epoch(self):
+        self._db.get_next_pass(self._tle, self._loc, DATE)
+        self._tamper()
+
+        new_tle = tle.Tle(NEW_LINE1, LINE2, "KRAKSAT")
+        p = self._db.get_next_pass(new_tle, self._loc, DATE)
+        self.assertNotEqual(p.max_elevation, 99)
+
+        # The passes from the old TLE are gone.
+        with sqlite3.connect(self._path) as conn:
+            epochs = conn.execute("SELECT DISTINCT epoch FROM passes").fetchall()
+        self.assertEqual(epochs, [(new_tle.epoch.timestamp(),)])
@@ -1,7 +1,7 @@
-from svarog_ctl import orbitdb, passes, tle
+from svarog_ctl import ephemeris, orbitdb, passes, tle
 from orbit_predictor.locations import Location
 from orbit_predictor.sources import get_predictor_from_tle_lines
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from dateutil import parser
 import unittest
 
@@ -127,3 +127,67 @@ class PassesTest(unittest.TestCase):
         for e in exp:
             dist = passes.distance(e[0], e[1], e[2], e[3])
             self.assertAlmostEqual(dist, e[4], delta = 0.00001)
+
+    def test_passes_distance(self):
+        next_pass = self._pred.get_next_pass(self._loc, when_utc=DATE)
+        aos = next_pass.aos
+        los = next_pass.los
+
+        x = passes.get_pass(self._pred, self._loc, aos, los, passes.PassAlgo.DISTANCE, 5)
+
+        # The first command is at AOS, then every time the sat moves 5 degrees away.
+        self.assertEqual(x[0][0], aos)
+        self.assertAlmostEqual(x[0][2], 0.0, delta=0.1)
+        for prev, pos in zip(x, x[1:]):
+            self.assertLess(prev[0], pos[0])
+            self.assertLessEqual(pos[0], los)
+            dist = passes.distance(prev[1], prev[2], pos[1], pos[2])
+            self.assertGreater(dist, 5)
+            self.assertLess(dist, 5.1)
+
+        # Low over the horizon the sat moves slowly, so the commands are sparse. Near
+        # zenith they're much more frequent.
+        intervals = [(b[0] - a[0]).total_seconds() for a, b in zip(x, x[1:])]
+        self.assertGreater(max(intervals), 10 * min(intervals))
+
+        # Compare with a brute force scan over dense positions.
+        step = 0.1
+        offsets = passes.get_offsets((los - aos).total_seconds(), step)
+        az, el, _ = ephemeris.get_az_el(self._pred, self._loc, ephemeris.time_grid(aos, offsets))
+        last = (az[0], el[0])
+        count = 1
+        for a, e in zip(az, el):
+            if passes.distance(last[0], last[1], a, e) > 5:
+                last = (a, e)
+                count += 1
+        self.assertEqual(count, len(x))
+
+    def test_plan_distance_cost(self):
+        """Planning cost depends on the number of commands, not on the pass duration."""
+        next_pass = self._pred.get_next_pass(self._loc, when_utc=DATE)
+        duration = (next_pass.los - next_pass.aos).total_seconds()
+        az_el = ephemeris.get_az_el_func(self._pred, self._loc, next_pass.aos)
+        calls = []
+
+        def counting_az_el(offset):
+            calls.append(offset)
+            return az_el(offset)
+
+        offsets, _, _ = passes.plan_distance(counting_az_el, duration, 10)
+        self.assertLess(len(calls), 8 * len(offsets))
+        self.assertLess(len(calls), duration / 5)
+
+    def test_distance_same_point(self):
+        self.assertEqual(passes.distance(123.456, 45.678, 123.456, 45.678), 0)
+
+    def test_find_next_pass(self):
+        found = passes.find_next_pass(self._pred, self._loc, DATE, norad=NORAD, name=NAME)
+        next_pass = self._pred.get_next_pass(self._loc, when_utc=DATE)
+        self.assertEqual((found.norad, found.name), (NORAD, NAME))
+        self.assertEqual(found.aos, next_pass.aos.replace(tzinfo=timezone.utc))
+        self.assertEqual(found.max_elevation, next_pass.max_elevation_deg)
+        listed = passes.find_passes(self._pred, self._loc, DATE, next_pass.los, 5)[0]
+        self.assertEqual((found.aos_az, found.los_az), (listed.aos_az, listed.los_az))
+
+        # Nothing within the searched time.
+        self.assertIsNone(passes.find_next_pass(self._pred, self._loc, DATE, 85, days=1))
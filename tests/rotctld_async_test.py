@@ -0,0 +1,126 @@
+from svarog_ctl.rotctld import Rotctld
+from svarog_ctl.rotctld_async import AsyncRotctld, Reply
+from svarog_ctl.simulator import Simulator, MODEL
+import asyncio
+import time
+import unittest
+
+def simulator(**kwargs):
+    """Starts simulated rotctld, with instantly moving antenna by default."""
+    kwargs.setdefault("port", 0)
+    kwargs.setdefault("az_rate", None)
+    kwargs.setdefault("el_rate", None)
+    return Simulator(**kwargs).start()
+
+class AsyncRotctldTest(unittest.TestCase):
+
+    def run_async(self, coro):
+        return asyncio.run(coro)
+
+    def test_reply(self):
+        reply = Reply(0, ["get_pos:", "Azimuth: 10.000000", "Elevation: 20.000000"])
+        self.assertEqual(reply.values, {"Azimuth": "10.000000", "Elevation": "20.000000"})
+        self.assertEqual(str(reply), "get_pos:\nAzimuth: 10.000000\nElevation: 20.000000\nRPRT 0")
+
+    def test_commands(self):
+        server = simulator(az_min=0, az_max=450, fragment=3)
+
+        async def run():
+            ctl = AsyncRotctld("127.0.0.1", server.port, az_min=0, az_max=450)
+            self.assertFalse(ctl.connected())
+            self.assertEqual(await ctl.connect(), MODEL)
+            self.assertTrue(ctl.connected())
+
+            ok, reply = await ctl.set_pos(400, 100)
+            self.assertTrue(ok)
+            self.assertEqual(reply.lines, ["set_pos: 400.000000 90.000000"])
+            self.assertEqual(await ctl.get_pos(), (400.0, 90.0))
+
+            ok, reply = await ctl.set_pos(-10, 10)
+            self.assertEqual(await ctl.get_pos(), (350.0, 10.0))
+
+            # Multi-line reply
+            self.assertIn("Rot type:\t\tAz-El", await ctl.capabilities())
+
+            # Unsupported command
+            reply = await ctl.send_command("2")
+            self.assertEqual(reply.code, -11)
+
+            await ctl.close()
+            self.assertFalse(ctl.connected())
+            with self.assertRaises(ConnectionError):
+                await ctl.get_pos()
+
+        try:
+            self.run_async(run())
+        finally:
+            server.stop()
+
+    def test_pipelining(self):
+        """Replies are matched with commands, even if many are sent at once."""
+        server = simulator(latency=0.01)
+
+        async def run():
+            ctl = AsyncRotctld("127.0.0.1", server.port)
+            await ctl.connect()
+            results = await asyncio.gather(*[
+                ctl.set_pos(i, 10) if i % 2 == 0 else ctl.get_pos() for i in range(40)])
+            await ctl.close()
+            return results
+
+        try:
+            results = self.run_async(run())
+        finally:
+            server.stop()
+
+        for i, result in enumerate(results):
+            if i % 2 == 0:
+                self.assertTrue(result[0])
+                self.assertEqual(result[1].lines, [f"set_pos: {i:f} 10.000000"])
+            else:
+                # The position set just before.
+                self.assertEqual(result, (i - 1.0, 10.0))
+
+    def test_server_gone(self):
+        server = simulator(latency=0.2)
+
+        async def run():
+            ctl = AsyncRotctld("127.0.0.1", server.port)
+            await ctl.connect()
+            pending = asyncio.ensure_future(ctl.get_pos())
+            await asyncio.sleep(0.05)
+            server.stop()
+            with self.assertRaises(ConnectionError):
+                await pending
+            await ctl.close()
+
+        self.run_async(run())
+
+    def test_rate(self):
+        """With some network latency, the pipelined client sends commands many times faster
+           than the blocking one."""
+        server = simulator(latency=0.01)
+        count = 30
+        try:
+            ctl = Rotctld("127.0.0.1", server.port)
+            ctl.connect()
+            start = time.monotonic()
+            for i in range(count):
+                ctl.set_pos(i, 10)
+            blocking = time.monotonic() - start
+            ctl.close()
+
+            async def run():
+                ctl = AsyncRotctld("127.0.0.1", server.port)
+                await ctl.connect()
+                start = time.monotonic()
+                await asyncio.gather(*[ctl.set_pos(i, 10) for i in range(count)])
+                elapsed = time.monotonic() - start
+                await ctl.close()
+                return elapsed
+            pipelined = self.run_async(run())
+        finally:
+            server.stop()
+
+        self.assertGreater(blocking, count * 0.01)
+        self.assertGreater(blocking / pipelined, 3)
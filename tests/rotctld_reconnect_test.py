@@ -0,0 +1,91 @@
+from svarog_ctl import rotctld
+from svarog_ctl.simulator import MODEL
+from tests.rotctld_async_test import simulator
+import time
+import unittest
+
+class RotctldReconnectTest(unittest.TestCase):
+
+    def test_reuse(self):
+        """Connection can be closed and opened again."""
+        server = simulator()
+        try:
+            r = rotctld.Rotctld("127.0.0.1", server.port)
+            self.assertIsNone(r.sock)
+            with self.assertRaises(ConnectionError):
+                r.get_pos()
+
+            for _ in range(2):
+                self.assertEqual(r.connect(), MODEL)
+                self.assertTrue(r.connected())
+                self.assertEqual(r.stats().state, rotctld.STATE_CONNECTED)
+                r.close()
+                self.assertFalse(r.connected())
+                self.assertEqual(r.stats().state, rotctld.STATE_DISCONNECTED)
+
+            # Closed on purpose, so no reconnecting.
+            with self.assertRaises(ConnectionError):
+                r.get_pos()
+            self.assertEqual(r.stats().connects, 2)
+            self.assertEqual(r.stats().reconnect_attempts, 0)
+        finally:
+            server.stop()
+
+    def test_reconnect(self):
+        server = simulator()
+        port = server.port
+        r = rotctld.Rotctld("127.0.0.1", port)
+        r.connect()
+        self.assertTrue(r.set_pos(10, 20)[0])
+
+        # rotctld restarts and forgets the target.
+        server.stop()
+        server = simulator(port=port)
+        try:
+            start = time.monotonic()
+            self.assertEqual(r.get_pos(), (10.0, 20.0))
+            self.assertLess(time.monotonic() - start, 1.0)
+            self.assertEqual([c for _, c in server.commands], ["_", "P", "p"])
+
+            stats = r.stats()
+            self.assertEqual(stats.state, rotctld.STATE_CONNECTED)
+            self.assertEqual(stats.connects, 2)
+            self.assertEqual(stats.disconnects, 1)
+            self.assertEqual(stats.reconnect_attempts, 1)
+            self.assertEqual(stats.failed_commands, 0)
+            self.assertIsNotNone(stats.last_error)
+
+            # Lost during set_pos: the new target is sent only once.
+            server.stop()
+            server = simulator(port=port)
+            self.assertTrue(r.set_pos(30, 40)[0])
+            self.assertEqual([c for _, c in server.commands], ["_", "P"])
+            self.assertEqual(server.target(), (30.0, 40.0))
+        finally:
+            r.close()
+            server.stop()
+
+    def test_gives_up(self):
+        server = simulator()
+        port = server.port
+        r = rotctld.Rotctld("127.0.0.1", port, reconnect_attempts=3)
+        r.connect()
+        server.stop()
+
+        with self.assertRaises(ConnectionError):
+            r.get_pos()
+        stats = r.stats()
+        self.assertEqual(stats.state, rotctld.STATE_RECONNECTING)
+        self.assertEqual(stats.reconnect_attempts, 3)
+        self.assertEqual(stats.failed_commands, 1)
+        self.assertGreater(stats.downtime, 0)
+
+        # Once rotctld is back, the next command gets through.
+        server = simulator(port=port)
+        try:
+            self.assertEqual(r.get_pos(), (0.0, 0.0))
+            self.assertEqual(r.stats().state, rotctld.STATE_CONNECTED)
+            self.assertEqual(r.stats().disconnects, 1)
+        finally:
+            r.close()
+            server.stop()
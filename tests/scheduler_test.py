@@ -0,0 +1,99 @@
+from svarog_ctl import scheduler, tle
+from svarog_ctl.passes import PlannedPass
+from orbit_predictor.locations import Location
+from datetime import datetime, timedelta, timezone
+import unittest
+
+KRAKSAT = tle.Tle('1 44427U 98067QM  21192.54020985  .00022355  00000-0  19763-3 0  9995',
+                  '2 44427  51.6376 177.8799 0003618 359.5888  93.1405 15.68562202115256',
+                  'KRAKSAT')
+NOAA15 = tle.Tle('1 25338U 98030A   19351.71640046 +.00000015 +00000-0 +24973-4 0  9993',
+                 '2 25338 098.7340 012.5392 0011411 075.8229 284.4218 14.25943731122932',
+                 'NOAA 15')
+
+DATE = datetime(2021, 7, 14, 0, 0, 0, tzinfo=timezone.utc)
+
+def make_pass(norad, start_min, length_min, max_el, aos_az=0.0, los_az=0.0):
+    aos = DATE + timedelta(minutes=start_min)
+    los = aos + timedelta(minutes=length_min)
+    return PlannedPass(norad, f"SAT {norad}", aos, los, max_el,
+                       aos + (los - aos) / 2, aos_az, los_az)
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self._loc = Location('Gdansk', 53.35, 18.53, 120)
+
+    def test_compute_passes(self):
+        passes = scheduler.compute_passes([KRAKSAT, NOAA15], self._loc, DATE, 1, workers=1)
+
+        self.assertEqual({p.norad for p in passes}, {44427, 25338})
+        self.assertEqual(passes, sorted(passes, key=lambda p: p.aos))
+        for p in passes:
+            self.assertGreaterEqual(p.aos, DATE)
+            self.assertLessEqual(p.aos, DATE + timedelta(days=1))
+            self.assertLess(p.aos, p.max_elevation_time)
+            self.assertLess(p.max_elevation_time, p.los)
+
+        # The same pass as in passes_test.py
+        kraksat = [p for p in passes if p.norad == 44427 and p.aos.hour == 18]
+        self.assertEqual(len(kraksat), 1)
+        self.assertAlmostEqual(kraksat[0].max_elevation, 48.7, delta=0.5)
+        self.assertAlmostEqual(kraksat[0].aos_az, 247.7, delta=0.5)
+        self.assertAlmostEqual(kraksat[0].los_az, 85.3, delta=0.5)
+
+        # Low passes are filtered out.
+        high = scheduler.compute_passes([KRAKSAT, NOAA15], self._loc, DATE, 1, min_elevation=30,
+                                        workers=1)
+        self.assertEqual(high, [p for p in passes if p.max_elevation > 30])
+
+    def test_compute_passes_parallel(self):
+        serial = scheduler.compute_passes([KRAKSAT, NOAA15], self._loc, DATE, 1, workers=1)
+        parallel = scheduler.compute_passes([KRAKSAT, NOAA15], self._loc, DATE, 1, workers=2)
+        self.assertEqual(serial, parallel)
+
+    def test_slew_time(self):
+        self.assertAlmostEqual(scheduler.slew_time(10, 100, rate=3), 30)
+        self.assertAlmostEqual(scheduler.slew_time(350, 20, rate=3), 10)
+        self.assertAlmostEqual(scheduler.slew_time(20, 350, rate=3), 10)
+
+    def test_resolve_overlap(self):
+        low = make_pass(1, 0, 10, 20)
+        high = make_pass(2, 5, 10, 60)
+        other = make_pass(3, 30, 10, 10)
+
+        selected, skipped = scheduler.resolve_conflicts([low, high, other])
+        self.assertEqual(selected, [high, other])
+        self.assertEqual(skipped, [(low, high)])
+
+        # With priorities, the sat that is more important wins, even with a lower pass.
+        selected, skipped = scheduler.resolve_conflicts([low, high, other],
+                                                        scheduler.POLICY_PRIORITY, {1: 10})
+        self.assertEqual(selected, [low, other])
+        self.assertEqual(skipped, [(high, low)])
+
+        with self.assertRaises(ValueError):
+            scheduler.resolve_conflicts([low], "random")
+
+    def test_resolve_slew_time(self):
+        # There are 48 seconds between the passes, but the rotator needs 60 to turn around.
+        first = make_pass(1, 0, 10, 60, los_az=0)
+        second = make_pass(2, 10.8, 10, 30, aos_az=180)
+
+        selected, skipped = scheduler.resolve_conflicts([first, second], rate=3, settle=0)
+        self.assertEqual(selected, [first])
+        self.assertEqual(skipped, [(second, first)])
+
+        # Faster rotator makes it in time.
+        selected, skipped = scheduler.resolve_conflicts([first, second], rate=6, settle=0)
+        self.assertEqual(selected, [first, second])
+        self.assertEqual(skipped, [])
+
+    def test_format_timeline(self):
+        first = make_pass(1, 0, 10, 60)
+        second = make_pass(2, 5, 10, 30)
+        txt = scheduler.format_timeline([first], [(second, first)])
+        lines = txt.split("\n")
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith("* 2021-07-14 00:00:00 - 00:10:00"))
+        self.assertIn("SKIPPED, conflicts with SAT 1", lines[1])
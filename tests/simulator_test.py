@@ -0,0 +1,64 @@
+from svarog_ctl import simulator
+from svarog_ctl.rotctld import Rotctld
+import time
+import unittest
+
+class SimulatorTest(unittest.TestCase):
+
+    def test_protocol(self):
+        sim = simulator.Simulator(az_rate=None, el_rate=None)
+
+        self.assertEqual(sim.execute("P 10 20"), "RPRT 0\n")
+        self.assertEqual(sim.execute("p"), "10.000000\n20.000000\n")
+        self.assertEqual(sim.execute("+p"), "get_pos:\nAzimuth: 10.000000\nElevation: 20.000000\n"
+                                            "RPRT 0\n")
+        self.assertEqual(sim.execute("+\\set_pos 30 40"), "set_pos: 30.000000 40.000000\nRPRT 0\n")
+        self.assertEqual(sim.execute("\\get_pos"), "30.000000\n40.000000\n")
+        self.assertEqual(sim.execute("_"), simulator.MODEL + "\n")
+        self.assertEqual(sim.execute("+_"), f"get_info:\nInfo: {simulator.MODEL}\nRPRT 0\n")
+        self.assertIn("Max Azimuth:\t\t180.00", sim.execute("1"))
+
+        # Out of limits, malformed and unknown commands.
+        self.assertEqual(sim.execute("P 190 20"), "RPRT -1\n")
+        self.assertEqual(sim.execute("P 10 91"), "RPRT -1\n")
+        self.assertEqual(sim.execute("+P 10"), "set_pos:\nRPRT -8\n")
+        self.assertEqual(sim.execute("x"), "RPRT -11\n")
+        self.assertEqual(sim.target(), (30.0, 40.0))
+
+        self.assertEqual(sim.execute("K"), "RPRT 0\n")
+        self.assertEqual(sim.position(), (0.0, 0.0))
+        self.assertEqual([c for _, c in sim.commands],
+                         ["P", "p", "p", "P", "p", "_", "_", "1", "P", "P", "P", "x", "K"])
+
+    def test_motion(self):
+        sim = simulator.Simulator(az_rate=4, el_rate=2, az_min=0, az_max=450)
+        sim.execute("P 400 10")
+        start = sim.commands[-1][0]
+
+        self.assertAlmostEqual(sim.position(start + 1)[0], 4, delta=0.1)
+        self.assertAlmostEqual(sim.position(start + 1)[1], 2, delta=0.1)
+        # Elevation gets there first, then azimuth is still moving.
+        self.assertAlmostEqual(sim.position(start + 10)[0], 40, delta=0.1)
+        self.assertAlmostEqual(sim.position(start + 10)[1], 10, delta=0.1)
+        self.assertAlmostEqual(sim.position(start + 1000)[0], 400, delta=0.1)
+
+        # Stop freezes the antenna where it is, a new command starts from there.
+        time.sleep(0.2)
+        sim.execute("S")
+        az, el = sim.position()
+        self.assertGreater(az, 0.5)
+        self.assertEqual(sim.target(), (az, el))
+        time.sleep(0.1)
+        self.assertEqual(sim.position(), (az, el))
+
+    def test_latency(self):
+        with simulator.Simulator(port=0, latency=0.05, jitter=0.02, seed=1) as sim:
+            ctl = Rotctld("127.0.0.1", sim.port)
+            self.assertEqual(ctl.connect(), simulator.MODEL)
+            for _ in range(3):
+                start = time.monotonic()
+                ctl.set_pos(10, 10)
+                elapsed = time.monotonic() - start
+                self.assertGreaterEqual(elapsed, 0.05)
+                self.assertLess(elapsed, 0.5)
+            ctl.close()
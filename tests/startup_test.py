@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, "svarog_ctl.py")
+
+# Time (seconds) --version and --help may take on top of the interpreter's own startup.
+STARTUP_BUDGET = 0.1
+
+# Modules that must not be imported just to print the version or the help.
+HEAVY = ("numpy", "orbit_predictor", "requests", "dateutil", "yaml", "sgp4")
+
+def run(*args, env=None):
+    return subprocess.run([sys.executable] + list(args), capture_output=True, text=True,
+                          cwd=ROOT, env=env, check=False)
+
+def best_time(*args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def imported_modules(*args):
+    """Returns modules imported by the command and their cumulative import time in
+       microseconds, as reported by python -X importtime."""
+    modules = {}
+    for line in run("-X", "importtime", *args).stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                modules[name.strip()] = int(cumulative)
+    return modules
+
+class StartupTest(unittest.TestCase):
+
+    def test_no_heavy_imports(self):
+        for option in ("--version", "--help"):
+            modules = imported_modules(SCRIPT, option)
+            self.assertIn("svarog_ctl.scheduler", modules)
+            heavy = [m for m in modules if m.split(".")[0] in HEAVY]
+            self.assertEqual(heavy, [], f"{option} imports {heavy}")
+
+    def test_startup_time(self):
+        bare = best_time("-c", "pass")
+        for option in ("--version", "--help"):
+            elapsed = best_time(SCRIPT, option)
+            self.assertLess(elapsed - bare, STARTUP_BUDGET,
+                            f"{option}: {elapsed * 1000:.0f}ms, the interpreter alone "
+                            f"{bare * 1000:.0f}ms")
+
+    def test_no_import_side_effects(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            config_dir = os.path.join(tmp, "config")
+            env = dict(os.environ, SVAROG_CONFIG_DIR=config_dir)
+            result = run("-c", "import logging, svarog_ctl.globalvars, svarog_ctl.configuration;"
+                         "print(logging.getLogger().handlers)", env=env)
+            self.assertEqual(result.returncode, 0, result.stderr)
+            # Nothing is created, printed or configured.
+            self.assertEqual(result.stdout.strip(), "[]")
+            self.assertFalse(os.path.exists(config_dir))
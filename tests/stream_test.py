@@ -0,0 +1,103 @@
+from svarog_ctl import passes, stream, trajectory
+from svarog_ctl.trajectory import RotatorLimits
+from tests.scheduler_test import KRAKSAT, NOAA15
+from orbit_predictor.locations import Location
+from orbit_predictor.sources import get_predictor_from_tle_lines
+from datetime import datetime, timedelta, timezone
+import threading
+import time
+import tracemalloc
+import unittest
+
+DATE = datetime(2021, 7, 14, 0, 0, 0, tzinfo=timezone.utc)
+
+LIMITS = [RotatorLimits(), RotatorLimits(0.0, 450.0), RotatorLimits(0.0, 360.0, el_max=180.0),
+          RotatorLimits(-90.0, 90.0)]
+
+class StreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self._loc = Location('Gdansk', 53.35, 18.53, 120)
+        self._passes = []
+        for sat in (KRAKSAT, NOAA15):
+            pred = get_predictor_from_tle_lines((sat.line1, sat.line2))
+            for p in passes.find_passes(pred, self._loc, DATE, DATE + timedelta(days=1)):
+                self._passes.append((pred, p.aos, p.los))
+
+    def test_iter_pass(self):
+        pred, aos, los = self._passes[0]
+        expected = passes.get_pass(pred, self._loc, aos, los, passes.PassAlgo.TIME_TICKS, 5)
+        actual = list(passes.iter_pass(pred, self._loc, aos, los, 5, chunk=7))
+        self.assertEqual(actual, expected)
+
+        # Every 4th position, the last one is always there.
+        preview = list(passes.iter_pass(pred, self._loc, aos, los, 5, stride=4))
+        self.assertEqual(preview, expected[::4] + ([expected[-1]] if len(expected) % 4 != 1
+                                                   else []))
+
+    def test_same_as_plan(self):
+        """Short passes are streamed exactly as trajectory.plan() plans them in full."""
+        self.assertGreater(len(self._passes), 5)
+        for pred, aos, los in self._passes:
+            positions = passes.get_pass(pred, self._loc, aos, los, passes.PassAlgo.TIME_TICKS, 5)
+            for limits in LIMITS:
+                expected = trajectory.plan(positions, limits, (0.0, 0.0))
+                traj = stream.plan_pass(pred, self._loc, aos, los, limits, current=(0.0, 0.0))
+                self.assertEqual(traj, expected)
+                streamed = list(stream.stream_pass(pred, self._loc, aos, los, limits, traj))
+                self.assertEqual(len(streamed), len(expected.positions))
+                for actual, planned in zip(streamed, expected.positions):
+                    self.assertEqual(actual[0], planned[0])
+                    self.assertAlmostEqual(actual[1], planned[1], places=9)
+                    self.assertAlmostEqual(actual[2], planned[2], places=9)
+
+    def test_long_pass(self):
+        """Planning takes the preview only and streaming doesn't hold the pass in memory."""
+        pred, aos, _ = self._passes[0]
+        los = aos + timedelta(days=1)
+        traj = stream.plan_pass(pred, self._loc, aos, los, RotatorLimits(0.0, 450.0))
+        self.assertLessEqual(len(traj.positions), stream.PREVIEW_POINTS + 2)
+
+        def peak(count):
+            positions = stream.stream_pass(pred, self._loc, aos, los, RotatorLimits(0.0, 450.0),
+                                           traj)
+            tracemalloc.start()
+            for _, pos in zip(range(count), positions):
+                pass
+            usage = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return usage, pos
+
+        short, _ = peak(500)
+        full, last = peak(20000)
+        self.assertEqual(last[0], los)
+        self.assertLess(full, short * 1.5)
+
+    def test_prefetch(self):
+        self.assertEqual(list(stream.prefetch(range(100), ahead=3)), list(range(100)))
+
+        def failing():
+            yield 1
+            raise ValueError("no TLE")
+        with self.assertRaisesRegex(ValueError, "no TLE"):
+            list(stream.prefetch(failing()))
+
+        # Generated in advance, but no more than ahead items.
+        generated = []
+        def counting():
+            for i in range(1000):
+                generated.append(i)
+                yield i
+        items = stream.prefetch(counting(), ahead=5)
+        self.assertEqual(next(items), 0)
+        time.sleep(0.1)
+        self.assertLessEqual(len(generated), 7)
+
+        # Abandoned iteration stops the worker.
+        items.close()
+        for _ in range(20):
+            if not any(t.name == "prefetch" for t in threading.enumerate()):
+                break
+            time.sleep(0.1)
+        self.assertFalse(any(t.name == "prefetch" for t in threading.enumerate()))
+        self.assertLess(len(generated), 10)
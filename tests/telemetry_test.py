@@ -0,0 +1,95 @@
+from svarog_ctl import telemetry, tracking
+from tests.tracking_test import FakeClock, FakeRotator, make_positions
+from datetime import datetime, timedelta, timezone
+import importlib.util
+import numpy as np
+import os
+import tempfile
+import unittest
+
+START = datetime(2021, 7, 14, 18, 48, 0, tzinfo=timezone.utc)
+
+def record(directory, lag=0.0, polls=100):
+    """Records a fake pass: azimuth 0..100 degrees in 100 seconds, the antenna lagging behind
+       by lag seconds."""
+    with telemetry.TelemetryRecorder(directory) as rec:
+        for s in range(0, 101, 10):
+            t = START + timedelta(seconds=s)
+            rec.command(t, t, float(s), 10.0, 0.002, s != 50)
+        for s in np.linspace(0, 100, polls):
+            rec.position(START + timedelta(seconds=s), max(0.0, s - lag), 10.0, 0.001)
+
+class TelemetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._dir.name, "25338-20210714-184800")
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_recorder(self):
+        rec = telemetry.TelemetryRecorder(self._path)
+        count = telemetry.BLOCK_ROWS * 2 + 10
+        for i in range(count):
+            rec.position(START + timedelta(seconds=i), float(i), 10.0, 0.001)
+            # Only a block is kept in memory.
+            self.assertLess(len(rec._positions._buffer), telemetry.BLOCK_ROWS)
+        rec.position(START, None, None, 3.0)
+
+        # Full blocks are readable while recording.
+        data = telemetry.load(self._path)
+        self.assertEqual(len(data.positions), telemetry.BLOCK_ROWS * 2)
+        self.assertEqual(len(data.commands), 0)
+
+        rec.close()
+        data = telemetry.load(self._path)
+        self.assertEqual(len(data.positions), count + 1)
+        self.assertEqual(data.positions.dtype, telemetry.POSITION_DTYPE)
+        self.assertEqual(data.positions['az'][count - 1], count - 1)
+        self.assertEqual(data.positions['time'][1] - data.positions['time'][0], 1.0)
+        self.assertTrue(np.isnan(data.positions['az'][-1]))
+
+    def test_summarize(self):
+        record(self._path)
+        summary = telemetry.summarize(telemetry.load(self._path))
+        self.assertEqual(summary.positions, 100)
+        self.assertLess(summary.max_error, 0.01)
+        self.assertAlmostEqual(summary.mean_lag, 0, delta=0.1)
+        self.assertEqual(summary.commands, 11)
+        self.assertEqual(summary.failed_commands, 1)
+        self.assertAlmostEqual(summary.mean_rtt, 0.002, delta=1e-6)
+
+        lagging = os.path.join(self._dir.name, "lagging")
+        record(lagging, lag=2)
+        start = (START + timedelta(seconds=5)).timestamp()
+        summary = telemetry.summarize(telemetry.load(lagging), start)
+        self.assertEqual(summary.positions, 95)
+        # 2 seconds at 1 deg/s, at elevation of 10 degrees.
+        self.assertAlmostEqual(summary.max_error, 2 * np.cos(np.radians(10)), delta=0.01)
+        self.assertAlmostEqual(summary.rms_error, summary.max_error, delta=0.01)
+        self.assertAlmostEqual(summary.mean_lag, 2, delta=0.11)
+        self.assertIn("lag mean 2.0s", telemetry.format_summary(summary))
+
+    def test_plot_charts(self):
+        record(self._path, lag=2)
+        if importlib.util.find_spec("matplotlib") is None:
+            self.assertIsNone(telemetry.plot_charts(self._path))
+            return
+        chart = telemetry.plot_charts(self._path)
+        self.assertEqual(chart, os.path.join(self._path, telemetry.CHART_FILE))
+        self.assertGreater(os.path.getsize(chart), 0)
+
+    def test_tracking(self):
+        clock = FakeClock()
+        rotator = FakeRotator(clock)
+        positions = make_positions([1, 2, 4])
+        with telemetry.TelemetryRecorder(self._path) as rec:
+            tracking.track(positions, rotator, poll_interval=1, clock=clock.clock,
+                           sleep=clock.sleep, recorder=rec)
+
+        data = telemetry.load(self._path)
+        self.assertEqual(list(data.commands['az']), [0, 1, 2])
+        self.assertTrue(data.commands['ok'].all())
+        np.testing.assert_allclose(data.commands['sent'], data.commands['planned'], atol=0.01)
+        self.assertEqual(len(data.positions), 4)
@@ -1,4 +1,7 @@
-from svarog_ctl.tle import Tle
+from svarog_ctl.tle import Tle, checksum, is_checksum_valid, iter_tles, tles_to_array, array_to_tles
+from datetime import datetime, timezone
+import io
+import numpy as np
 import pytest
 import unittest
 
@@ -6,6 +9,9 @@ NAME='NOAA 15'
 LINE1='1 25338U 98030A   19351.71640046 +.00000015 +00000-0 +24973-4 0  9993'
 LINE2='2 25338 098.7340 012.5392 0011411 075.8229 284.4218 14.25943731122932'
 
+KRAKSAT_LINE1='1 44427U 98067QM  21192.54020985  .00022355  00000-0  19763-3 0  9995'
+KRAKSAT_LINE2='2 44427  51.6376 177.8799 0003618 359.5888  93.1405 15.68562202115256'
+
 class TleTest(unittest.TestCase):
 
     def test_tle_bad_init(self):
@@ -52,3 +58,80 @@ class TleTest(unittest.TestCase):
 
         self.assertEqual(x.get_id(), 25338)
         self.assertEqual(x.get_name(), "NOAA 15")
+
+    def test_tle_elements(self):
+        x = Tle(LINE1, LINE2, NAME)
+
+        self.assertEqual(x.epoch, datetime(2019, 12, 17, 17, 11, 36, 999744, tzinfo=timezone.utc))
+        self.assertAlmostEqual(x.inclination, 98.7340)
+        self.assertAlmostEqual(x.raan, 12.5392)
+        self.assertAlmostEqual(x.eccentricity, 0.0011411)
+        self.assertAlmostEqual(x.arg_perigee, 75.8229)
+        self.assertAlmostEqual(x.mean_anomaly, 284.4218)
+        self.assertAlmostEqual(x.mean_motion, 14.25943731)
+        self.assertAlmostEqual(x.bstar, 0.24973e-4)
+        self.assertEqual(x.element_number, 999)
+
+        # Negative B* and epoch from 20th century
+        y = Tle("1 00005U 58002B   00179.78495062  .00000023  00000-0 -28098-4 0  4753",
+                "2 00005  34.2682 348.7242 1859667 331.7664  19.3264 10.82419157413667")
+        self.assertEqual(y.epoch.year, 2000)
+        self.assertAlmostEqual(y.bstar, -0.28098e-4)
+        self.assertAlmostEqual(y.eccentricity, 0.1859667)
+
+        # TLE objects should be small, there may be tens of thousands of them.
+        self.assertFalse(hasattr(x, "__dict__"))
+
+    def test_tle_array(self):
+        tles = [Tle(LINE1, LINE2, NAME), Tle(KRAKSAT_LINE1, KRAKSAT_LINE2, "KRAKSAT")]
+
+        arr = tles_to_array(tles)
+        self.assertEqual(len(arr), 2)
+        self.assertEqual(list(arr['norad']), [25338, 44427])
+        self.assertEqual(list(arr['name']), [b"NOAA 15", b"KRAKSAT"])
+        self.assertEqual(arr['epoch'][0], np.datetime64("2019-12-17T17:11:36.999744"))
+        self.assertEqual(list(arr[arr['inclination'] > 90.0]['norad']), [25338])
+        self.assertNotIn('line1', arr.dtype.names)
+
+        # With lines included, the array can be turned back into identical TLEs.
+        copy = array_to_tles(tles_to_array(tles, lines=True))
+        for orig, t in zip(tles, copy):
+            for field in Tle.__slots__:
+                self.assertEqual(getattr(orig, field), getattr(t, field))
+
+    def test_checksum(self):
+        self.assertEqual(checksum(LINE1), 3)
+        self.assertEqual(checksum(LINE2), 2)
+        self.assertEqual(checksum(KRAKSAT_LINE1), 5) # minus signs count as 1
+        self.assertTrue(is_checksum_valid(LINE1))
+        self.assertTrue(is_checksum_valid(KRAKSAT_LINE2))
+        self.assertFalse(is_checksum_valid(LINE1[:68] + "4"))
+        self.assertFalse(is_checksum_valid(LINE1[:60]))
+
+    def test_iter_tles(self):
+        """Checks that 2-line and 3-line entries can be mixed and that garbage in between
+           affects only the damaged entries."""
+        text = "\n".join([
+            NAME, LINE1, LINE2,
+            "",                            # blank line
+            KRAKSAT_LINE1, KRAKSAT_LINE2,  # 2-line entry, no name
+            "0 BROKEN",                    # 3LE-style name, line 2 is missing
+            LINE1,
+            "DAMAGED",                     # bad checksum
+            LINE1, LINE2[:68] + "0",
+            "0 KRAKSAT",
+            KRAKSAT_LINE1, KRAKSAT_LINE2,
+            LINE2                          # orphaned line 2
+        ]) + "\n"
+
+        errors = []
+        tles = list(iter_tles(io.StringIO(text), on_error=lambda n, msg: errors.append(n)))
+
+        self.assertEqual([t.name for t in tles], [NAME, "", "KRAKSAT"])
+        self.assertEqual([t.norad for t in tles], [25338, 44427, 44427])
+        self.assertEqual(tles[1].line2, KRAKSAT_LINE2)
+        self.assertEqual(errors, [8, 10, 15])
+
+        # Without validation, the entry with bad checksum is accepted.
+        tles = list(iter_tles(text.splitlines(), validate=False, on_error=lambda n, msg: None))
+        self.assertEqual([t.name for t in tles], [NAME, "", "DAMAGED", "KRAKSAT"])
@@ -0,0 +1,249 @@
+from svarog_ctl import telemetry, tracking
+from svarog_ctl.rotctld import Rotctld
+from svarog_ctl.simulator import Simulator
+from svarog_ctl.trajectory import RotatorLimits
+from datetime import datetime, timedelta, timezone
+import math
+import tempfile
+import unittest
+
+class FakeClock:
+    """Monotonic clock that only moves when slept on."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class FakeRotator:
+    """Records commands and polls, with the fake clock's timestamps."""
+
+    def __init__(self, clock, poll_duration=0.0):
+        self._clock = clock
+        self.poll_duration = poll_duration
+        self.calls = []
+
+    def set_pos(self, az, el):
+        self.calls.append(("P", self._clock.now, az, el))
+        return True, "RPRT 0"
+
+    def get_pos(self):
+        self.calls.append(("p", self._clock.now))
+        self._clock.now += self.poll_duration
+        return 1.0, 2.0
+
+def make_positions(offsets):
+    now = datetime.now(timezone.utc)
+    return [[now + timedelta(seconds=s), float(i), 10.0] for i, s in enumerate(offsets)]
+
+class TrackingTest(unittest.TestCase):
+
+    def test_deadlines(self):
+        clock = FakeClock()
+        rotator = FakeRotator(clock)
+        positions = make_positions([1, 2.5, 7, 7.5])
+        result = tracking.track(positions, rotator, poll_interval=3, clock=clock.clock,
+                                sleep=clock.sleep)
+
+        # All commands are sent, including the last one, exactly on time.
+        sent = [c for c in rotator.calls if c[0] == "P"]
+        self.assertEqual([c[2] for c in sent], [0, 1, 2, 3])
+        for call, offset in zip(sent, [1, 2.5, 7, 7.5]):
+            self.assertAlmostEqual(call[1] - 1000, offset, delta=0.01)
+
+        # Polls on their own cadence.
+        polls = [c[1] - 1000 for c in rotator.calls if c[0] == "p"]
+        self.assertEqual(polls, [0, 3, 6])
+        self.assertEqual(len(result.actual), 3)
+        self.assertEqual(result.actual[0][1:], [1.0, 2.0])
+
+        self.assertEqual(result.skipped, 0)
+        self.assertEqual(result.timing().count, 4)
+        self.assertLess(result.timing().max, 0.01)
+
+    def test_past_commands(self):
+        clock = FakeClock()
+        rotator = FakeRotator(clock)
+        positions = make_positions([-10, -5, -1, 1])
+        result = tracking.track(positions, rotator, poll_interval=None, clock=clock.clock,
+                                sleep=clock.sleep)
+
+        # Only the latest of the past commands is sent, right away.
+        self.assertEqual([c[2] for c in rotator.calls], [2, 3])
+        self.assertEqual(result.skipped, 2)
+        self.assertAlmostEqual(result.commands[0].lateness, 1, delta=0.01)
+        self.assertEqual(result.actual, [])
+
+    def test_generator(self):
+        """Commands can be generated as the tracking goes."""
+        clock = FakeClock()
+        rotator = FakeRotator(clock)
+        positions = (p for p in make_positions([-5, -1, 1, 2.5]))
+        result = tracking.track(positions, rotator, poll_interval=None, clock=clock.clock,
+                                sleep=clock.sleep)
+
+        self.assertEqual([c[2] for c in rotator.calls], [1, 2, 3])
+        self.assertEqual(result.skipped, 1)
+        self.assertAlmostEqual(rotator.calls[-1][1] - 1000, 2.5, delta=0.01)
+
+    def test_slow_poll(self):
+        """Poll that wouldn't finish before the next command waits till after it."""
+        clock = FakeClock()
+        rotator = FakeRotator(clock, poll_duration=0.5)
+        positions = make_positions([3.2, 6.8])
+        result = tracking.track(positions, rotator, poll_interval=3, clock=clock.clock,
+                                sleep=clock.sleep)
+
+        calls = [(c[0], round(c[1] - 1000, 1)) for c in rotator.calls]
+        self.assertEqual(calls, [("p", 0), ("P", 3.2), ("p", 3.2), ("p", 6.0), ("P", 6.8)])
+        self.assertLess(result.timing().max, 0.01)
+
+    def test_simulator(self):
+        """Real clock, real connection: commands land within milliseconds of their time."""
+        with Simulator(port=0, az_rate=None, el_rate=None) as sim:
+            ctl = Rotctld("127.0.0.1", sim.port)
+            ctl.connect()
+            positions = make_positions([0.1 + 0.05 * i for i in range(10)])
+            result = tracking.track(positions, ctl, poll_interval=0.07)
+            ctl.close()
+
+        self.assertEqual(len(result.commands), 10)
+        self.assertTrue(all(c.ok for c in result.commands))
+        self.assertLess(result.timing().max, 0.02)
+        self.assertGreaterEqual(len(result.actual), 5)
+        self.assertEqual(sim.target(), (9.0, 10.0))
+
+class TimingAccumulatorTest(unittest.TestCase):
+
+    def test_stats(self):
+        acc = tracking.TimingAccumulator()
+        self.assertEqual(acc.stats(), tracking.TimingStats(0, 0.0, 0.0, 0.0))
+        for i in range(100):
+            acc.add(i / 1000)
+        self.assertEqual(acc.stats().count, 100)
+        self.assertAlmostEqual(acc.stats().mean, 0.0495)
+        self.assertEqual(acc.stats().p95, 0.094)
+        self.assertEqual(acc.stats().max, 0.099)
+
+    def test_bounded(self):
+        acc = tracking.TimingAccumulator(size=100)
+        for i in range(10000):
+            acc.add((i % 100) / 1000)
+        acc.add(5.0)
+        self.assertEqual(len(acc.sample), 100)
+        stats = acc.stats()
+        self.assertEqual((stats.count, stats.max), (10001, 5.0))
+        # Estimated from the sample.
+        self.assertAlmostEqual(stats.p95, 0.094, delta=0.01)
+
+def make_pass(duration, step, az_end, start_in=0.5):
+    """Pass starting in start_in seconds: azimuth 0..az_end, elevation 10..60..10, a command
+       every step seconds, plus the pre-positioning one."""
+    start = datetime.now(timezone.utc) + timedelta(seconds=start_in)
+    count = round(duration / step)
+    positions = [[start - timedelta(seconds=start_in / 2), 0.0, 10.0]]
+    for i in range(count + 1):
+        f = i / count
+        positions.append([start + timedelta(seconds=i * step), az_end * f,
+                          10 + 50 * math.sin(math.pi * f)])
+    return positions
+
+class ClosedLoopTest(unittest.TestCase):
+
+    def setUp(self):
+        # 1 degree per second, a command every 10 seconds
+        self.positions = [[datetime(2021, 7, 14, 18, 48, 0, tzinfo=timezone.utc) +
+                           timedelta(seconds=s), float(s), 10.0] for s in range(0, 101, 10)]
+        self.t0 = self.positions[0][0]
+
+    def at(self, s):
+        return self.t0 + timedelta(seconds=s)
+
+    def test_lead(self):
+        loop = tracking.ClosedLoop(self.positions)
+        # Aimed half the interval ahead at first.
+        self.assertEqual(loop.lead, 5)
+        self.assertEqual(loop.adjust(self.at(20), 20, 10), (25, 10))
+
+        # The antenna is 3 seconds behind its commands, which are aimed lead seconds ahead.
+        for s in range(21, 80):
+            loop.update(self.at(s), s - 3.0 + loop.lead, 10.0)
+        self.assertAlmostEqual(loop.lags[0], -2, delta=0.06)
+        self.assertAlmostEqual(loop.lag, 3, delta=0.1)
+        # Now it's pointed at the sat.
+        self.assertAlmostEqual(loop.lags[-1], 0, delta=0.06)
+        self.assertAlmostEqual(loop.adjust(self.at(80), 80, 10)[0], 83, delta=0.1)
+        # Up to the step of the lag search.
+        self.assertAlmostEqual(loop.bias[0], 0, delta=0.05)
+
+        # Nothing is learned before and after the pass.
+        lags = len(loop.lags)
+        loop.update(self.at(-5), 0, 10)
+        loop.update(self.at(120), 100, 10)
+        loop.update(self.at(50), None, None)
+        self.assertEqual(len(loop.lags), lags)
+
+    def test_bias(self):
+        loop = tracking.ClosedLoop(self.positions, max_correction=1.5)
+        # The antenna is 0.5 degree below its commands: corrected. 3 degrees: corrected
+        # only up to the limit.
+        for s in range(21, 80):
+            loop.update(self.at(s), s, 10.0 + loop.bias[1] - 0.5)
+        self.assertAlmostEqual(loop.bias[1], 0.5, delta=0.01)
+        for s in range(21, 80):
+            loop.update(self.at(s), s, 10.0 + loop.bias[1] - 3.0)
+        self.assertEqual(loop.bias[1], 1.5)
+
+        # Commands stay within the rotator's limits.
+        loop = tracking.ClosedLoop(self.positions, RotatorLimits(az_min=-180, az_max=100))
+        self.assertEqual(loop.adjust(self.at(100), 100, 10), (100, 10))
+
+    def test_wrap(self):
+        # The rotator swings around between 50 and 60 seconds.
+        for p in self.positions[6:]:
+            p[1] -= 360
+        loop = tracking.ClosedLoop(self.positions, RotatorLimits(az_min=-360, az_max=360))
+        self.assertEqual(loop.adjust(self.at(50), 50, 10), (50, 10))
+        self.assertEqual(loop.adjust(self.at(60), -300, 10), (-295, 10))
+        loop.update(self.at(55), 50, 10)
+        self.assertEqual(loop.lags, [])
+
+    def test_follow(self):
+        """The track is learned from the commands as they're sent."""
+        known = tracking.ClosedLoop(self.positions)
+        loop = tracking.ClosedLoop()
+        sent = []
+        for pos in loop.follow(iter(self.positions)):
+            self.assertEqual(loop.adjust(pos[0], pos[1], pos[2]),
+                             known.adjust(pos[0], pos[1], pos[2]))
+            sent.append(pos)
+            # Only the part around the current command is kept.
+            self.assertLessEqual(len(loop._window), 4)
+        self.assertEqual(sent, self.positions)
+        self.assertEqual(loop.lead, 5)
+
+    def test_simulator(self):
+        """The closed loop points the antenna better, with the same commands."""
+        errors = []
+        for closed in (False, True):
+            with Simulator(port=0, az_rate=30, el_rate=30) as sim, \
+                 tempfile.TemporaryDirectory() as directory:
+                ctl = Rotctld("127.0.0.1", sim.port)
+                ctl.connect()
+                positions = make_pass(4, 0.5, 40)
+                loop = tracking.ClosedLoop(positions) if closed else None
+                with telemetry.TelemetryRecorder(directory) as rec:
+                    result = tracking.track(positions, ctl, 0.05, recorder=rec, loop=loop)
+                ctl.close()
+                summary = telemetry.summarize(telemetry.load(directory),
+                                              positions[1][0].timestamp())
+            self.assertEqual(result.timing().count, len(positions))
+            self.assertEqual((result.commands, result.actual), ([], []))
+            errors.append(summary.rms_error)
+        self.assertLess(errors[1], errors[0] * 0.7)
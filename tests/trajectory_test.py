@@ -0,0 +1,127 @@
+from svarog_ctl import trajectory
+from svarog_ctl.rotctld import Rotctld
+from datetime import datetime, timedelta, timezone
+import unittest
+
+START = datetime(2021, 7, 14, 18, 48, 0, tzinfo=timezone.utc)
+
+def make_positions(azimuths, elevations, step=10):
+    return [[START + timedelta(seconds=i * step), az, el]
+            for i, (az, el) in enumerate(zip(azimuths, elevations))]
+
+# Pass going from west, through north (crossing 0/360), to east.
+NORTH = make_positions([270, 300, 330, 0, 30, 60, 90], [0, 10, 20, 25, 20, 10, 0])
+
+# Pass going from west, through south (crossing 180), to east.
+SOUTH = make_positions([270, 240, 210, 180, 150, 120, 90], [0, 10, 20, 25, 20, 10, 0])
+
+# Almost overhead pass: the azimuth swings by 180 degrees at the culmination.
+ZENITH = make_positions([270, 270, 270, 90, 90, 90], [0, 40, 85, 85, 40, 0], step=30)
+
+class TrajectoryTest(unittest.TestCase):
+
+    def check_continuous(self, traj, limits):
+        """Checks that all points are within the limits and there are no big jumps."""
+        for prev, pos in zip(traj.positions[1:], traj.positions[2:]):
+            self.assertGreaterEqual(pos[1], limits.az_min)
+            self.assertLessEqual(pos[1], limits.az_max)
+            self.assertLessEqual(pos[2], limits.el_max)
+            self.assertLessEqual(abs(pos[1] - prev[1]), 40)
+
+    def assertPositions(self, traj, azimuths, elevations=None):
+        """Compares planned positions (without the pre-position) with expected ones."""
+        for pos, az in zip(traj.positions[1:], azimuths):
+            self.assertAlmostEqual(pos[1], az, places=6)
+        self.assertEqual(len(traj.positions) - 1, len(azimuths))
+        for pos, el in zip(traj.positions[1:], elevations or []):
+            self.assertAlmostEqual(pos[2], el, places=6)
+
+    def test_north_crossing(self):
+        # -180..180 rotator can follow the pass through north without wrapping.
+        limits = trajectory.RotatorLimits()
+        traj = trajectory.plan(NORTH, limits)
+        self.assertEqual(traj.wraps, 0)
+        self.assertPositions(traj, [-90, -60, -30, 0, 30, 60, 90])
+        self.check_continuous(traj, limits)
+
+    def test_south_crossing(self):
+        # ...but not through south.
+        limits = trajectory.RotatorLimits()
+        traj = trajectory.plan(SOUTH, limits)
+        self.assertEqual(traj.wraps, 1)
+        self.assertEqual(len(traj.unreachable), 1)
+
+        # 0..360 rotator can.
+        limits = trajectory.RotatorLimits(0, 360)
+        traj = trajectory.plan(SOUTH, limits)
+        self.assertEqual(traj.wraps, 0)
+        self.assertPositions(traj, [270, 240, 210, 180, 150, 120, 90])
+        self.check_continuous(traj, limits)
+
+        # ...and so can -180..180 rotator with flip, from the other side.
+        limits = trajectory.RotatorLimits(el_max=180)
+        traj = trajectory.plan(SOUTH, limits)
+        self.assertEqual(traj.wraps, 0)
+        self.assertTrue(traj.flipped)
+        self.assertPositions(traj, [90, 60, 30, 0, -30, -60, -90],
+                             [180, 170, 160, 155, 160, 170, 180])
+        self.check_continuous(traj, limits)
+
+    def test_overlap(self):
+        # With 0..450 range, the pass through north fits, if started at 270.
+        limits = trajectory.RotatorLimits(0, 450)
+        traj = trajectory.plan(NORTH, limits)
+        self.assertEqual(traj.wraps, 0)
+        self.assertPositions(traj, [270, 300, 330, 360, 390, 420, 450])
+        self.check_continuous(traj, limits)
+
+        # The pass through south fits in two ways. The one closer to the current position wins.
+        traj = trajectory.plan(SOUTH, limits, current=(440, 0))
+        self.assertAlmostEqual(traj.positions[1][1], 270, places=6)
+        traj = trajectory.plan(make_positions([30, 60, 90], [0, 10, 0]), limits, current=(440, 0))
+        self.assertAlmostEqual(traj.positions[1][1], 390, places=6)
+        traj = trajectory.plan(make_positions([30, 60, 90], [0, 10, 0]), limits, current=(10, 0))
+        self.assertAlmostEqual(traj.positions[1][1], 30, places=6)
+
+    def test_flip_over_the_top(self):
+        # Without flip, the rotator can't turn around quickly enough at the culmination.
+        limits = trajectory.RotatorLimits(az_rate=3, el_rate=3)
+        traj = trajectory.plan(ZENITH, limits)
+        self.assertFalse(traj.flipped)
+        self.assertEqual(traj.unreachable, [ZENITH[3][0]])
+
+        # With flip, it goes over the top instead.
+        limits = trajectory.RotatorLimits(el_max=180, az_rate=3, el_rate=3)
+        traj = trajectory.plan(ZENITH, limits)
+        self.assertTrue(traj.flipped)
+        self.assertEqual(traj.unreachable, [])
+        self.assertPositions(traj, [-90] * 6, [0, 40, 85, 95, 140, 180])
+
+    def test_preposition(self):
+        limits = trajectory.RotatorLimits(az_rate=2, el_rate=2)
+
+        # The rotator is told to move to the starting position in advance.
+        traj = trajectory.plan(NORTH, limits, current=(0, 90))
+        self.assertEqual(traj.positions[0][1:], traj.positions[1][1:])
+        lead = (traj.positions[1][0] - traj.positions[0][0]).total_seconds()
+        self.assertAlmostEqual(lead, 90 / 2 + trajectory.PREPOSITION_MARGIN)
+
+        # If the position is unknown, assume the worst.
+        traj = trajectory.plan(NORTH, limits)
+        lead = (traj.positions[1][0] - traj.positions[0][0]).total_seconds()
+        self.assertAlmostEqual(lead, 360 / 2 + trajectory.PREPOSITION_MARGIN)
+
+    def test_empty(self):
+        self.assertEqual(trajectory.plan([]).positions, [])
+
+    def test_rotctld_norm_az(self):
+        # Azimuth in range is kept as is, even with overlap.
+        r = Rotctld("127.0.0.1", 4533, az_min=0, az_max=450, el_max=180)
+        self.assertEqual(r.norm_az(400), 400)
+        self.assertEqual(r.norm_az(-10), 350)
+        self.assertEqual(r.norm_el(120), 120)
+
+        r = Rotctld("127.0.0.1", 4533)
+        self.assertEqual(r.norm_az(180), 180)
+        self.assertEqual(r.norm_az(190), -170)
+        self.assertEqual(r.norm_el(120), 90)